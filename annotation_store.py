@@ -0,0 +1,189 @@
+import numpy as np
+
+
+UNKNOWN_CLASS = "unknown"
+
+
+class AnnotationArray:
+    """Компактное хранилище рамок на массивах NumPy.
+
+    Колонки: xyxy (пиксельные координаты, float64), class_id (int32) и auto
+    (флаг автоматической разметки). Преобразования YOLO, ограничение
+    границами изображения и сопоставление классов выполняются векторно.
+    """
+
+    __slots__ = ("xyxy", "class_id", "auto")
+
+    def __init__(self, xyxy=None, class_id=None, auto=None):
+        self.xyxy = (
+            np.zeros((0, 4), dtype=np.float64)
+            if xyxy is None
+            else np.asarray(xyxy, dtype=np.float64).reshape(-1, 4)
+        )
+        count = len(self.xyxy)
+        self.class_id = (
+            np.zeros(count, dtype=np.int32)
+            if class_id is None
+            else np.asarray(class_id, dtype=np.int32).reshape(count)
+        )
+        self.auto = (
+            np.zeros(count, dtype=bool)
+            if auto is None
+            else np.broadcast_to(np.asarray(auto, dtype=bool), (count,)).copy()
+        )
+
+    def __len__(self):
+        return len(self.xyxy)
+
+    def select(self, mask):
+        """Возвращает новое хранилище с отобранными строками"""
+        return AnnotationArray(self.xyxy[mask], self.class_id[mask], self.auto[mask])
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls()
+        return cls(
+            np.concatenate([part.xyxy for part in parts]),
+            np.concatenate([part.class_id for part in parts]),
+            np.concatenate([part.auto for part in parts]),
+        )
+
+    # --- Преобразования координат ---
+
+    @classmethod
+    def from_cxcywh(cls, rows, image_width, image_height, class_id, auto=False):
+        """Создаёт хранилище из нормированных YOLO-координат cx, cy, w, h"""
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, 4)
+        half_w = rows[:, 2] / 2
+        half_h = rows[:, 3] / 2
+        xyxy = np.stack(
+            (
+                (rows[:, 0] - half_w) * image_width,
+                (rows[:, 1] - half_h) * image_height,
+                (rows[:, 0] + half_w) * image_width,
+                (rows[:, 1] + half_h) * image_height,
+            ),
+            axis=1,
+        )
+        return cls(xyxy, class_id, auto)
+
+    def to_cxcywh(self, image_width, image_height):
+        """Нормированные YOLO-координаты в виде массива N×4"""
+        x1, y1, x2, y2 = self.xyxy.T
+        return np.stack(
+            (
+                (x1 + x2) / 2 / image_width,
+                (y1 + y2) / 2 / image_height,
+                (x2 - x1) / image_width,
+                (y2 - y1) / image_height,
+            ),
+            axis=1,
+        )
+
+    def clamp(self, image_width, image_height):
+        """Ограничивает рамки границами изображения (как clamp_annotation)"""
+        if not len(self):
+            return
+        xyxy = self.xyxy
+        for lo, hi, limit in ((0, 2, image_width), (1, 3, image_height)):
+            a = np.minimum(xyxy[:, lo], xyxy[:, hi])
+            b = np.maximum(xyxy[:, lo], xyxy[:, hi])
+            a = np.clip(a, 0, limit)
+            b = np.clip(b, 0, limit)
+            flat = a == b
+            at_edge = flat & (a >= limit)
+            inside = flat & ~at_edge
+            a = np.where(at_edge, max(0, limit - 1), a)
+            b = np.where(at_edge, limit, np.where(inside, np.minimum(limit, a + 1), b))
+            xyxy[:, lo] = a
+            xyxy[:, hi] = b
+
+    # --- Классы ---
+
+    def class_names(self, classes):
+        """Имена классов по id; неизвестные id получают имя unknown"""
+        names = np.asarray(list(classes) + [UNKNOWN_CLASS], dtype=object)
+        ids = self.class_id
+        valid = (ids >= 0) & (ids < len(classes))
+        return names[np.where(valid, ids, len(classes))]
+
+    @staticmethod
+    def class_ids_for(names, classes, default=0):
+        """Сопоставляет имена классов их номерам через словарь, а не list.index"""
+        lookup = {name: idx for idx, name in enumerate(classes)}
+        return np.fromiter(
+            (lookup.get(name, default) for name in names), dtype=np.int32, count=len(names)
+        )
+
+    # --- Словари для интерактивного редактирования ---
+
+    @classmethod
+    def from_dicts(cls, annotations, classes):
+        """Собирает хранилище из списка словарей аннотаций"""
+        if not annotations:
+            return cls()
+        xyxy = [(ann['x1'], ann['y1'], ann['x2'], ann['y2']) for ann in annotations]
+        class_id = cls.class_ids_for([ann['class'] for ann in annotations], classes)
+        auto = [bool(ann.get('auto')) for ann in annotations]
+        return cls(xyxy, class_id, auto)
+
+    def to_dicts(self, classes):
+        """Разворачивает хранилище в список словарей для холста"""
+        names = self.class_names(classes)
+        result = []
+        for name, (x1, y1, x2, y2), auto in zip(names, self.xyxy.tolist(), self.auto.tolist()):
+            ann = {'class': name, 'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2}
+            if auto:
+                ann['auto'] = True
+            result.append(ann)
+        return result
+
+    # --- Файлы YOLO ---
+
+    @classmethod
+    def parse_yolo(cls, text, image_width, image_height):
+        """Разбирает содержимое .txt разом; строки не из 5 полей пропускаются"""
+        rows = [parts for parts in (line.split() for line in text.splitlines()) if len(parts) == 5]
+        if not rows:
+            return cls()
+        try:
+            values = np.array(rows, dtype=np.float64)
+        except ValueError:
+            values = np.array([row for row in rows if _is_numeric(row)], dtype=np.float64)
+            if not len(values):
+                return cls()
+        return cls.from_cxcywh(
+            values[:, 1:], image_width, image_height, values[:, 0].astype(np.int32)
+        )
+
+    @classmethod
+    def read_yolo(cls, label_file, image_width, image_height):
+        """Читает файл меток целиком; отсутствующий файл даёт пустой набор"""
+        try:
+            with open(label_file, 'r') as f:
+                text = f.read()
+        except OSError:
+            return cls()
+        return cls.parse_yolo(text, image_width, image_height)
+
+    def to_yolo(self, image_width, image_height):
+        """Сериализует рамки в текст YOLO"""
+        if not len(self):
+            return ""
+        rows = self.to_cxcywh(image_width, image_height)
+        lines = [
+            f"{class_id} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}"
+            for class_id, (cx, cy, w, h) in zip(self.class_id.tolist(), rows.tolist())
+        ]
+        return "\n".join(lines) + "\n"
+
+
+def _is_numeric(parts):
+    try:
+        for value in parts:
+            float(value)
+    except ValueError:
+        return False
+    return True
@@ -0,0 +1,242 @@
+"""Пакетная авторазметка задачи без графического интерфейса.
+
+Пример:
+    python batch_label.py job_1 --model best.pt --conf 0.25 --iou 0.45 --batch 16 --threads 4
+
+Изображения без разметки прогоняются через модель пачками, результаты
+записываются в .txt рядом с изображениями и отмечаются в auto_labels.txt как
+автоматические, а в задачах с annotations.db — сразу в базу. Ручная разметка
+не перезаписывается. Прогресс сохраняется в
+.batch_label_progress, поэтому прерванный запуск продолжается с того же места.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from labeler_core import LabelStore, Task
+
+
+PROGRESS_FILENAME = ".batch_label_progress"
+
+
+class ProgressLog:
+    """Журнал обработанных изображений для продолжения прерванного запуска.
+
+    Первая строка — параметры запуска в JSON, далее по одному имени файла на
+    строку. Если параметры не совпадают, журнал начинается заново.
+    """
+
+    def __init__(self, task_path, params):
+        self.path = Path(task_path) / PROGRESS_FILENAME
+        self.params = params
+        self.done = set()
+        self._file = None
+
+    def open(self):
+        header = json.dumps(self.params, sort_keys=True)
+        if self.path.exists():
+            with open(self.path, 'r', encoding="utf-8") as f:
+                lines = f.read().splitlines()
+            if lines and lines[0] == header:
+                self.done = {line for line in lines[1:] if line}
+                self._file = open(self.path, 'a', encoding="utf-8")
+                return self
+        self._file = open(self.path, 'w', encoding="utf-8")
+        self._file.write(header + "\n")
+        self._file.flush()
+        return self
+
+    def record(self, names):
+        self._file.writelines(f"{name}\n" for name in names)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.done.update(names)
+
+    def finish(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self.path.unlink(missing_ok=True)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def resolve_model(task_path, name=None):
+    """Находит файл модели в каталоге задачи (по умолчанию best.pt или первый .pt)"""
+    if name:
+        path = Path(task_path) / name
+        return path if path.is_file() else None
+    models = sorted(Path(task_path).glob("*.pt"), key=lambda p: p.name.lower())
+    for path in models:
+        if path.name.lower() == "best.pt":
+            return path
+    return models[0] if models else None
+
+
+def pick_device(requested):
+    if requested and requested != "auto":
+        return requested
+    try:
+        import torch
+        return "cuda" if torch.cuda.is_available() else "cpu"
+    except Exception:  # noqa: BLE001
+        return "cpu"
+
+
+def pending_images(task, store, relabel_auto=False):
+    """Изображения без ручной разметки в порядке имён.
+
+    Для задач с annotations.db размеченные изображения берутся из базы, иначе
+    по непустым .txt.
+    """
+    if store.db is not None:
+        labeled = store.db.labeled_stems()
+        auto = store.db.auto_stems() if relabel_auto else set()
+    else:
+        labeled = set()
+        with os.scandir(task.image_path) as it:
+            for entry in it:
+                if entry.name.endswith(".txt") and entry.is_file() and entry.stat().st_size > 0:
+                    labeled.add(entry.name[:-4])
+        auto = store.auto_labels.stems if relabel_auto else set()
+    return [path for path in task.list_images() if path.stem not in labeled or path.stem in auto]
+
+
+def result_detections(result):
+    """(xyxy, номера классов, ширина, высота) из результата ultralytics"""
+    image_height, image_width = result.orig_shape[:2]
+    boxes = getattr(result, "boxes", None)
+    if boxes is None or len(boxes) == 0 or boxes.cls is None:
+        return [], [], image_width, image_height
+    return boxes.xyxy.tolist(), boxes.cls.tolist(), image_width, image_height
+
+
+def run(task_path, model_path, conf=0.25, iou=0.45, batch_size=16, threads=None,
+        device="auto", relabel_auto=False, log=print):
+    """Размечает все неразмеченные изображения задачи, возвращает число обработанных.
+
+    Результаты сохраняются через LabelStore: в annotations.db, если база
+    создана, иначе в .txt рядом с изображениями.
+    """
+    task_path = Path(task_path)
+    task = Task(task_path.parent, task_path.name)
+    classes = task.load_classes()
+    if not classes:
+        raise SystemExit(f"В задаче {task.name} нет classes.txt или он пуст")
+
+    if threads:
+        os.environ.setdefault("OMP_NUM_THREADS", str(threads))
+    try:
+        import torch
+        if threads:
+            torch.set_num_threads(threads)
+    except Exception:  # noqa: BLE001
+        pass
+    from ultralytics import YOLO
+
+    store = LabelStore(task)
+    params = {
+        "model": model_path.name,
+        "model_mtime": model_path.stat().st_mtime_ns,
+        "conf": conf,
+        "iou": iou,
+    }
+    progress = ProgressLog(task_path, params).open()
+    images = [
+        path for path in pending_images(task, store, relabel_auto)
+        if path.name not in progress.done
+    ]
+    total = len(images)
+    if progress.done:
+        log(f"Продолжение: уже обработано {len(progress.done)}, осталось {total}")
+
+    model = YOLO(str(model_path))
+    device = pick_device(device)
+    processed = 0
+    started = time.perf_counter()
+    try:
+        for offset in range(0, total, batch_size):
+            chunk = images[offset:offset + batch_size]
+            results = model.predict(
+                source=[str(path) for path in chunk],
+                conf=conf,
+                iou=iou,
+                device=device,
+                verbose=False,
+            )
+            found = []
+            for path, result in zip(chunk, results):
+                coordinates, class_ids, image_width, image_height = result_detections(result)
+                if any(0 <= class_id < len(classes) for class_id in class_ids):
+                    found.append((path.stem, coordinates, class_ids, image_width, image_height))
+            if store.db is None:
+                # Отметка в реестре делается до записи, чтобы после сбоя файл не
+                # посчитался ручной разметкой
+                store.auto_labels.append(stem for stem, *_ in found)
+            store.apply_detections(found, len(classes))
+            progress.record([path.name for path in chunk])
+            processed += len(chunk)
+            elapsed = time.perf_counter() - started
+            rate = processed / elapsed if elapsed else 0.0
+            log(f"[{processed}/{total}] {rate:.2f} изобр./с")
+    except KeyboardInterrupt:
+        progress.close()
+        log("Остановлено, прогресс сохранён")
+        raise
+    finally:
+        store.close()
+    progress.finish()
+    elapsed = time.perf_counter() - started
+    rate = processed / elapsed if elapsed else 0.0
+    log(f"Готово: {processed} изображений за {elapsed:.1f} с ({rate:.2f} изобр./с)")
+    return processed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная авторазметка задачи")
+    parser.add_argument("task", help="имя задачи в каталоге Tasks")
+    parser.add_argument("--tasks-root", default="Tasks")
+    parser.add_argument("--model", help="файл модели в каталоге задачи (по умолчанию best.pt)")
+    parser.add_argument("--conf", type=float, default=0.25, help="порог уверенности")
+    parser.add_argument("--iou", type=float, default=0.45, help="IoU порог")
+    parser.add_argument("--batch", type=int, default=16, help="размер пачки для predict")
+    parser.add_argument("--threads", type=int, help="число потоков CPU")
+    parser.add_argument("--device", default="auto", help="cpu, cuda, 0, ... (по умолчанию auto)")
+    parser.add_argument(
+        "--relabel-auto",
+        action="store_true",
+        help="переразметить изображения, уже размеченные моделью",
+    )
+    args = parser.parse_args(argv)
+
+    task_path = Path(args.tasks_root) / args.task
+    if not (task_path / "images").is_dir():
+        parser.error(f"не найден каталог {task_path / 'images'}")
+    model_path = resolve_model(task_path, args.model)
+    if model_path is None:
+        parser.error("в каталоге задачи не найдена модель .pt")
+    try:
+        run(
+            task_path,
+            model_path,
+            conf=args.conf,
+            iou=args.iou,
+            batch_size=max(1, args.batch),
+            threads=args.threads,
+            device=args.device,
+            relabel_auto=args.relabel_auto,
+        )
+    except KeyboardInterrupt:
+        return 130
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
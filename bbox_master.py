@@ -1,10 +1,44 @@
 import tkinter as tk
-from tkinter import messagebox
+from tkinter import messagebox, ttk
 from PIL import Image, ImageTk
 from pathlib import Path
 from collections import Counter
-import hashlib
-import shutil
+import os
+import threading
+import time
+
+from annotation_store import AnnotationArray
+from dedup_index import DuplicateIndexer, group_members
+from class_remap import ClassRemapJob, is_identity, make_remap
+from canvas_scene import HANDLE_SIZE, SCENE_TAGS, AnnotationScene, Crosshair, FrameScheduler
+from image_cache import CachedImage, ImageCache, scale_preview
+from image_meta import ImageMetaIndex, MetadataIndexer
+from label_lint import KIND_TITLES, LintRunner
+from label_writer import LabelWriter
+from inference import (
+    BACKEND_ONNX,
+    BACKEND_ONNX_INT8,
+    BACKEND_ULTRALYTICS,
+    DetectionRequest,
+    DetectionResult,
+    InferenceWorker,
+    ModelCache,
+    run_prediction,
+)
+from labeler_core import (
+    LabelStore,
+    Task,
+    Viewport,
+    clamp_box,
+    class_color,
+    detections_to_boxes,
+    export_tasks,
+)
+from perf_trace import Profiler, profiled
+from spatial_index import AnnotationGrid
+from stats_index import StatsIndex
+from tile_pyramid import TilePyramid
+from task_listing import TaskScanner, create_watcher, find_sorted, image_sort_key, insert_sorted
 
 try:
     import torch
@@ -22,22 +56,41 @@ class ImageLabeler:
         self.tasks_root = Path("Tasks")
         self.task_names = [p.name for p in self.tasks_root.iterdir() if p.is_dir()]
         self.current_task = tk.StringVar(value=self.task_names[0] if self.task_names else "")
+        # Папка для переноса размеченных изображений
+        self.result_root = Path(__file__).resolve().parent / "Result"
 
-        # Пути и параметры текущей задачи
-        self.task_path = None
-        self.image_path = None
-        self.classes_file = None
+        # Текущая задача (пути и классы) из ядра разметки
+        self.task = None
 
         # Классы и цвета
         self.classes = []
         self.current_class = tk.StringVar(value="")
         self.class_colors = {}
 
+        # Замеры горячих путей: включаются флажком «Диагностика»
+        self.profiler = Profiler()
+        self.diagnostics_var = tk.BooleanVar(value=False)
+        self.diagnostics_job = None
+        self.diagnostics_refresh_ms = 1000
+        self.trace_root = Path(__file__).resolve().parent / "Traces"
+
         # Натренированные модели и параметры авторазметки
         self.model_files = []
         self.model_path_by_name = {}
         self.model_var = tk.StringVar(value="")
-        self.loaded_models = {}
+        # Загруженные модели: не более max_models, с фоновым прогревом выбранной
+        self.model_cache = ModelCache(max_models=2)
+        self.preload_models = True
+        self.warmup_request = None
+        # Бэкенд инференса выбирается отдельно для каждой модели
+        self.backend_labels = {
+            BACKEND_ULTRALYTICS: "ultralytics (PyTorch)",
+            BACKEND_ONNX: "ONNX Runtime (CPU)",
+            BACKEND_ONNX_INT8: "ONNX Runtime int8 (CPU)",
+        }
+        self.model_backends = {}
+        self.backend_var = tk.StringVar(value=self.backend_labels[BACKEND_ULTRALYTICS])
+        self.backend_var.trace_add("write", self.on_backend_change)
         self.confidence_var = tk.DoubleVar(value=0.25)
         self.iou_var = tk.DoubleVar(value=0.45)
         self.device_info_var = tk.StringVar(
@@ -49,6 +102,18 @@ class ImageLabeler:
         self.current_device = None
         self.auto_detect_var = tk.BooleanVar(value=False)
         self.auto_detect_check = None
+        # Поиск по фрагментам для очень больших изображений
+        self.tiled_detect_var = tk.BooleanVar(value=False)
+        self.tiled_detect_check = None
+        self.tiling_options = {"tile_size": 640, "overlap": 0.2, "batch_size": 8}
+        # Фоновый поиск объектов: очередь запросов и спекулятивный прогон следующих кадров
+        self.detection_status_var = tk.StringVar(value="")
+        self.speculation_depth = 2
+        self.speculation_lookahead = 20
+        self.detection_poll_ms = 50
+        self.inference = InferenceWorker(
+            self.model_cache, predict=self.profiler.wrap("inference", run_prediction)
+        )
         self.model_var.trace_add("write", self.on_model_change)
 
         # Список изображений
@@ -57,11 +122,47 @@ class ImageLabeler:
         self.current_image_index = 0
         self.current_image = None
         self.image_tk = None
+        # Каталог читается в фоне порциями, затем за ним следит наблюдатель
+        self.task_scanner = None
+        self.image_watcher = None
+        self.image_names = set()
+        self.image_stems = Counter()
+        self.pending_stat_stems = set()
+        self.listing_streams = False
+        self.listing_poll_ms = 30
+        # Группы похожих кадров (соседние кадры видео) по перцептивному хэшу
+        self.duplicate_indexer = None
+        self.duplicate_leaders = {}
+        self.duplicate_groups = {}
+        self.duplicate_radius = 6
+        self.skip_duplicates_var = tk.BooleanVar(value=False)
+        self.duplicate_status_var = tk.StringVar(value="")
+        # Проверка файлов разметки задачи в фоне; в списке — файлы с замечаниями
+        self.lint_runner = None
+        self.lint_poll_job = None
+        self.lint_poll_ms = 100
+        self.lint_list_limit = 1000
+        self.lint_names = []
+        self.lint_fix_var = tk.BooleanVar(value=False)
+        self.lint_status_var = tk.StringVar(value="")
+        # Фоновая предзагрузка соседних изображений в LRU-кэш
+        self.prefetch_radius = 2
+        self.image_cache = ImageCache(capacity=4 * self.prefetch_radius + 2)
+        # Отложенная перерисовка в высоком качестве после изменения размера окна
+        self.resize_debounce_ms = 150
+        self.resize_job = None
         self.image_width = 0
         self.image_height = 0
-        self.scale = 1
-        self.offset_x = 0
-        self.offset_y = 0
+        # Масштаб и смещение изображения на холсте
+        self.viewport = Viewport()
+        # Увеличение относительно вписанного в холст изображения; при zoom > 1
+        # видимая область собирается из тайлов пирамиды текущего изображения
+        self.zoom = 1.0
+        self.zoom_step = 1.25
+        self.max_scale = 16
+        self.pyramid = None
+        self.tile_items = {}
+        self.pan_anchor = None
 
         # Переменные для разметки
         self.start_x = None
@@ -73,6 +174,25 @@ class ImageLabeler:
         self.resize_corner = None
         self.action_moved = False
         self.pending_class_change = None
+        # Разметка сохраняется только после изменений, запись идёт в фоне
+        self.annotations_dirty = False
+        self.label_writer = LabelWriter()
+        self.label_poll_ms = 100
+        # Пространственный индекс рамок для поиска под курсором
+        self.spatial_index = AnnotationGrid()
+
+        # Фоновый перенос размеченных изображений в Result
+        self.export_thread = None
+        # Фоновая перенумерация классов в разметке после правки списка классов
+        self.remap_thread = None
+
+        # Индекс статистики текущей задачи
+        self.stats_index = None
+        # Размеры и ориентация EXIF изображений из заголовков, заполняется в фоне
+        self.image_meta = None
+        self.meta_indexer = None
+        # Разметка задачи: база SQLite (если создана), иначе файлы .txt и auto_labels.txt
+        self.labels = None
 
         # Создание интерфейса
         self.create_widgets()
@@ -81,6 +201,11 @@ class ImageLabeler:
         self.root.bind_all("<Left>", lambda e: self.prev_image())
         self.root.bind_all("<Right>", lambda e: self.next_image())
         self.root.bind_all("<Button-2>", self.export_labeled_images)
+        self.root.bind_all("<Control-Key-0>", lambda e: self.reset_zoom())
+
+        self.detection_poll_job = self.root.after(self.detection_poll_ms, self.poll_detection_results)
+        self.listing_poll_job = self.root.after(self.listing_poll_ms, self.poll_task_listing)
+        self.label_poll_job = self.root.after(self.label_poll_ms, self.poll_label_writes)
 
         # Если есть задачи, загружаем первую
         if self.task_names:
@@ -88,20 +213,17 @@ class ImageLabeler:
         else:
             self.update_stats()
 
-    def load_classes(self):
-        """Загружает классы из файла classes.txt"""
-        if self.classes_file.exists():
-            with open(self.classes_file, 'r') as f:
-                return [line.strip() for line in f if line.strip()]
-        return []
-
-    def generate_color(self, name):
-        """Генерирует детерминированный цвет для класса"""
-        h = hashlib.md5(name.encode()).hexdigest()
-        r = int(h[0:2], 16)
-        g = int(h[2:4], 16)
-        b = int(h[4:6], 16)
-        return f"#{r:02x}{g:02x}{b:02x}"
+    @property
+    def task_path(self):
+        return self.task.task_path if self.task else None
+
+    @property
+    def image_path(self):
+        return self.task.image_path if self.task else None
+
+    @property
+    def classes_file(self):
+        return self.task.classes_file if self.task else None
 
     def update_model_list(self):
         """Обновляет список доступных моделей .pt для текущей задачи"""
@@ -112,10 +234,7 @@ class ImageLabeler:
             self.model_menu.config(state=tk.DISABLED)
             return
 
-        self.model_files = sorted(
-            (p for p in self.task_path.glob("*.pt") if p.is_file()),
-            key=lambda p: p.name.lower(),
-        )
+        self.model_files = self.task.model_files()
         self.model_path_by_name = {path.name: path for path in self.model_files}
 
         menu = self.model_menu["menu"]
@@ -142,9 +261,17 @@ class ImageLabeler:
         name = self.model_var.get()
         return self.model_path_by_name.get(name)
 
+    def get_selected_backend(self):
+        return self.model_backends.get(self.get_selected_model_path(), BACKEND_ULTRALYTICS)
+
     def determine_device_for_model(self, model_path):
         if not model_path:
             return None, ""
+        if self.get_selected_backend() != BACKEND_ULTRALYTICS:
+            return None, (
+                "ONNX Runtime на CPU: модель экспортируется один раз и кэшируется "
+                "в .onnx_cache; при ошибке экспорта используется ultralytics."
+            )
         if model_path.name.lower() == "best.pt":
             has_gpu = False
             if torch is not None:
@@ -172,8 +299,37 @@ class ImageLabeler:
         self.current_device = device
 
     def on_model_change(self, *args):
+        self.backend_var.set(self.backend_labels[self.get_selected_backend()])
         self.update_device_info()
         self.update_detection_controls_state()
+        self.preload_selected_model()
+
+    def on_backend_change(self, *args):
+        """Запоминает выбранный бэкенд для текущей модели"""
+        model_path = self.get_selected_model_path()
+        if not model_path:
+            return
+        label = self.backend_var.get()
+        backend = next(
+            (key for key, value in self.backend_labels.items() if value == label),
+            BACKEND_ULTRALYTICS,
+        )
+        if self.get_selected_backend() == backend:
+            return
+        self.model_backends[model_path] = backend
+        self.update_device_info()
+        self.preload_selected_model()
+
+    def preload_selected_model(self):
+        """Загружает и прогревает выбранную модель в фоне"""
+        if self.warmup_request is not None:
+            self.warmup_request.cancelled = True
+            self.warmup_request = None
+        model_path = self.get_selected_model_path()
+        if self.preload_models and model_path:
+            self.warmup_request = self.inference.preload(
+                model_path, self.current_device, self.get_selected_backend()
+            )
 
     def update_detection_controls_state(self):
         """Переключает доступность элементов авторазметки"""
@@ -186,25 +342,32 @@ class ImageLabeler:
         self.detect_button.config(state=controls_state)
         if self.auto_detect_check is not None:
             self.auto_detect_check.config(state=controls_state)
+        if self.tiled_detect_check is not None:
+            self.tiled_detect_check.config(state=controls_state)
 
         has_auto = any(ann.get("auto") for ann in self.annotations)
         self.clear_detections_button.config(state=tk.NORMAL if has_auto else tk.DISABLED)
 
         if self.model_files:
             self.model_menu.config(state=tk.NORMAL)
+            self.backend_menu.config(state=tk.NORMAL)
         else:
             self.model_menu.config(state=tk.DISABLED)
+            self.backend_menu.config(state=tk.DISABLED)
 
     def load_task(self, task_name):
         """Загружает задачу: классы и изображения"""
-        self.task_path = self.tasks_root / task_name
-        self.image_path = self.task_path / "images"
-        self.classes_file = self.task_path / "classes.txt"
+        # Незаписанная разметка прошлой задачи должна попасть в её индекс,
+        # пока пути задачи ещё указывают на неё (apply_label_writes сверяет каталог)
+        self.label_writer.flush()
+        self.apply_label_writes()
+
+        self.task = Task(self.tasks_root, task_name)
 
         # Загрузка классов
-        self.classes = self.load_classes()
+        self.classes = self.task.load_classes()
         self.current_class.set(self.classes[0] if self.classes else "")
-        self.class_colors = {cls: self.generate_color(cls) for cls in self.classes}
+        self.class_colors = {cls: class_color(cls) for cls in self.classes}
 
         # Обновление списка классов
         self.classes_var.set(self.classes)
@@ -212,32 +375,355 @@ class ImageLabeler:
             color = self.class_colors.get(cls, "black")
             self.class_listbox.itemconfig(idx, fg=color)
 
-        # Обновление списка доступных моделей
+        # Освобождение моделей прошлой задачи и обновление списка доступных моделей
+        self.model_cache.retain(self.task_path.glob("*.pt"))
         self.update_model_list()
 
-        # Загрузка изображений
-        if self.image_path.is_dir():
-            self.image_files = sorted(
-                (
-                    file
-                    for file in self.image_path.iterdir()
-                    if file.is_file() and file.suffix.lower() in self.supported_extensions
-                ),
-                key=lambda p: p.name.lower(),
-            )
-        else:
-            self.image_files = []
+        # Индекс статистики новой задачи сверяется в фоне вместе с чтением каталога
+        if self.stats_index is not None:
+            self.stats_index.save()
+        self.stats_index = None
+        if self.image_meta is not None:
+            self.image_meta.save()
+        # Кэш читается здесь, до первого load_image: фоновое заполнение лишь дополняет его
+        self.image_meta = ImageMetaIndex(self.task_path).load()
+
+        if self.labels is not None:
+            self.labels.close()
+        self.labels = LabelStore(self.task, self.label_writer)
+        # Отчёт проверки относится к прошлой задаче
+        self.stop_label_lint()
+        self.clear_lint_report()
+
+        self.image_files = []
         self.current_image_index = 0
         self.annotations = []
+        self.annotations_dirty = False
         self.current_image = None
         self.image_tk = None
-        if self.image_files:
-            self.load_image(self.image_files[self.current_image_index])
-        else:
-            self.canvas.delete("all")
-            self.update_stats()
+        self.canvas.delete("all")
+        self.crosshair.forget()
+        self.tile_items = {}
+        self.scene.clear()
+        # Загрузка изображений: первое показывается, как только найдено
+        self.start_listing()
+        self.update_stats()
         self.update_edit_button_state()
         self.update_detection_controls_state()
+        # Разметка могла остаться наполовину перенумерованной после сбоя
+        if ClassRemapJob.pending(self.task_path):
+            self.run_class_remap(ClassRemapJob(self.task_path))
+
+    def start_listing(self, rescan=False):
+        """Запускает фоновое чтение каталога изображений и наблюдение за ним.
+
+        При rescan текущий список остаётся в работе до конца чтения.
+        """
+        self.stop_listing()
+        if not rescan:
+            self.image_files = []
+            self.image_names = set()
+            self.image_stems = Counter()
+            self.duplicate_leaders = {}
+            self.duplicate_groups = {}
+        self.listing_streams = not rescan
+        self.pending_stat_stems = set()
+        task_path, image_path = self.task_path, self.image_path
+
+        def finalize(files):
+            # Сортировка и сверка индекса статистики выполняются в потоке чтения
+            files.sort(key=image_sort_key)
+            stats_index = StatsIndex(task_path, image_path)
+            stats_index.load()
+            stats_index.reconcile(files)
+            stats_index.save()
+            return files, stats_index
+
+        # Наблюдатель запускается раньше чтения, чтобы не пропустить изменения
+        if image_path.is_dir():
+            self.image_watcher = create_watcher(image_path)
+        self.task_scanner = TaskScanner(image_path, self.supported_extensions, finalize)
+
+    def stop_listing(self):
+        if self.task_scanner is not None:
+            self.task_scanner.cancel()
+            self.task_scanner = None
+        if self.duplicate_indexer is not None:
+            self.duplicate_indexer.cancel()
+            self.duplicate_indexer = None
+        if self.meta_indexer is not None:
+            self.meta_indexer.cancel()
+            self.meta_indexer = None
+        if self.image_watcher is not None:
+            self.image_watcher.stop()
+            self.image_watcher = None
+
+    def poll_task_listing(self):
+        """Принимает порции списка изображений и события наблюдателя"""
+        scanner = self.task_scanner
+        if scanner is not None:
+            messages = scanner.drain()
+            done = [payload for kind, payload in messages if kind == "done"]
+            if done:
+                # Каталог прочитан целиком: сразу берётся отсортированный список
+                self.finish_listing(*done[0])
+            elif messages and self.listing_streams:
+                for _, chunk in messages:
+                    self.image_files.extend(chunk)
+                    self.image_names.update(path.name for path in chunk)
+                    self.image_stems.update(path.stem for path in chunk)
+                if self.current_image is None:
+                    self.current_image_index = 0
+                    self.load_image(self.image_files[0])
+                else:
+                    self.update_stats()
+        elif self.image_watcher is not None:
+            events = self.image_watcher.drain()
+            for kind, name in events:
+                if kind == "rescan":
+                    self.start_listing(rescan=True)
+                    break
+                self.apply_listing_event(kind, name)
+            if events:
+                self.update_stats()
+        if self.duplicate_indexer is not None:
+            self.poll_duplicate_index()
+        if self.meta_indexer is not None and self.meta_indexer.finished:
+            self.meta_indexer = None
+            self.update_stats()
+        self.listing_poll_job = self.root.after(self.listing_poll_ms, self.poll_task_listing)
+
+    def finish_listing(self, files, stats_index):
+        """Подменяет список отсортированным, сохраняя позицию на том же изображении"""
+        self.task_scanner = None
+        current = self.image_files[self.current_image_index] if self.image_files else None
+        self.image_files = files
+        self.image_names = {path.name for path in files}
+        self.image_stems = Counter(path.stem for path in files)
+        # Сохранения, сделанные во время чтения, могли не попасть в сверку
+        for stem in self.pending_stat_stems:
+            stats_index.refresh(stem)
+        self.pending_stat_stems = set()
+        self.stats_index = stats_index
+        # Хэши считаются в фоне по полному списку; неизменённые файлы берутся из кэша
+        self.duplicate_indexer = DuplicateIndexer(self.task_path, files, self.duplicate_radius)
+        self.meta_indexer = MetadataIndexer(self.image_meta, files)
+
+        idx = find_sorted(files, current) if current is not None else None
+        if idx is not None:
+            self.current_image_index = idx
+            self.update_stats()
+            self.schedule_speculative_detection()
+        elif files:
+            self.current_image_index = 0
+            self.load_image(files[0])
+        else:
+            self.show_empty_task()
+
+    def apply_listing_event(self, kind, name):
+        """Точечно обновляет список изображений и статистику по событию каталога"""
+        stem, ext = os.path.splitext(name)
+        if ext == ".txt":
+            if self.stats_index is not None and self.image_stems[stem]:
+                self.stats_index.refresh(stem)
+            return
+        if ext.lower() not in self.supported_extensions:
+            return
+        path = self.image_path / name
+        if kind == "add":
+            if name in self.image_names or not path.is_file():
+                return
+            idx = insert_sorted(self.image_files, path)
+            self.image_names.add(name)
+            self.image_stems[stem] += 1
+            if self.stats_index is not None:
+                self.stats_index.refresh(stem)
+            if self.current_image is None:
+                self.current_image_index = idx
+                self.load_image(path)
+            elif idx <= self.current_image_index:
+                self.current_image_index += 1
+            return
+
+        if name not in self.image_names:
+            return
+        idx = find_sorted(self.image_files, path)
+        if idx is None:
+            return
+        del self.image_files[idx]
+        self.image_names.discard(name)
+        self.image_stems[stem] -= 1
+        if not self.image_stems[stem]:
+            del self.image_stems[stem]
+            if self.stats_index is not None:
+                self.stats_index.forget(stem)
+        if idx < self.current_image_index:
+            self.current_image_index -= 1
+        elif idx == self.current_image_index:
+            # Открытое изображение удалено: разметка не сохраняется, открывается соседнее
+            if self.image_files:
+                self.current_image_index = min(idx, len(self.image_files) - 1)
+                self.load_image(self.image_files[self.current_image_index])
+            else:
+                self.show_empty_task()
+
+    def poll_duplicate_index(self):
+        """Показывает ход расчёта хэшей и забирает готовые группы"""
+        indexer = self.duplicate_indexer
+        if not indexer.finished:
+            done, total = indexer.progress()
+            self.duplicate_status_var.set(f"Поиск похожих кадров: {done}/{total}")
+            return
+        self.duplicate_indexer = None
+        self.duplicate_leaders = indexer.leaders
+        self.duplicate_groups = group_members(indexer.leaders)
+        self.update_duplicate_status()
+
+    def update_duplicate_status(self):
+        if self.duplicate_indexer is not None:
+            return
+        if not self.duplicate_leaders:
+            self.duplicate_status_var.set("")
+            return
+        text = f"Групп: {len(self.duplicate_groups)} на {len(self.duplicate_leaders)} кадров"
+        if self.image_files:
+            current = self.image_files[self.current_image_index]
+            members = self.duplicate_groups.get(self.duplicate_leaders.get(current), [])
+            if len(members) > 1:
+                text += f"\nВ группе текущего кадра: {len(members)}"
+        self.duplicate_status_var.set(text)
+
+    def step_image_index(self, step):
+        """Индекс соседнего кадра; при пропуске похожих — соседнего первого кадра группы"""
+        count = len(self.image_files)
+        idx = (self.current_image_index + step) % count
+        if self.skip_duplicates_var.get() and self.duplicate_leaders:
+            for _ in range(count):
+                path = self.image_files[idx]
+                if self.duplicate_leaders.get(path, path) == path:
+                    break
+                idx = (idx + step) % count
+        return idx
+
+    def copy_labels_to_group(self):
+        """Копирует разметку текущего кадра на неразмеченные кадры его группы"""
+        if not self.image_files or not self.annotations:
+            messagebox.showwarning("Нет разметки", "Разметьте текущий кадр перед копированием.")
+            return
+        current = self.image_files[self.current_image_index]
+        members = self.duplicate_groups.get(self.duplicate_leaders.get(current), [])
+        targets = [path for path in members if path != current and not self.is_labeled(path.stem)]
+        if not targets:
+            messagebox.showinfo("Копирование разметки", "В группе нет неразмеченных кадров.")
+            return
+        self.save_annotations()
+        # Координаты YOLO нормированы, поэтому переносятся между кадрами одного размера как есть
+        boxes = AnnotationArray.from_dicts(self.annotations, self.classes)
+        self.labels.save_many(
+            (path.stem, boxes, self.image_width, self.image_height) for path in targets
+        )
+        self.update_stats()
+        messagebox.showinfo("Копирование разметки", f"Разметка скопирована на кадров: {len(targets)}")
+
+    def start_label_lint(self):
+        """Запускает фоновую проверку файлов разметки текущей задачи"""
+        if self.lint_runner is not None or not self.task_names:
+            return
+        if self.labels.db is not None:
+            messagebox.showinfo(
+                "Проверка разметки",
+                "Разметка задачи хранится в annotations.db, проверяются только файлы .txt.",
+            )
+            return
+        # Проверяется то, что уже на диске
+        self.save_annotations()
+        self.label_writer.flush()
+        self.apply_label_writes()
+        self.clear_lint_report()
+        self.lint_runner = LintRunner(self.task_path, len(self.classes), self.lint_fix_var.get())
+        self.lint_status_var.set("Проверка разметки...")
+        self.lint_poll_job = self.root.after(self.lint_poll_ms, self.poll_label_lint)
+
+    def poll_label_lint(self):
+        """Дополняет список файлов с замечаниями по мере проверки"""
+        self.lint_poll_job = None
+        runner = self.lint_runner
+        if runner is None:
+            return
+        for name, issues, fixed in runner.drain():
+            if fixed and self.stats_index is not None:
+                self.stats_index.refresh(name[:-4])
+            if not issues:
+                continue
+            self.lint_names.append(name)
+            if len(self.lint_names) <= self.lint_list_limit:
+                kinds = sorted({KIND_TITLES[kind] for _, kind, _ in issues})
+                self.lint_listbox.insert(tk.END, f"{name[:-4]}: {', '.join(kinds)}")
+        if not runner.finished:
+            done, total = runner.progress()
+            self.lint_status_var.set(f"Проверено: {done}/{total if total is not None else '?'}")
+            self.lint_poll_job = self.root.after(self.lint_poll_ms, self.poll_label_lint)
+            return
+
+        self.lint_runner = None
+        if runner.error is not None:
+            self.lint_status_var.set("")
+            messagebox.showerror("Проверка разметки", f"Не удалось проверить разметку:\n{runner.error}")
+            return
+        report = runner.linter.report
+        text = f"Файлов: {report.files}, с замечаниями: {len(report.issues)}"
+        for kind, count in report.kinds.most_common():
+            text += f"\n{KIND_TITLES[kind]}: {count}"
+        if report.fixed:
+            text += f"\nИсправлено замечаний: {report.fixed}"
+        if len(self.lint_names) > self.lint_list_limit:
+            text += f"\nВ списке первые {self.lint_list_limit} файлов"
+        self.lint_status_var.set(text)
+        if report.fixed:
+            # Открытое изображение перечитывается, если его разметку не меняли
+            if self.image_files and not self.annotations_dirty:
+                self.load_image(self.image_files[self.current_image_index])
+            self.update_stats()
+
+    def on_lint_select(self, event):
+        """Открывает изображение выбранного в отчёте файла разметки"""
+        selection = self.lint_listbox.curselection()
+        if not selection:
+            return
+        stem = self.lint_names[selection[0]][:-4]
+        idx = next((i for i, path in enumerate(self.image_files) if path.stem == stem), None)
+        if idx is None:
+            messagebox.showinfo("Проверка разметки", f"Для {stem}.txt нет изображения в задаче.")
+            return
+        self.save_annotations()
+        self.current_image_index = idx
+        self.load_image(self.image_files[idx])
+
+    def clear_lint_report(self):
+        self.lint_names = []
+        self.lint_listbox.delete(0, tk.END)
+        self.lint_status_var.set("")
+
+    def stop_label_lint(self):
+        if self.lint_runner is not None:
+            self.lint_runner.cancel()
+            self.lint_runner = None
+        if self.lint_poll_job is not None:
+            self.root.after_cancel(self.lint_poll_job)
+            self.lint_poll_job = None
+
+    def show_empty_task(self):
+        self.current_image_index = 0
+        self.annotations = []
+        self.annotations_dirty = False
+        self.current_image = None
+        self.image_tk = None
+        self.canvas.delete("all")
+        self.crosshair.forget()
+        self.tile_items = {}
+        self.scene.clear()
+        self.update_stats()
+        self.schedule_speculative_detection()
 
     def on_task_change(self, value):
         """Обработка смены задачи из выпадающего списка"""
@@ -293,6 +779,51 @@ class ImageLabeler:
             wraplength=180,
         ).pack(pady=10)
 
+        # Похожие кадры: навигация по группам и копирование разметки
+        self.duplicates_frame = tk.LabelFrame(self.left_frame, text="Похожие кадры")
+        self.duplicates_frame.pack(fill=tk.X, pady=5)
+        tk.Checkbutton(
+            self.duplicates_frame,
+            text="Только первые кадры групп",
+            variable=self.skip_duplicates_var,
+            justify=tk.LEFT,
+            wraplength=180,
+        ).pack(fill=tk.X)
+        tk.Button(
+            self.duplicates_frame,
+            text="Копировать разметку в группу",
+            command=self.copy_labels_to_group,
+        ).pack(fill=tk.X, pady=2)
+        tk.Label(
+            self.duplicates_frame,
+            textvariable=self.duplicate_status_var,
+            justify=tk.LEFT,
+            wraplength=180,
+        ).pack(fill=tk.X)
+
+        # Проверка разметки: список файлов с замечаниями, выбор открывает изображение
+        self.lint_frame = tk.LabelFrame(self.left_frame, text="Проверка разметки")
+        self.lint_frame.pack(fill=tk.X, pady=5)
+        tk.Button(
+            self.lint_frame, text="Проверить разметку", command=self.start_label_lint
+        ).pack(fill=tk.X, pady=2)
+        tk.Checkbutton(
+            self.lint_frame,
+            text="Исправлять безопасные ошибки",
+            variable=self.lint_fix_var,
+            justify=tk.LEFT,
+            wraplength=180,
+        ).pack(fill=tk.X)
+        tk.Label(
+            self.lint_frame,
+            textvariable=self.lint_status_var,
+            justify=tk.LEFT,
+            wraplength=180,
+        ).pack(fill=tk.X)
+        self.lint_listbox = tk.Listbox(self.lint_frame, height=6)
+        self.lint_listbox.pack(fill=tk.X, pady=2)
+        self.lint_listbox.bind('<<ListboxSelect>>', self.on_lint_select)
+
         # Центральный фрейм для изображения
         self.center_frame = tk.Frame(self.root)
         self.center_frame.pack(side=tk.LEFT, expand=True, fill=tk.BOTH)
@@ -301,15 +832,24 @@ class ImageLabeler:
         self.canvas = tk.Canvas(self.center_frame, bg="gray")
         self.canvas.pack(expand=True, fill=tk.BOTH)
         self.canvas.bind("<Configure>", self.on_canvas_resize)
+        self.scene = AnnotationScene(self.canvas)
+        self.crosshair = Crosshair(self.canvas)
+        # События указателя применяются не чаще раза за кадр, время кадров — в frames.frame_times
+        self.frames = FrameScheduler(self.root, on_frame=self.record_frame)
 
         # Привязка событий мыши
         self.canvas.bind("<Button-1>", self.start_action)
-        self.canvas.bind("<B1-Motion>", self.draw_or_resize_or_drag)
+        self.canvas.bind("<B1-Motion>", self.on_drag_motion)
         self.canvas.bind("<ButtonRelease-1>", self.end_action)
         self.canvas.bind("<MouseWheel>", self.scroll_image)  # Прокрутка колесиком мыши
+        # Увеличение колесиком с Ctrl и сдвиг увеличенного изображения Ctrl + ЛКМ
+        self.canvas.bind("<Control-MouseWheel>", self.zoom_at)
+        self.canvas.bind("<Control-Button-1>", self.start_pan)
+        self.canvas.bind("<Control-B1-Motion>", lambda e: self.frames.request("pan", self.pan_to, e))
+        self.canvas.bind("<Control-ButtonRelease-1>", self.end_pan)
         self.canvas.bind("<Button-3>", self.delete_box)
-        self.canvas.bind("<Motion>", self.draw_crosshair)
-        self.canvas.bind("<Leave>", lambda e: self.canvas.delete("crosshair"))
+        self.canvas.bind("<Motion>", self.on_pointer_motion)
+        self.canvas.bind("<Leave>", self.on_pointer_leave)
 
         # Правый фрейм для статистики
         self.right_frame = tk.Frame(self.root, width=200)
@@ -318,6 +858,24 @@ class ImageLabeler:
         self.stats_text = tk.Text(self.right_frame, width=30, height=15, state=tk.DISABLED)
         self.stats_text.pack(anchor=tk.W, pady=5)
 
+        # Диагностика: перцентили времени операций и сохранение трассы
+        self.diagnostics_check = tk.Checkbutton(
+            self.right_frame,
+            text="Диагностика",
+            variable=self.diagnostics_var,
+            command=self.toggle_diagnostics,
+        )
+        self.diagnostics_check.pack(anchor=tk.W)
+        self.diagnostics_frame = tk.LabelFrame(self.right_frame, text="Время операций, мс")
+        self.diagnostics_text = tk.Text(self.diagnostics_frame, width=30, height=12, state=tk.DISABLED)
+        self.diagnostics_text.pack(fill=tk.X)
+        tk.Button(
+            self.diagnostics_frame, text="Сохранить трассу", command=self.save_trace
+        ).pack(fill=tk.X, pady=2)
+        tk.Button(
+            self.diagnostics_frame, text="Сбросить", command=self.reset_diagnostics
+        ).pack(fill=tk.X)
+
         # Элементы управления для автоматического поиска объектов
         self.detection_frame = tk.LabelFrame(self.right_frame, text="Авторазметка")
         self.detection_frame.pack(fill=tk.X, pady=10)
@@ -327,6 +885,13 @@ class ImageLabeler:
         self.model_menu.config(state=tk.DISABLED, width=20)
         self.model_menu.pack(fill=tk.X, pady=(0, 5))
 
+        tk.Label(self.detection_frame, text="Бэкенд:").pack(anchor=tk.W)
+        self.backend_menu = tk.OptionMenu(
+            self.detection_frame, self.backend_var, *self.backend_labels.values()
+        )
+        self.backend_menu.config(state=tk.DISABLED, width=20)
+        self.backend_menu.pack(fill=tk.X, pady=(0, 5))
+
         self.device_info_label = tk.Label(
             self.detection_frame,
             textvariable=self.device_info_var,
@@ -385,12 +950,29 @@ class ImageLabeler:
         )
         self.auto_detect_check.pack(fill=tk.X, pady=(0, 5))
 
+        self.tiled_detect_check = tk.Checkbutton(
+            self.detection_frame,
+            text="Поиск по фрагментам (большие изображения)",
+            variable=self.tiled_detect_var,
+            justify=tk.LEFT,
+            wraplength=180,
+            state=tk.DISABLED,
+        )
+        self.tiled_detect_check.pack(fill=tk.X, pady=(0, 5))
+
+        tk.Label(
+            self.detection_frame,
+            textvariable=self.detection_status_var,
+            justify=tk.LEFT,
+            wraplength=180,
+        ).pack(fill=tk.X)
+
         self.update_edit_button_state()
         self.update_detection_controls_state()
 
     def can_edit_classes(self):
         """Проверяет, можно ли редактировать классы"""
-        result_dir = Path(__file__).resolve().parent / "Result"
+        result_dir = self.result_root
         if not result_dir.exists():
             return True
         for cls in self.classes:
@@ -405,6 +987,8 @@ class ImageLabeler:
 
     def edit_classes(self):
         """Открывает окно редактирования классов, если это возможно"""
+        if self.remap_thread is not None:
+            return
         if not self.can_edit_classes():
             messagebox.showwarning(
                 "Недоступно",
@@ -414,230 +998,440 @@ class ImageLabeler:
         self.open_class_editor()
 
     def open_class_editor(self):
-        """Окно для добавления и удаления классов"""
+        """Окно для добавления, удаления и перестановки классов.
+
+        Номера классов в разметке задачи меняются вместе с classes.txt; рамки
+        удалённого класса переносятся в выбранный класс или удаляются.
+        """
         editor = tk.Toplevel(self.root)
         editor.title("Редактирование классов")
 
-        list_var = tk.StringVar(value=self.classes)
-        listbox = tk.Listbox(editor, listvariable=list_var, height=10)
+        old_classes = list(self.classes)
+        classes = list(self.classes)
+        # Удалённый класс -> класс, в который переносятся его рамки
+        merges = {}
+        drop_label = "удалить рамки"
+
+        list_var = tk.StringVar(value=classes)
+        listbox = tk.Listbox(editor, listvariable=list_var, height=10, exportselection=False)
         listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True, padx=5, pady=5)
 
         entry = tk.Entry(editor)
         entry.pack(fill=tk.X, padx=5)
 
+        target_var = tk.StringVar(value=drop_label)
+
+        def refresh(selected=None):
+            list_var.set(classes)
+            target_menu.config(values=[drop_label] + classes)
+            if target_var.get() not in classes:
+                target_var.set(drop_label)
+            if selected is not None:
+                listbox.selection_clear(0, tk.END)
+                listbox.selection_set(selected)
+                listbox.see(selected)
+
         def add_class():
             name = entry.get().strip()
-            if name and name not in self.classes:
-                self.classes.append(name)
-                list_var.set(self.classes)
+            if name and name not in classes:
+                classes.append(name)
+                merges.pop(name, None)
+                refresh()
                 entry.delete(0, tk.END)
 
         def delete_class():
             sel = listbox.curselection()
-            if sel:
-                cls = listbox.get(sel[0])
-                self.classes.remove(cls)
-                list_var.set(self.classes)
+            if not sel:
+                return
+            cls = classes[sel[0]]
+            target = target_var.get()
+            if target == cls:
+                messagebox.showwarning("Удаление класса", "Выберите другой класс для его рамок.", parent=editor)
+                return
+            del classes[sel[0]]
+            if target == drop_label:
+                merges.pop(cls, None)
+            else:
+                merges[cls] = target
+            refresh()
+
+        def move_class(step):
+            sel = listbox.curselection()
+            if not sel:
+                return
+            idx = sel[0]
+            new_idx = idx + step
+            if 0 <= new_idx < len(classes):
+                classes[idx], classes[new_idx] = classes[new_idx], classes[idx]
+                refresh(new_idx)
 
         tk.Button(editor, text="Добавить", command=add_class).pack(padx=5, pady=2)
         tk.Button(editor, text="Удалить", command=delete_class).pack(padx=5, pady=2)
+        tk.Button(editor, text="Выше", command=lambda: move_class(-1)).pack(padx=5, pady=2)
+        tk.Button(editor, text="Ниже", command=lambda: move_class(1)).pack(padx=5, pady=2)
+        tk.Label(editor, text="Рамки удаляемого класса:").pack(padx=5, pady=(5, 0))
+        target_menu = ttk.Combobox(
+            editor, textvariable=target_var, values=[drop_label] + classes, state="readonly"
+        )
+        target_menu.pack(fill=tk.X, padx=5)
 
         def save_and_close():
-            with open(self.classes_file, 'w') as f:
-                for cls in self.classes:
-                    f.write(f"{cls}\n")
-            self.class_colors = {cls: self.generate_color(cls) for cls in self.classes}
-            self.classes_var.set(self.classes)
-            for idx, cls in enumerate(self.classes):
-                color = self.class_colors.get(cls, "black")
-                self.class_listbox.itemconfig(idx, fg=color)
-            self.current_class.set(self.classes[0] if self.classes else "")
-            self.redraw_annotations()
-            self.update_edit_button_state()
+            remap = make_remap(old_classes, classes, merges)
+            if is_identity(remap):
+                # Классы только добавлены в конец: номера в разметке не меняются
+                self.task.save_classes(classes)
+                editor.destroy()
+                self.apply_classes(classes)
+                return
+            merged = [
+                f"{name} → {classes[new]}"
+                for name, new in zip(old_classes, remap)
+                if new is not None and name not in classes
+            ]
+            dropped = [name for name, new in zip(old_classes, remap) if new is None]
+            message = "Номера классов изменятся, разметка всех изображений задачи будет перезаписана."
+            if merged:
+                message += "\nОбъединение: " + ", ".join(merged)
+            if dropped:
+                message += "\nРамки будут удалены: " + ", ".join(dropped)
+            if not messagebox.askyesno("Перенумерация классов", message + "\n\nПродолжить?", parent=editor):
+                return
             editor.destroy()
+            self.run_class_remap(ClassRemapJob(self.task_path, classes, remap))
 
         tk.Button(editor, text="Сохранить", command=save_and_close).pack(padx=5, pady=5)
 
+    def apply_classes(self, classes):
+        """Обновляет список классов и их цвета в главном окне"""
+        self.classes = list(classes)
+        self.class_colors = {cls: class_color(cls) for cls in self.classes}
+        self.classes_var.set(self.classes)
+        for idx, cls in enumerate(self.classes):
+            color = self.class_colors.get(cls, "black")
+            self.class_listbox.itemconfig(idx, fg=color)
+        self.current_class.set(self.classes[0] if self.classes else "")
+        self.redraw_annotations()
+        self.update_edit_button_state()
+
+    def run_class_remap(self, job):
+        """Перенумеровывает классы в разметке задачи в фоне и перезагружает задачу.
+
+        Если в задаче остался журнал прерванной перенумерации, она доводится до конца.
+        """
+        if self.remap_thread is not None:
+            return
+        self.save_annotations()
+        self.label_writer.flush()
+        self.apply_label_writes()
+        # Файлы меняются разом: проверка и наблюдатель каталога до перезагрузки не нужны
+        self.stop_label_lint()
+        self.stop_listing()
+
+        window = tk.Toplevel(self.root)
+        window.title("Перенумерация классов")
+        window.transient(self.root)
+        window.protocol("WM_DELETE_WINDOW", lambda: None)
+        status_var = tk.StringVar(value="Подготовка...")
+        tk.Label(window, textvariable=status_var, width=40).pack(padx=10, pady=(10, 5))
+        progress_bar = ttk.Progressbar(window, length=300, mode="determinate")
+        progress_bar.pack(padx=10, pady=(0, 10))
+        window.grab_set()
+
+        state = {"done": 0, "total": 0, "report": None, "error": None}
+        stage_titles = {"prepare": "Подготовлено файлов", "commit": "Записано файлов"}
+
+        def progress(done, total):
+            state["done"] = done
+            state["total"] = total
+
+        def worker():
+            try:
+                state["report"] = job.run(progress)
+            except Exception as exc:  # noqa: BLE001
+                state["error"] = exc
+
+        def poll():
+            total = state["total"]
+            progress_bar.config(maximum=max(total, 1), value=state["done"])
+            status_var.set(f"{stage_titles[job.stage]}: {state['done']}/{total}")
+            if self.remap_thread.is_alive():
+                self.root.after(100, poll)
+                return
+            self.remap_thread = None
+            window.grab_release()
+            window.destroy()
+            if state["error"] is not None:
+                messagebox.showerror(
+                    "Ошибка перенумерации",
+                    "Перенумерация прервана, она будет продолжена при следующем открытии задачи:\n"
+                    f"{state['error']}",
+                )
+                return
+            report = state["report"]
+            message = (
+                f"Перезаписано файлов разметки: {report.changed}\n"
+                f"Файлов без рамок: {report.emptied}\n"
+                f"Время: {report.seconds:.1f} с"
+            )
+            if report.resumed:
+                message = "Прерванная перенумерация доведена до конца\n" + message
+            messagebox.showinfo("Перенумерация завершена", message)
+            current = self.current_task.get()
+            if current:
+                self.load_task(current)
+
+        self.remap_thread = threading.Thread(target=worker, name="class-remap", daemon=True)
+        self.remap_thread.start()
+        poll()
+
+    @profiled("load_image")
     def load_image(self, image_path):
         """Загружает изображение на холст"""
-        self.current_image = Image.open(image_path)
-        self.image_width, self.image_height = self.current_image.size
+        # Размеры берутся из индекса заголовков, пиксели декодируются только для показа
+        meta = self.image_meta.get(image_path) if self.image_meta is not None else None
+        if meta is not None:
+            self.current_image = CachedImage(image_path, meta.width, meta.height)
+        else:
+            self.current_image = self.image_cache.get(image_path)
+        self.image_width, self.image_height = self.current_image.width, self.current_image.height
+        # Новое изображение всегда открывается вписанным в холст
+        self.zoom = 1.0
+        self.pyramid = None
         self.display_image()
 
-        # Загрузка аннотаций, если они есть
-        annotation_file = self.image_path / f"{image_path.stem}.txt"
-        self.annotations = []
-        if annotation_file.exists() and annotation_file.stat().st_size > 0:
-            with open(annotation_file, 'r') as f:
-                for line in f:
-                    parts = line.strip().split()
-                    if len(parts) == 5:
-                        class_id = int(parts[0])
-                        x_center, y_center, width, height = map(float, parts[1:])
-                        x1 = (x_center - width / 2) * self.image_width
-                        y1 = (y_center - height / 2) * self.image_height
-                        x2 = (x_center + width / 2) * self.image_width
-                        y2 = (y_center + height / 2) * self.image_height
-                        ann = {
-                            'class': self.classes[class_id] if class_id < len(self.classes) else "unknown",
-                            'x1': x1, 'y1': y1, 'x2': x2, 'y2': y2
-                        }
-                        self.clamp_annotation(ann)
-                        self.annotations.append(ann)
+        # Загрузка аннотаций, если они есть (с учётом ещё не записанных на диск)
+        boxes = self.labels.read(image_path.stem, self.image_width, self.image_height)
+        self.annotations = boxes.to_dicts(self.classes)
+        self.annotations_dirty = False
         self.redraw_annotations()
         self.update_stats()
+        self.update_duplicate_status()
         self.update_detection_controls_state()
+        self.prefetch_neighbours()
+        self.schedule_speculative_detection()
 
+    @profiled("display_image")
     def display_image(self):
         """Отображает текущее изображение с учетом размеров холста"""
         self.canvas.delete("all")
+        self.crosshair.forget()
+        self.tile_items = {}
         self.root.update_idletasks()
         canvas_w = self.canvas.winfo_width()
         canvas_h = self.canvas.winfo_height()
         if canvas_w <= 1 or canvas_h <= 1:
             return
-        scale = min(canvas_w / self.image_width, canvas_h / self.image_height)
-        self.scale = scale
-        new_w = int(self.image_width * scale)
-        new_h = int(self.image_height * scale)
-        self.offset_x = (canvas_w - new_w) / 2
-        self.offset_y = (canvas_h - new_h) / 2
-        display_image = self.current_image.resize((new_w, new_h), Image.Resampling.LANCZOS)
+        if self.zoom > 1:
+            if self.viewport.scale > self.fit_scale(canvas_w, canvas_h):
+                self.viewport = self.viewport.clamped(canvas_w, canvas_h)
+                self.render_tiles()
+                return
+            self.zoom = 1.0
+        # Декодирование и масштабирование берутся из кэша предзагрузки
+        self.current_image = self.image_cache.get(self.current_image.path, (canvas_w, canvas_h))
+        display_image = self.current_image.image
+        self.viewport = Viewport.centered(
+            (self.image_width, self.image_height), self.current_image.scale,
+            display_image.size, (canvas_w, canvas_h),
+        )
         self.image_tk = ImageTk.PhotoImage(display_image)
-        self.canvas.create_image(self.offset_x, self.offset_y, image=self.image_tk, anchor=tk.NW, tags="image")
+        self.canvas.create_image(
+            self.viewport.offset_x, self.viewport.offset_y, image=self.image_tk, anchor=tk.NW, tags="image"
+        )
+
+    def prefetch_neighbours(self):
+        """Запускает фоновое декодирование соседних изображений"""
+        if not self.image_files:
+            return
+        canvas_w = self.canvas.winfo_width()
+        canvas_h = self.canvas.winfo_height()
+        if canvas_w <= 1 or canvas_h <= 1:
+            return
+        count = len(self.image_files)
+        neighbours = []
+        for step in range(1, self.prefetch_radius + 1):
+            for idx in (self.current_image_index + step, self.current_image_index - step):
+                path = self.image_files[idx % count]
+                if path not in neighbours and path != self.current_image.path:
+                    neighbours.append(path)
+        self.image_cache.prefetch(neighbours, (canvas_w, canvas_h))
 
     def image_to_canvas(self, x, y):
-        return x * self.scale + self.offset_x, y * self.scale + self.offset_y
+        return self.viewport.image_to_canvas(x, y)
 
     def canvas_to_image(self, x, y):
-        return (x - self.offset_x) / self.scale, (y - self.offset_y) / self.scale
+        return self.viewport.canvas_to_image(x, y)
 
     def clamp_canvas_point(self, x, y):
         """Ограничивает координаты в пределах отображаемого изображения"""
         if not self.current_image:
             return x, y
-        min_x = self.offset_x
-        min_y = self.offset_y
-        max_x = self.offset_x + self.image_width * self.scale
-        max_y = self.offset_y + self.image_height * self.scale
-        x = max(min_x, min(x, max_x))
-        y = max(min_y, min(y, max_y))
-        return x, y
+        return self.viewport.clamp_canvas_point(x, y)
 
     def clamp_annotation(self, ann):
         """Ограничивает координаты рамки границами изображения"""
-        ann['x1'], ann['x2'] = sorted((ann['x1'], ann['x2']))
-        ann['y1'], ann['y2'] = sorted((ann['y1'], ann['y2']))
-        ann['x1'] = max(0, min(ann['x1'], self.image_width))
-        ann['x2'] = max(0, min(ann['x2'], self.image_width))
-        ann['y1'] = max(0, min(ann['y1'], self.image_height))
-        ann['y2'] = max(0, min(ann['y2'], self.image_height))
-        if ann['x1'] == ann['x2']:
-            if ann['x1'] >= self.image_width:
-                ann['x1'] = max(0, self.image_width - 1)
-                ann['x2'] = self.image_width
-            else:
-                ann['x2'] = min(self.image_width, ann['x1'] + 1)
-        if ann['y1'] == ann['y2']:
-            if ann['y1'] >= self.image_height:
-                ann['y1'] = max(0, self.image_height - 1)
-                ann['y2'] = self.image_height
-            else:
-                ann['y2'] = min(self.image_height, ann['y1'] + 1)
+        clamp_box(ann, self.image_width, self.image_height)
 
     def on_canvas_resize(self, event):
+        """Во время изменения размера показывает быстрый превью-масштаб"""
+        if not self.current_image:
+            return
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        if (
+            self.zoom == 1
+            and self.current_image.image is not None
+            and event.width > 1 and event.height > 1
+        ):
+            self.display_preview(event.width, event.height)
+            self.redraw_annotations()
+        self.resize_job = self.root.after(self.resize_debounce_ms, self.finish_canvas_resize)
+
+    def fit_scale(self, canvas_w, canvas_h):
+        return min(canvas_w / self.image_width, canvas_h / self.image_height)
+
+    def render_tiles(self):
+        """Показывает тайлы видимой области; уже созданные элементы холста переиспользуются"""
+        canvas_w = self.canvas.winfo_width()
+        canvas_h = self.canvas.winfo_height()
+        if self.pyramid is None or self.pyramid.path != self.current_image.path:
+            self.pyramid = TilePyramid(self.current_image.path)
+        visible = {}
+        created = False
+        for key, left, top in self.pyramid.visible_tiles(self.viewport, canvas_w, canvas_h):
+            entry = self.tile_items.get(key)
+            if entry is None:
+                photo = ImageTk.PhotoImage(self.pyramid.tile(*key))
+                item = self.canvas.create_image(left, top, image=photo, anchor=tk.NW, tags=("image", "tile"))
+                entry = (item, photo)
+                created = True
+            visible[key] = entry
+        for key, (item, _) in self.tile_items.items():
+            if key not in visible:
+                self.canvas.delete(item)
+        self.tile_items = visible
+        if created:
+            self.canvas.tag_lower("tile")
+
+    def zoom_at(self, event):
+        """Увеличение или уменьшение вокруг курсора (Ctrl + колесо)"""
+        if not self.current_image or self.current_rect or self.selected_rect is not None:
+            return
+        canvas_w = self.canvas.winfo_width()
+        canvas_h = self.canvas.winfo_height()
+        fit = self.fit_scale(canvas_w, canvas_h)
+        factor = self.zoom_step if event.delta > 0 else 1 / self.zoom_step
+        scale = min(max(self.viewport.scale * factor, fit), max(fit, self.max_scale))
+        if scale == self.viewport.scale:
+            return
+        if scale <= fit:
+            self.reset_zoom()
+            return
+        self.frames.discard("pan")
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        self.viewport = self.viewport.zoomed(scale, x, y).clamped(canvas_w, canvas_h)
+        self.zoom = scale / fit
+        # Изображение, вписанное в холст, и тайлы прошлого масштаба больше не нужны
+        self.canvas.delete("image")
+        self.tile_items = {}
+        self.image_tk = None
+        self.render_tiles()
+        self.redraw_annotations()
+
+    def reset_zoom(self):
+        """Возврат к изображению, вписанному в холст (Ctrl+0)"""
+        if not self.current_image or self.zoom == 1:
+            return
+        self.zoom = 1.0
+        self.display_image()
+        self.redraw_annotations()
+
+    def start_pan(self, event):
+        self.frames.flush()
+        self.pan_anchor = (self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+
+    def pan_to(self, event):
+        """Сдвигает увеличенное изображение вместе с рамками, догружая тайлы по краям"""
+        if self.zoom == 1 or self.pan_anchor is None:
+            return
+        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
+        viewport = self.viewport.panned(x - self.pan_anchor[0], y - self.pan_anchor[1]).clamped(
+            self.canvas.winfo_width(), self.canvas.winfo_height()
+        )
+        dx = viewport.offset_x - self.viewport.offset_x
+        dy = viewport.offset_y - self.viewport.offset_y
+        self.pan_anchor = (x, y)
+        if not dx and not dy:
+            return
+        self.viewport = viewport
+        for tag in ("tile", *SCENE_TAGS):
+            self.canvas.move(tag, dx, dy)
+        self.render_tiles()
+
+    def end_pan(self, event):
+        self.frames.flush()
+        self.pan_anchor = None
+
+    def finish_canvas_resize(self):
+        """Перерисовка в высоком качестве после завершения изменения размера"""
+        self.resize_job = None
         if self.current_image:
             self.display_image()
             self.redraw_annotations()
+            self.prefetch_neighbours()
+
+    def display_preview(self, canvas_w, canvas_h):
+        """Масштабирует уже показанное изображение дешёвым фильтром"""
+        scale, preview = scale_preview(self.current_image, (canvas_w, canvas_h))
+        self.viewport = Viewport.centered(
+            (self.image_width, self.image_height), scale, preview.size, (canvas_w, canvas_h)
+        )
+        self.image_tk = ImageTk.PhotoImage(preview)
+        self.canvas.delete("image")
+        item = self.canvas.create_image(
+            self.viewport.offset_x, self.viewport.offset_y, image=self.image_tk, anchor=tk.NW, tags="image"
+        )
+        self.canvas.tag_lower(item)
 
+    @profiled("redraw_annotations")
     def redraw_annotations(self):
         """Перерисовывает все аннотации на холсте"""
-        self.canvas.delete("rectangle", "handle", "text", "text_bg", "center")
-        for i, ann in enumerate(self.annotations):
-            x1, y1 = self.image_to_canvas(ann['x1'], ann['y1'])
-            x2, y2 = self.image_to_canvas(ann['x2'], ann['y2'])
-            color = self.class_colors.get(ann['class'], "red")
-            self.canvas.create_rectangle(
-                x1, y1, x2, y2,
-                outline=color, width=2, tags=("rectangle", f"rect_{i}")
-            )
-            self.canvas.create_rectangle(
-                x2 - 5, y2 - 5, x2 + 5, y2 + 5,
-                fill="blue", tags=("handle", f"handle_{i}_br")
-            )
-            self.canvas.create_rectangle(
-                x1 - 5, y1 - 5, x1 + 5, y1 + 5,
-                fill="blue", tags=("handle", f"handle_{i}_tl")
-            )
-            self.canvas.create_rectangle(
-                x2 - 5, y1 - 5, x2 + 5, y1 + 5,
-                fill="blue", tags=("handle", f"handle_{i}_tr")
-            )
-            self.canvas.create_rectangle(
-                x1 - 5, y2 - 5, x1 + 5, y2 + 5,
-                fill="blue", tags=("handle", f"handle_{i}_bl")
-            )
-            cx = (x1 + x2) / 2
-            cy = (y1 + y2) / 2
-            self.canvas.create_line(
-                cx - 5, cy, cx + 5, cy, fill=color, tags="center"
-            )
-            self.canvas.create_line(
-                cx, cy - 5, cx, cy + 5, fill=color, tags="center"
-            )
-            text_item = self.canvas.create_text(
-                x1 + 4,
-                y1 + 4,
-                text=ann['class'],
-                fill="white",
-                anchor=tk.NW,
-                tags=("text", f"text_{i}"),
-                font=("TkDefaultFont", 10, "bold"),
-            )
-            bbox = self.canvas.bbox(text_item)
-            if bbox:
-                bg_item = self.canvas.create_rectangle(
-                    bbox,
-                    fill="black",
-                    outline="",
-                    tags=("text_bg", f"text_bg_{i}"),
-                )
-                self.canvas.tag_lower(bg_item, text_item)
+        self.spatial_index.rebuild(self.annotations, self.image_width, self.image_height)
+        self.scene.rebuild(self.annotations, self.image_to_canvas, self.class_colors)
+        self.crosshair.lift()
 
     def start_action(self, event):
         """Начало действия: рисование, выбор или перетаскивание"""
+        self.frames.flush()
         x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
 
         self.action_moved = False
         self.pending_class_change = None
 
         # Проверяем маркеры изменения размера
-        items = self.canvas.find_overlapping(x, y, x, y)
-        for item in items:
-            tags = self.canvas.gettags(item)
-            if "handle" in tags:
-                self.selected_rect = int(tags[1].split("_")[1])
-                self.resize_corner = tags[1].split("_")[2]
-                self.start_x, self.start_y = x, y
-                return
-
-        # Проверяем попадание в существующий прямоугольник
         ix, iy = self.canvas_to_image(x, y)
-        for i, ann in enumerate(self.annotations):
-            if ann['x1'] <= ix <= ann['x2'] and ann['y1'] <= iy <= ann['y2']:
-                self.selected_rect = i
-                rect_x1, rect_y1 = self.image_to_canvas(ann['x1'], ann['y1'])
-                self.start_x = x - rect_x1
-                self.start_y = y - rect_y1
-                self.resize_corner = None
-                current = self.current_class.get()
-                if current and ann['class'] != current:
-                    self.pending_class_change = current
-                return
+        handle = self.spatial_index.nearest_handle(ix, iy, HANDLE_SIZE / self.viewport.scale)
+        if handle:
+            self.selected_rect, self.resize_corner = handle
+            self.start_x, self.start_y = x, y
+            return
+
+        # Проверяем попадание в существующий прямоугольник (верхний по оси Z)
+        index = self.spatial_index.topmost(ix, iy)
+        if index is not None:
+            ann = self.annotations[index]
+            self.selected_rect = index
+            rect_x1, rect_y1 = self.image_to_canvas(ann['x1'], ann['y1'])
+            self.start_x = x - rect_x1
+            self.start_y = y - rect_y1
+            self.resize_corner = None
+            current = self.current_class.get()
+            if current and ann['class'] != current:
+                self.pending_class_change = current
+            return
 
         # Клик вне изображения — игнорируем
-        if not (self.offset_x <= x <= self.offset_x + self.image_width * self.scale and
-                self.offset_y <= y <= self.offset_y + self.image_height * self.scale):
+        if not self.viewport.contains(x, y):
             return
 
         # Начало рисования нового прямоугольника
@@ -653,8 +1447,6 @@ class ImageLabeler:
         """Рисование, изменение размера или перетаскивание"""
         if not self.current_image:
             return
-        # Обновляем линии прицела, чтобы они следовали за курсором во время рисования
-        self.draw_crosshair(event)
         x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
         x, y = self.clamp_canvas_point(x, y)
 
@@ -662,6 +1454,7 @@ class ImageLabeler:
             self.canvas.coords(self.current_rect, self.start_x, self.start_y, x, y)
         elif self.selected_rect is not None:
             self.action_moved = True
+            self.annotations_dirty = True
             ann = self.annotations[self.selected_rect]
             if self.resize_corner:  # Изменение размера
                 ix, iy = self.canvas_to_image(x, y)
@@ -674,7 +1467,8 @@ class ImageLabeler:
                 elif self.resize_corner == "bl":
                     ann['x1'], ann['y2'] = ix, iy
                 self.clamp_annotation(ann)
-                self.redraw_annotations()
+                self.spatial_index.update(self.selected_rect, ann)
+                self.scene.update_box(self.selected_rect, ann, self.image_to_canvas)
             else:  # Перетаскивание
                 new_x1 = x - self.start_x
                 new_y1 = y - self.start_y
@@ -689,10 +1483,13 @@ class ImageLabeler:
                 ann['x2'] = ix1 + width
                 ann['y2'] = iy1 + height
                 self.clamp_annotation(ann)
-                self.redraw_annotations()
+                self.spatial_index.update(self.selected_rect, ann)
+                self.scene.update_box(self.selected_rect, ann, self.image_to_canvas)
 
     def end_action(self, event):
         """Завершение действия"""
+        # Последнее положение указателя должно быть применено до завершения
+        self.frames.flush()
         if self.current_rect:
             x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
             x, y = self.clamp_canvas_point(x, y)
@@ -708,7 +1505,9 @@ class ImageLabeler:
                 }
                 self.clamp_annotation(ann)
                 self.annotations.append(ann)
-                self.redraw_annotations()
+                self.annotations_dirty = True
+                self.spatial_index.add(ann)
+                self.scene.add(ann, self.image_to_canvas, self.class_colors)
                 self.update_stats()
             self.canvas.delete(self.current_rect)
             self.current_rect = None
@@ -720,7 +1519,8 @@ class ImageLabeler:
         ):
             ann = self.annotations[self.selected_rect]
             ann['class'] = self.pending_class_change
-            self.redraw_annotations()
+            self.annotations_dirty = True
+            self.scene.restyle(self.selected_rect, ann, self.class_colors)
             self.update_stats()
         self.selected_rect = None
         self.resize_corner = None
@@ -733,24 +1533,34 @@ class ImageLabeler:
         # Конвертируем координаты в систему изображения,
         # чтобы не зависеть от масштабирования и смещения
         ix, iy = self.canvas_to_image(x, y)
-        # Ищем аннотацию, содержащую точку
-        for idx in range(len(self.annotations) - 1, -1, -1):
-            ann = self.annotations[idx]
-            if ann['x1'] <= ix <= ann['x2'] and ann['y1'] <= iy <= ann['y2']:
-                del self.annotations[idx]
-                self.redraw_annotations()
-                self.update_stats()
-                self.update_detection_controls_state()
-                return
+        # Ищем верхнюю аннотацию, содержащую точку
+        idx = self.spatial_index.topmost(ix, iy)
+        if idx is not None:
+            del self.annotations[idx]
+            self.annotations_dirty = True
+            self.redraw_annotations()
+            self.update_stats()
+            self.update_detection_controls_state()
+
+    def on_pointer_motion(self, event):
+        self.frames.request("crosshair", self.draw_crosshair, event)
+
+    def on_drag_motion(self, event):
+        # Линии прицела следуют за курсором и во время рисования
+        self.frames.request("crosshair", self.draw_crosshair, event)
+        self.frames.request("drag", self.draw_or_resize_or_drag, event)
+
+    def on_pointer_leave(self, event):
+        self.frames.discard("crosshair")
+        self.crosshair.hide()
 
     def draw_crosshair(self, event):
         """Отрисовка вспомогательных линий под курсором"""
-        self.canvas.delete("crosshair")
-        x, y = self.canvas.canvasx(event.x), self.canvas.canvasy(event.y)
-        w = self.canvas.winfo_width()
-        h = self.canvas.winfo_height()
-        self.canvas.create_line(0, y, w, y, fill="blue", dash=(2, 2), tags="crosshair")
-        self.canvas.create_line(x, 0, x, h, fill="blue", dash=(2, 2), tags="crosshair")
+        self.crosshair.move(self.canvas.canvasx(event.x), self.canvas.canvasy(event.y))
+
+    def record_frame(self, started_ns, finished_ns):
+        if self.profiler.enabled:
+            self.profiler.record("frame", started_ns, finished_ns)
 
     def on_class_select(self, event):
         """Обработка выбора класса из списка"""
@@ -763,10 +1573,7 @@ class ImageLabeler:
         if not self.image_files:
             return
         self.save_annotations()
-        if event.delta > 0:
-            self.current_image_index = (self.current_image_index - 1) % len(self.image_files)
-        else:
-            self.current_image_index = (self.current_image_index + 1) % len(self.image_files)
+        self.current_image_index = self.step_image_index(-1 if event.delta > 0 else 1)
         self.load_image(self.image_files[self.current_image_index])
         if (
             self.auto_detect_var.get()
@@ -782,36 +1589,53 @@ class ImageLabeler:
         """Переключение на предыдущее изображение"""
         if self.image_files:
             self.save_annotations()
-            self.current_image_index = (self.current_image_index - 1) % len(self.image_files)
+            self.current_image_index = self.step_image_index(-1)
             self.load_image(self.image_files[self.current_image_index])
 
     def next_image(self):
         """Переключение на следующее изображение"""
         if self.image_files:
             self.save_annotations()
-            self.current_image_index = (self.current_image_index + 1) % len(self.image_files)
+            self.current_image_index = self.step_image_index(1)
             self.load_image(self.image_files[self.current_image_index])
 
+    @profiled("save_annotations")
     def save_annotations(self, show_message=False):
-        """Сохранение аннотаций в файл .txt в формате YOLO"""
-        if not self.image_files:
+        """Ставит изменённые аннотации в очередь записи в .txt в формате YOLO"""
+        if not self.image_files or not self.annotations_dirty:
             return
-        annotation_file = self.image_path / f"{self.image_files[self.current_image_index].stem}.txt"
-        if self.annotations:
-            with open(annotation_file, 'w') as f:
-                for ann in self.annotations:
-                    class_id = self.classes.index(ann['class']) if ann['class'] in self.classes else 0
-                    x_center = (ann['x1'] + ann['x2']) / 2 / self.image_width
-                    y_center = (ann['y1'] + ann['y2']) / 2 / self.image_height
-                    width = (ann['x2'] - ann['x1']) / self.image_width
-                    height = (ann['y2'] - ann['y1']) / self.image_height
-                    f.write(f"{class_id} {x_center:.6f} {y_center:.6f} {width:.6f} {height:.6f}\n")
-            if show_message:
-                messagebox.showinfo("Успех", "Аннотации сохранены")
-        elif annotation_file.exists():
-            annotation_file.unlink()
-        self.update_stats()
+        stem = self.image_files[self.current_image_index].stem
+        boxes = AnnotationArray.from_dicts(self.annotations, self.classes)
+        self.labels.write(stem, boxes, self.image_width, self.image_height)
+        self.annotations_dirty = False
+        if self.labels.db is not None:
+            # Файлы .txt учитываются в статистике после записи, база — сразу
+            self.update_stats()
+        elif show_message and self.annotations:
+            messagebox.showinfo("Успех", "Аннотации сохранены")
+
+    def apply_label_writes(self):
+        """Обновляет индекс статистики по записанным на диск файлам разметки"""
+        updated = False
+        for path, error in self.label_writer.poll():
+            if error is not None:
+                messagebox.showerror("Ошибка сохранения", f"Не удалось сохранить {path.name}:\n{error}")
+                continue
+            if path.parent != self.image_path:
+                continue
+            if self.task_scanner is not None:
+                self.pending_stat_stems.add(path.stem)
+            if self.stats_index is not None:
+                self.stats_index.refresh(path.stem)
+            updated = True
+        return updated
+
+    def poll_label_writes(self):
+        if self.apply_label_writes():
+            self.update_stats()
+        self.label_poll_job = self.root.after(self.label_poll_ms, self.poll_label_writes)
 
+    @profiled("update_stats")
     def update_stats(self):
         """Обновляет статистику"""
         if not self.image_path:
@@ -821,30 +1645,20 @@ class ImageLabeler:
             self.stats_text.config(state=tk.DISABLED)
             return
 
-        # Подсчет размеченных изображений (файлы с хотя бы одной записью)
-        labeled_images = sum(
-            1
-            for img in self.image_files
-            if (self.image_path / f"{img.stem}.txt").exists()
-            and (self.image_path / f"{img.stem}.txt").stat().st_size > 0
-        )
+        # Размеченные изображения и классы во всех аннотациях берутся из базы или индекса
+        if self.labels is not None and self.labels.db is not None:
+            labeled_images = self.labels.db.labeled_count
+            all_class_counts = self.labels.db.class_totals(self.classes)
+        elif self.stats_index is not None:
+            labeled_images = self.stats_index.labeled_count
+            all_class_counts = self.stats_index.class_totals(self.classes)
+        else:
+            labeled_images = 0
+            all_class_counts = Counter()
 
         # Подсчет классов в текущем изображении
         class_counts = Counter(ann['class'] for ann in self.annotations)
 
-        # Подсчет классов во всех аннотациях
-        all_class_counts = Counter()
-        for img in self.image_files:
-            ann_file = self.image_path / f"{img.stem}.txt"
-            if ann_file.exists() and ann_file.stat().st_size > 0:
-                with open(ann_file, 'r') as f:
-                    for line in f:
-                        parts = line.strip().split()
-                        if len(parts) == 5:
-                            class_id = int(parts[0])
-                            if class_id < len(self.classes):
-                                all_class_counts[self.classes[class_id]] += 1
-
         # Формирование текста статистики с подсветкой классов
         self.stats_text.config(state=tk.NORMAL)
         self.stats_text.delete("1.0", tk.END)
@@ -854,8 +1668,17 @@ class ImageLabeler:
         )
         self.stats_text.insert(
             tk.END,
-            f"Размеченных изображений: {labeled_images}/{len(self.image_files)}\n\n",
+            f"Размеченных изображений: {labeled_images}/{len(self.image_files)}\n",
         )
+        if self.task_scanner is not None:
+            self.stats_text.insert(tk.END, "Чтение списка изображений...\n")
+        # Рамки на кадрах с поворотом EXIF не совпадут с повёрнутым при обучении изображением
+        if self.image_meta is not None and self.image_meta.rotated:
+            self.stats_text.tag_config("warning", foreground="red")
+            self.stats_text.insert(tk.END, f"С поворотом EXIF: {len(self.image_meta.rotated)}\n", "warning")
+            if self.current_image is not None and self.current_image.path.name in self.image_meta.rotated:
+                self.stats_text.insert(tk.END, "Текущее изображение повёрнуто по EXIF!\n", "warning")
+        self.stats_text.insert(tk.END, "\n")
         self.stats_text.insert(tk.END, "Классы в текущем изображении:\n")
         for cls, count in class_counts.items():
             color = self.class_colors.get(cls, "black")
@@ -872,11 +1695,58 @@ class ImageLabeler:
             self.stats_text.insert(tk.END, f": {count}\n")
         self.stats_text.config(state=tk.DISABLED)
 
+    def toggle_diagnostics(self):
+        """Включает замеры и показывает панель либо выключает их"""
+        self.profiler.enabled = self.diagnostics_var.get()
+        if self.profiler.enabled:
+            self.diagnostics_frame.pack(after=self.diagnostics_check, fill=tk.X, pady=5)
+            self.refresh_diagnostics()
+        else:
+            self.diagnostics_frame.pack_forget()
+            if self.diagnostics_job is not None:
+                self.root.after_cancel(self.diagnostics_job)
+                self.diagnostics_job = None
+
+    def refresh_diagnostics(self):
+        """Перерисовывает перцентили по последним замерам раз в diagnostics_refresh_ms"""
+        self.diagnostics_text.config(state=tk.NORMAL)
+        self.diagnostics_text.delete("1.0", tk.END)
+        rows = self.profiler.summary()
+        if not rows:
+            self.diagnostics_text.insert(tk.END, "Замеров пока нет\n")
+        for name, count, p50, p95, p99, longest in rows:
+            self.diagnostics_text.insert(tk.END, f"{name} ({count})\n")
+            self.diagnostics_text.insert(
+                tk.END, f"  {p50:.1f} / {p95:.1f} / {p99:.1f}, макс {longest:.1f}\n"
+            )
+        self.diagnostics_text.insert(tk.END, "p50 / p95 / p99\n")
+        self.diagnostics_text.config(state=tk.DISABLED)
+        self.diagnostics_job = self.root.after(self.diagnostics_refresh_ms, self.refresh_diagnostics)
+
+    def reset_diagnostics(self):
+        self.profiler.reset()
+        if self.diagnostics_job is not None:
+            self.root.after_cancel(self.diagnostics_job)
+        self.refresh_diagnostics()
+
+    def save_trace(self):
+        """Сохраняет накопленные события в Traces/ в формате Chrome Trace Event"""
+        path = self.trace_root / time.strftime("trace_%Y%m%d_%H%M%S.json")
+        try:
+            self.profiler.dump_chrome_trace(path)
+        except OSError as exc:
+            messagebox.showerror("Ошибка сохранения", f"Не удалось сохранить трассу:\n{exc}")
+            return
+        messagebox.showinfo(
+            "Трасса сохранена",
+            f"{path}\nОткройте файл в chrome://tracing или ui.perfetto.dev",
+        )
+
+    @profiled("detect_objects")
     def detect_objects(self, auto_triggered=False):
-        """Запускает модель для поиска объектов на текущем изображении"""
+        """Ставит поиск объектов на текущем изображении в фоновую очередь"""
         model_path = self.get_selected_model_path()
         self.update_device_info()
-        device_to_use = self.current_device
         if not model_path:
             if not auto_triggered:
                 messagebox.showwarning(
@@ -896,78 +1766,111 @@ class ImageLabeler:
                 )
             return
 
-        try:
-            from ultralytics import YOLO
-        except ImportError:
+        request = self.make_detection_request(
+            self.image_files[self.current_image_index], auto_triggered=auto_triggered
+        )
+        cached = self.inference.cached(request)
+        if cached is not None:
+            self.apply_detection_result(
+                DetectionResult(request, cached.coordinates, cached.class_ids)
+            )
+            return
+        self.inference.submit(request)
+        self.detection_status_var.set("Идёт поиск объектов...")
+
+    def make_detection_request(self, image_file, auto_triggered=False, speculative=False):
+        return DetectionRequest(
+            image_file,
+            self.get_selected_model_path(),
+            float(self.confidence_var.get()),
+            float(self.iou_var.get()),
+            device=self.current_device,
+            auto_triggered=auto_triggered,
+            speculative=speculative,
+            backend=self.get_selected_backend(),
+            tiling=dict(self.tiling_options) if self.tiled_detect_var.get() else None,
+        )
+
+    def schedule_speculative_detection(self):
+        """Отменяет устаревшие запросы и заранее ищет объекты на следующих кадрах"""
+        if not self.image_files:
+            self.inference.cancel_stale([])
+            return
+        current = self.image_files[self.current_image_index]
+        keep = [current]
+        ready = (
+            self.auto_detect_var.get()
+            and self.get_selected_model_path()
+            and self.classes
+            and self.detect_button.cget("state") == tk.NORMAL
+            and self.stats_index is not None
+        )
+        if ready:
+            self.update_device_info()
+            count = len(self.image_files)
+            for step in range(1, min(self.speculation_lookahead, count - 1) + 1):
+                if len(keep) > self.speculation_depth:
+                    break
+                path = self.image_files[(self.current_image_index + step) % count]
+                if self.is_labeled(path.stem):
+                    continue
+                if self.skip_duplicates_var.get() and self.duplicate_leaders.get(path, path) != path:
+                    continue
+                keep.append(path)
+                self.inference.submit(self.make_detection_request(path, speculative=True))
+        self.inference.cancel_stale(keep)
+
+    def is_labeled(self, stem):
+        if self.labels.db is not None:
+            return self.labels.db.is_labeled(stem)
+        queued, text = self.label_writer.pending(self.labels.label_file(stem))
+        if queued:
+            return bool(text)
+        return self.stats_index is not None and stem in self.stats_index.entries
+
+    def poll_detection_results(self):
+        """Забирает готовые результаты из потока авторазметки"""
+        for result in self.inference.poll():
+            self.apply_detection_result(result)
+        self.detection_poll_job = self.root.after(self.detection_poll_ms, self.poll_detection_results)
+
+    def apply_detection_result(self, result):
+        """Применяет результат модели к текущему изображению"""
+        # Не вмешиваемся в рисование или перетаскивание рамки
+        if self.current_rect or self.selected_rect is not None:
+            self.root.after(self.detection_poll_ms, lambda: self.apply_detection_result(result))
+            return
+        request = result.request
+        if not self.image_files or request.image_path != self.image_files[self.current_image_index]:
+            return
+        self.detection_status_var.set("")
+        auto_triggered = request.auto_triggered
+
+        if isinstance(result.error, ImportError):
             messagebox.showerror(
                 "Модель недоступна",
                 "Для автоматического поиска объектов требуется установить пакет ultralytics.",
             )
             return
-
-        model = self.loaded_models.get(model_path)
-        if model is None:
-            try:
-                model = YOLO(str(model_path))
-            except Exception as exc:  # noqa: BLE001
-                messagebox.showerror("Ошибка модели", f"Не удалось загрузить модель:\n{exc}")
-                return
-            self.loaded_models[model_path] = model
-
-        image_file = self.image_files[self.current_image_index]
-        try:
-            predict_kwargs = {
-                "source": str(image_file),
-                "conf": float(self.confidence_var.get()),
-                "iou": float(self.iou_var.get()),
-                "verbose": False,
-            }
-            if device_to_use:
-                predict_kwargs["device"] = device_to_use
-            results = model.predict(**predict_kwargs)
-        except Exception as exc:  # noqa: BLE001
-            messagebox.showerror("Ошибка поиска", f"Не удалось выполнить поиск объектов:\n{exc}")
+        if result.error is not None and result.stage == "load":
+            messagebox.showerror("Ошибка модели", f"Не удалось загрузить модель:\n{result.error}")
             return
-
-        if not results:
-            if not auto_triggered:
-                messagebox.showinfo("Поиск завершён", "Объекты не найдены.")
+        if result.error is not None:
+            messagebox.showerror("Ошибка поиска", f"Не удалось выполнить поиск объектов:\n{result.error}")
+            return
+        # Пока шёл поиск, пользователь успел разметить кадр вручную
+        if auto_triggered and self.annotations:
             return
 
-        result = results[0]
-        boxes = getattr(result, "boxes", None)
-        if boxes is None or len(boxes) == 0:
+        if not result.coordinates:
             if not auto_triggered:
                 messagebox.showinfo("Поиск завершён", "Объекты не найдены.")
             return
 
-        try:
-            coordinates = boxes.xyxy.tolist()
-            class_ids = boxes.cls.tolist() if boxes.cls is not None else []
-        except Exception as exc:  # noqa: BLE001
-            messagebox.showerror("Ошибка обработки", f"Не удалось обработать результат модели:\n{exc}")
-            return
-
-        new_annotations = []
-        for idx, coords in enumerate(coordinates):
-            if len(coords) < 4:
-                continue
-            if idx >= len(class_ids):
-                continue
-            class_id = int(class_ids[idx])
-            if class_id < 0 or class_id >= len(self.classes):
-                continue
-            x1, y1, x2, y2 = coords[:4]
-            ann = {
-                'class': self.classes[class_id],
-                'x1': x1,
-                'y1': y1,
-                'x2': x2,
-                'y2': y2,
-                'auto': True,
-            }
-            self.clamp_annotation(ann)
-            new_annotations.append(ann)
+        detections = detections_to_boxes(
+            result.coordinates, result.class_ids, len(self.classes), self.image_width, self.image_height
+        )
+        new_annotations = detections.to_dicts(self.classes)
 
         if not new_annotations:
             if not auto_triggered:
@@ -976,6 +1879,7 @@ class ImageLabeler:
 
         self.annotations = [ann for ann in self.annotations if not ann.get('auto')]
         self.annotations.extend(new_annotations)
+        self.annotations_dirty = True
         self.redraw_annotations()
         self.update_stats()
         self.update_detection_controls_state()
@@ -987,38 +1891,110 @@ class ImageLabeler:
         original_len = len(self.annotations)
         self.annotations = [ann for ann in self.annotations if not ann.get('auto')]
         if len(self.annotations) != original_len:
+            self.annotations_dirty = True
             self.redraw_annotations()
             self.update_stats()
         self.update_detection_controls_state()
 
+    @profiled("export_labeled_images")
     def export_labeled_images(self, event=None):
         """Создает Result/<название_задачи> и перемещает туда размеченные изображения."""
+        if self.export_thread is not None:
+            return
         self.save_annotations()
-        base_dir = Path(__file__).resolve().parent
-        result_root = base_dir / "Result"
-        result_root.mkdir(parents=True, exist_ok=True)
-        for task_name in self.task_names:
-            src_dir = self.tasks_root / task_name / "images"
-            dst_dir = result_root / task_name
-            dst_dir.mkdir(parents=True, exist_ok=True)
-            for txt_file in src_dir.glob("*.txt"):
-                stem = txt_file.stem
-                image_file = None
-                for ext in self.supported_extensions:
-                    candidate = src_dir / f"{stem}{ext}"
-                    if candidate.exists():
-                        image_file = candidate
-                        break
-                if image_file:
-                    shutil.move(str(image_file), dst_dir / image_file.name)
-                    shutil.move(str(txt_file), dst_dir / txt_file.name)
-        current = self.current_task.get()
-        if current:
-            self.load_task(current)
+        self.label_writer.flush()
+        self.apply_label_writes()
+        # Файлы уходят из images/: наблюдатель не должен открывать переносимые кадры,
+        # чтение каталога перезапускается после переноса вместе с задачей
+        self.stop_listing()
+
+        # Окно прогресса блокирует разметку, пока файлы переносятся
+        window = tk.Toplevel(self.root)
+        window.title("Перенос размеченных изображений")
+        window.transient(self.root)
+        window.protocol("WM_DELETE_WINDOW", lambda: None)
+        status_var = tk.StringVar(value="Подготовка...")
+        tk.Label(window, textvariable=status_var, width=40).pack(padx=10, pady=(10, 5))
+        progress_bar = ttk.Progressbar(window, length=300, mode="determinate")
+        progress_bar.pack(padx=10, pady=(0, 10))
+        window.grab_set()
+
+        state = {"done": 0, "total": 0, "report": None, "error": None}
+
+        def progress(done, total):
+            state["done"] = done
+            state["total"] = total
+
+        def worker():
+            try:
+                state["report"] = self.profiler.wrap("export_run", export_tasks)(
+                    self.tasks_root, self.task_names, self.result_root, self.supported_extensions, progress
+                )
+            except Exception as exc:  # noqa: BLE001
+                state["error"] = exc
+
+        def poll():
+            total = state["total"]
+            progress_bar.config(maximum=max(total, 1), value=state["done"])
+            status_var.set(f"Перенесено: {state['done']}/{total}")
+            if self.export_thread.is_alive():
+                self.root.after(100, poll)
+                return
+            self.export_thread = None
+            window.grab_release()
+            window.destroy()
+            if state["error"] is not None:
+                messagebox.showerror(
+                    "Ошибка переноса",
+                    f"Перенос прерван, он будет продолжен при следующем запуске:\n{state['error']}",
+                )
+            else:
+                report = state["report"]
+                message = (
+                    f"Перенесено пар: {report.pairs}\n"
+                    f"Время: {report.seconds:.1f} с "
+                    f"({report.pairs_per_second:.0f} пар/с, {report.megabytes_per_second:.1f} МБ/с)"
+                )
+                if report.resumed:
+                    message += f"\nДовершено после прошлого сбоя: {report.resumed}"
+                messagebox.showinfo("Перенос завершён", message)
+            current = self.current_task.get()
+            if current:
+                self.load_task(current)
+
+        self.export_thread = threading.Thread(target=worker, name="export", daemon=True)
+        self.export_thread.start()
+        poll()
 
     def on_close(self):
         """Сохранение данных при закрытии окна"""
+        if self.export_thread is not None:
+            messagebox.showwarning("Идёт перенос", "Дождитесь окончания переноса файлов.")
+            return
+        if self.remap_thread is not None:
+            messagebox.showwarning("Идёт перенумерация", "Дождитесь окончания перенумерации классов.")
+            return
         self.save_annotations()
+        self.label_writer.shutdown()
+        self.apply_label_writes()
+        if self.resize_job is not None:
+            self.root.after_cancel(self.resize_job)
+        if self.stats_index is not None:
+            self.stats_index.save()
+        if self.image_meta is not None:
+            self.image_meta.save()
+        if self.labels is not None:
+            self.labels.close()
+        self.image_cache.shutdown()
+        self.stop_listing()
+        self.stop_label_lint()
+        self.root.after_cancel(self.listing_poll_job)
+        self.root.after_cancel(self.label_poll_job)
+        self.root.after_cancel(self.detection_poll_job)
+        if self.diagnostics_job is not None:
+            self.root.after_cancel(self.diagnostics_job)
+        self.frames.cancel()
+        self.inference.shutdown()
         self.root.destroy()
 
 
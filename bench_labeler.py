@@ -0,0 +1,432 @@
+"""Замеры горячих путей окна разметки на синтетических задачах.
+
+Пример:
+    python bench_labeler.py --scales 200,2000,20000 --boxes 10,100,1000 --out bench.json
+
+Для каждого масштаба во временном каталоге создаётся задача (synth_task.py),
+открывается ImageLabeler и замеряются load_task, load_image, display_image,
+redraw_annotations, update_stats, save_annotations, start_action, время кадра
+перетаскивания (drag_frame), увеличения и сдвига (zoom_in, pan_frame) и
+export_labeled_images. По умолчанию Tk заменяется заглушками виджетов, поэтому
+дисплей не нужен (время отрисовки самим Tk при этом не учитывается); с --tk
+используется настоящий Tk (например, под Xvfb) и добавляется замер
+перетаскивания из canvas_scene.benchmark_drag.
+
+Результат — JSON с метаданными запуска и списком замеров (op, scale, boxes,
+runs, mean_ms, p50_ms, p95_ms, min_ms), пригодный для сравнения запусков.
+"""
+
+import argparse
+import gc
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter as tk
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+import bbox_master
+from synth_task import generate_task, parse_resolution
+
+
+def _noop(*args, **kwargs):
+    return None
+
+
+class StubWidget:
+    """Заглушка виджета Tk: запоминает параметры и молча принимает любые вызовы"""
+
+    _next_item = 0
+
+    def __init__(self, *args, **kwargs):
+        self._options = dict(kwargs)
+
+    def config(self, **kwargs):
+        self._options.update(kwargs)
+
+    configure = config
+
+    def cget(self, key):
+        return self._options.get(key, "")
+
+    def __getitem__(self, key):
+        return self._options.setdefault(key, StubWidget())
+
+    def __setitem__(self, key, value):
+        self._options[key] = value
+
+    def _create(self, *args, **kwargs):
+        StubWidget._next_item += 1
+        return StubWidget._next_item
+
+    def curselection(self):
+        return ()
+
+    def canvasx(self, x):
+        return x
+
+    def canvasy(self, y):
+        return y
+
+    def winfo_width(self):
+        return self._options.get("width", 1)
+
+    def winfo_height(self):
+        return self._options.get("height", 1)
+
+    def __getattr__(self, name):
+        if name.startswith("create_"):
+            return self._create
+        return _noop
+
+
+class StubCanvas(StubWidget):
+    size = (1280, 800)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._options["width"], self._options["height"] = self.size
+
+
+class StubRoot:
+    """Корневое окно без дисплея: after() копит вызовы, pump() выполняет их"""
+
+    def __init__(self):
+        self.interp = tk.Tcl()
+        self._callbacks = {}
+        self._next = 0
+
+    def after(self, ms, func=None, *args):
+        self._next += 1
+        key = f"after#{self._next}"
+        self._callbacks[key] = (func, args)
+        return key
+
+    def after_idle(self, func, *args):
+        return self.after(0, func, *args)
+
+    def after_cancel(self, key):
+        self._callbacks.pop(key, None)
+
+    def pump(self):
+        pending, self._callbacks = self._callbacks, {}
+        for func, args in pending.values():
+            func(*args)
+
+    def update(self):
+        self.pump()
+
+    def __getattr__(self, name):
+        return _noop
+
+
+class TkRoot:
+    """Настоящий Tk: pump() обрабатывает очередь событий"""
+
+    def __init__(self):
+        self.root = tk.Tk()
+
+    def pump(self):
+        self.root.update()
+
+
+STUB_WIDGETS = (
+    "Frame", "Label", "Listbox", "Button", "OptionMenu", "Text",
+    "LabelFrame", "Scale", "Checkbutton", "Toplevel", "Entry",
+)
+
+
+@contextmanager
+def labeler(workspace, use_tk=False):
+    """Открывает ImageLabeler в каталоге workspace (с Tasks/ внутри)"""
+    previous_cwd = os.getcwd()
+    os.chdir(workspace)
+    patched = []
+
+    def patch(owner, name, value):
+        patched.append((owner, name, getattr(owner, name)))
+        setattr(owner, name, value)
+
+    try:
+        if use_tk:
+            harness = TkRoot()
+            root = harness.root
+        else:
+            harness = root = StubRoot()
+            patch(tk, "_default_root", root.interp)
+            for name in STUB_WIDGETS:
+                patch(tk, name, StubWidget)
+            patch(tk, "Canvas", StubCanvas)
+            patch(bbox_master, "ttk", SimpleNamespace(Progressbar=StubWidget))
+            patch(bbox_master, "ImageTk", SimpleNamespace(PhotoImage=StubWidget))
+        patch(
+            bbox_master, "messagebox",
+            SimpleNamespace(showinfo=_noop, showwarning=_noop, showerror=_noop),
+        )
+        app = bbox_master.ImageLabeler(root)
+        app.result_root = Path(workspace) / "Result"
+        try:
+            yield app, harness
+        finally:
+            app.on_close()
+            # Переменные Tk должны уничтожаться в главном потоке, пока жив интерпретатор
+            del app
+            gc.collect()
+    finally:
+        for owner, name, value in reversed(patched):
+            setattr(owner, name, value)
+        os.chdir(previous_cwd)
+
+
+def wait_until(harness, predicate, timeout=600):
+    started = time.perf_counter()
+    while not predicate():
+        if time.perf_counter() - started > timeout:
+            raise TimeoutError("превышено время ожидания")
+        harness.pump()
+        time.sleep(0.001)
+
+
+def summarize(op, scale, samples, boxes=None):
+    ordered = sorted(samples)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "op": op,
+        "scale": scale,
+        "boxes": boxes,
+        "runs": len(samples),
+        "mean_ms": round(sum(samples) / len(samples) * 1000, 4),
+        "p50_ms": round(percentile(0.5) * 1000, 4),
+        "p95_ms": round(percentile(0.95) * 1000, 4),
+        "min_ms": round(ordered[0] * 1000, 4),
+    }
+
+
+def timed(func, repeat, setup=None):
+    samples = []
+    for run in range(repeat):
+        if setup is not None:
+            setup(run)
+        started = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def synthetic_annotations(app, count, rng):
+    classes = app.classes or ["class_0"]
+    annotations = []
+    for _ in range(count):
+        w = rng.uniform(0.02, 0.2) * app.image_width
+        h = rng.uniform(0.02, 0.2) * app.image_height
+        x1 = rng.uniform(0, app.image_width - w)
+        y1 = rng.uniform(0, app.image_height - h)
+        annotations.append({
+            'class': rng.choice(classes), 'x1': x1, 'y1': y1, 'x2': x1 + w, 'y2': y1 + h,
+        })
+    return annotations
+
+
+def bench_zoom_pan(app, harness, scale, repeat):
+    """Увеличение до 8x с первой сборкой тайлов и кадры сдвига увеличенного изображения"""
+    canvas_w, canvas_h = app.canvas.winfo_width(), app.canvas.winfo_height()
+    center = SimpleNamespace(x=canvas_w / 2, y=canvas_h / 2, delta=120)
+    zoom_samples = []
+    while app.zoom < 8:
+        started = time.perf_counter()
+        app.zoom_at(center)
+        zoom_samples.append(time.perf_counter() - started)
+    results = [summarize("zoom_in", scale, zoom_samples)]
+
+    app.start_pan(center)
+    app.frames.frame_times.clear()
+    for frame in range(repeat):
+        # Ходим по кругу, чтобы по краям постоянно появлялись новые тайлы
+        angle = frame * 0.5
+        for step in range(4):
+            radius = 20 * (frame + 1)
+            app.frames.request("pan", app.pan_to, SimpleNamespace(
+                x=center.x + radius * math.cos(angle + step * 0.1),
+                y=center.y + radius * math.sin(angle + step * 0.1),
+            ))
+        wait_until(harness, lambda: not app.frames.pending)
+    app.end_pan(center)
+    results.append(summarize("pan_frame", scale, [value / 1000 for value in app.frames.frame_times]))
+    app.reset_zoom()
+    return results
+
+
+def bench_scale(scale, box_counts, repeat, resolution, use_tk):
+    """Все замеры для одной задачи из scale изображений"""
+    results = []
+    rng = random.Random(scale)
+    workspace = Path(tempfile.mkdtemp(prefix="bench_labeler_"))
+    try:
+        generate_task(workspace / "Tasks", "bench", images=scale, resolution=resolution)
+        with labeler(workspace, use_tk) as (app, harness):
+            # load_task: время до первого изображения и до полного списка
+            first, complete = [], []
+            for _ in range(max(1, repeat // 5)):
+                wait_until(harness, lambda: app.task_scanner is None and app.duplicate_indexer is None)
+                started = time.perf_counter()
+                app.load_task("bench")
+                wait_until(harness, lambda: app.current_image is not None)
+                first.append(time.perf_counter() - started)
+                wait_until(harness, lambda: app.task_scanner is None)
+                complete.append(time.perf_counter() - started)
+            results.append(summarize("load_task_first_image", scale, first))
+            results.append(summarize("load_task", scale, complete))
+            wait_until(harness, lambda: app.duplicate_indexer is None)
+
+            files = list(app.image_files)
+
+            def open_image(run):
+                app.current_image_index = run % len(files)
+
+            results.append(summarize("load_image", scale, timed(
+                lambda: app.load_image(files[app.current_image_index]), repeat, open_image
+            )))
+            app.current_image_index = 0
+            app.load_image(files[0])
+            results.append(summarize("display_image", scale, timed(app.display_image, repeat)))
+            results.extend(bench_zoom_pan(app, harness, scale, repeat))
+
+            for count in box_counts:
+                app.annotations = synthetic_annotations(app, count, rng)
+                results.append(summarize(
+                    "redraw_annotations", scale, timed(app.redraw_annotations, repeat), count
+                ))
+                results.append(summarize("update_stats", scale, timed(app.update_stats, repeat), count))
+
+                def mark_dirty(run):
+                    app.annotations_dirty = True
+
+                results.append(summarize(
+                    "save_annotations", scale, timed(app.save_annotations, repeat, mark_dirty), count
+                ))
+                results.append(summarize(
+                    "save_annotations_flush", scale,
+                    timed(app.label_writer.flush, repeat, lambda run: (mark_dirty(run), app.save_annotations())),
+                    count,
+                ))
+
+                canvas_w, canvas_h = app.canvas.winfo_width(), app.canvas.winfo_height()
+                points = [
+                    SimpleNamespace(x=rng.uniform(0, canvas_w), y=rng.uniform(0, canvas_h))
+                    for _ in range(repeat)
+                ]
+
+                def reset_action(run):
+                    if app.current_rect:
+                        app.canvas.delete(app.current_rect)
+                    app.current_rect = None
+                    app.selected_rect = None
+                    app.resize_corner = None
+                    app.pending_class_change = None
+
+                samples = []
+                for run, point in enumerate(points):
+                    reset_action(run)
+                    started = time.perf_counter()
+                    app.start_action(point)
+                    samples.append(time.perf_counter() - started)
+                reset_action(0)
+                results.append(summarize("start_action", scale, samples, count))
+
+                # Перетаскивание рамки: по 8 событий движения на кадр объединяются планировщиком
+                if app.annotations:
+                    ann = app.annotations[0]
+                    cx, cy = app.image_to_canvas((ann['x1'] + ann['x2']) / 2, (ann['y1'] + ann['y2']) / 2)
+                    app.start_action(SimpleNamespace(x=cx, y=cy))
+                    app.frames.frame_times.clear()
+                    for frame in range(repeat):
+                        for step in range(8):
+                            shift = (frame * 8 + step) % 40
+                            app.on_drag_motion(SimpleNamespace(x=cx + shift, y=cy + shift))
+                        wait_until(harness, lambda: not app.frames.pending)
+                    app.end_action(SimpleNamespace(x=cx, y=cy))
+                    frame_times = [value / 1000 for value in app.frames.frame_times]
+                    results.append(summarize("drag_frame", scale, frame_times, count))
+
+                if use_tk:
+                    from canvas_scene import benchmark_drag
+
+                    app.scene.clear()
+                    fps = benchmark_drag(app.canvas, count, frames=repeat)
+                    for mode, value in fps.items():
+                        results.append({
+                            "op": f"drag_{mode}_fps", "scale": scale, "boxes": count,
+                            "runs": repeat, "fps": round(value, 2),
+                        })
+                    app.redraw_annotations()
+
+            # Экспорт переносит файлы, поэтому замеряется последним и один раз
+            app.annotations_dirty = False
+            started = time.perf_counter()
+            app.export_labeled_images()
+            wait_until(harness, lambda: app.export_thread is None)
+            results.append(summarize("export_labeled_images", scale, [time.perf_counter() - started]))
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+    return results
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+            cwd=Path(__file__).resolve().parent, check=False,
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "mode": "tk" if args.tk else "stub",
+        "resolution": list(args.resolution),
+        "repeat": args.repeat,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры горячих путей окна разметки")
+    parser.add_argument("--scales", default="200,2000", help="числа изображений через запятую")
+    parser.add_argument("--boxes", default="10,100,1000", help="числа рамок через запятую")
+    parser.add_argument("--repeat", type=int, default=20, help="повторов каждого замера")
+    parser.add_argument("--resolution", type=parse_resolution, default=(1920, 1080), help="ШИРИНАxВЫСОТА")
+    parser.add_argument("--tk", action="store_true", help="использовать настоящий Tk вместо заглушек")
+    parser.add_argument("--out", help="файл для JSON (по умолчанию stdout)")
+    args = parser.parse_args(argv)
+
+    scales = [int(value) for value in args.scales.split(",") if value]
+    box_counts = [int(value) for value in args.boxes.split(",") if value]
+    results = []
+    for scale in scales:
+        print(f"Масштаб {scale}...", file=sys.stderr)
+        results.extend(bench_scale(scale, box_counts, args.repeat, args.resolution, args.tk))
+
+    report = json.dumps({"meta": run_metadata(args), "results": results}, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, 'w', encoding="utf-8") as f:
+            f.write(report + "\n")
+    else:
+        print(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
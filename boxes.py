@@ -0,0 +1,28 @@
+import numpy as np
+
+
+def nms(boxes, scores, iou_threshold):
+    """Жадное подавление немаксимумов; возвращает индексы оставленных рамок"""
+    order = scores.argsort()[::-1]
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        xx1 = np.maximum(boxes[i, 0], boxes[rest, 0])
+        yy1 = np.maximum(boxes[i, 1], boxes[rest, 1])
+        xx2 = np.minimum(boxes[i, 2], boxes[rest, 2])
+        yy2 = np.minimum(boxes[i, 3], boxes[rest, 3])
+        inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.asarray(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, class_ids, iou_threshold):
+    """NMS внутри каждого класса за счёт сдвига рамок разных классов"""
+    if not len(boxes):
+        return np.zeros(0, dtype=np.int64)
+    offset = class_ids.astype(np.float64)[:, None] * (boxes.max() + 1)
+    return nms(boxes + offset, scores, iou_threshold)
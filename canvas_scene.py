@@ -0,0 +1,274 @@
+import time
+import tkinter as tk
+from collections import deque
+
+
+HANDLE_SIZE = 5
+HANDLE_CORNERS = ("br", "tl", "tr", "bl")
+SCENE_TAGS = ("rectangle", "handle", "text", "text_bg", "center")
+
+
+class AnnotationScene:
+    """Сохраняемый слой элементов холста для аннотаций.
+
+    Для каждой рамки хранится набор идентификаторов элементов холста.
+    Полная пересборка выполняется только при смене изображения или масштаба,
+    а перетаскивание и изменение размера лишь обновляют coords нужных элементов.
+    """
+
+    def __init__(self, canvas):
+        self.canvas = canvas
+        self.boxes = []
+
+    def clear(self):
+        """Удаляет все элементы аннотаций с холста"""
+        self.canvas.delete(*SCENE_TAGS)
+        self.boxes = []
+
+    def rebuild(self, annotations, to_canvas, colors):
+        """Полностью пересоздаёт элементы для списка аннотаций"""
+        self.clear()
+        for ann in annotations:
+            self.add(ann, to_canvas, colors)
+
+    def add(self, ann, to_canvas, colors):
+        """Создаёт элементы холста для новой рамки"""
+        canvas = self.canvas
+        index = len(self.boxes)
+        color = colors.get(ann['class'], "red")
+        x1, y1 = to_canvas(ann['x1'], ann['y1'])
+        x2, y2 = to_canvas(ann['x2'], ann['y2'])
+        items = {
+            "rect": canvas.create_rectangle(
+                x1, y1, x2, y2, outline=color, width=2, tags=("rectangle", f"rect_{index}")
+            ),
+            "handles": {},
+        }
+        for corner, (hx, hy) in zip(HANDLE_CORNERS, self._corners(x1, y1, x2, y2)):
+            items["handles"][corner] = canvas.create_rectangle(
+                hx - HANDLE_SIZE, hy - HANDLE_SIZE, hx + HANDLE_SIZE, hy + HANDLE_SIZE,
+                fill="blue", tags=("handle", f"handle_{index}_{corner}"),
+            )
+        cx = (x1 + x2) / 2
+        cy = (y1 + y2) / 2
+        items["center"] = (
+            canvas.create_line(cx - 5, cy, cx + 5, cy, fill=color, tags="center"),
+            canvas.create_line(cx, cy - 5, cx, cy + 5, fill=color, tags="center"),
+        )
+        items["text"] = canvas.create_text(
+            x1 + 4,
+            y1 + 4,
+            text=ann['class'],
+            fill="white",
+            anchor=tk.NW,
+            tags=("text", f"text_{index}"),
+            font=("TkDefaultFont", 10, "bold"),
+        )
+        bbox = canvas.bbox(items["text"]) or (x1, y1, x1, y1)
+        items["text_bg"] = canvas.create_rectangle(
+            bbox, fill="black", outline="", tags=("text_bg", f"text_bg_{index}")
+        )
+        canvas.tag_lower(items["text_bg"], items["text"])
+
+        self.boxes.append(items)
+
+    def update_box(self, index, ann, to_canvas):
+        """Сдвигает элементы одной рамки без пересоздания"""
+        canvas = self.canvas
+        items = self.boxes[index]
+        x1, y1 = to_canvas(ann['x1'], ann['y1'])
+        x2, y2 = to_canvas(ann['x2'], ann['y2'])
+        canvas.coords(items["rect"], x1, y1, x2, y2)
+        for corner, (hx, hy) in zip(HANDLE_CORNERS, self._corners(x1, y1, x2, y2)):
+            canvas.coords(
+                items["handles"][corner],
+                hx - HANDLE_SIZE, hy - HANDLE_SIZE, hx + HANDLE_SIZE, hy + HANDLE_SIZE,
+            )
+        cx = (x1 + x2) / 2
+        cy = (y1 + y2) / 2
+        horizontal, vertical = items["center"]
+        canvas.coords(horizontal, cx - 5, cy, cx + 5, cy)
+        canvas.coords(vertical, cx, cy - 5, cx, cy + 5)
+        canvas.coords(items["text"], x1 + 4, y1 + 4)
+        bbox = canvas.bbox(items["text"])
+        if bbox:
+            canvas.coords(items["text_bg"], *bbox)
+
+    def restyle(self, index, ann, colors):
+        """Обновляет цвет и подпись рамки после смены класса"""
+        canvas = self.canvas
+        items = self.boxes[index]
+        color = colors.get(ann['class'], "red")
+        canvas.itemconfig(items["rect"], outline=color)
+        for item in items["center"]:
+            canvas.itemconfig(item, fill=color)
+        canvas.itemconfig(items["text"], text=ann['class'])
+        bbox = canvas.bbox(items["text"])
+        if bbox:
+            canvas.coords(items["text_bg"], *bbox)
+
+    @staticmethod
+    def _corners(x1, y1, x2, y2):
+        return (x2, y2), (x1, y1), (x2, y1), (x1, y2)
+
+
+class Crosshair:
+    """Две пунктирные линии под курсором, создаются один раз и сдвигаются через coords"""
+
+    def __init__(self, canvas, color="blue", dash=(2, 2)):
+        self.canvas = canvas
+        self.color = color
+        self.dash = dash
+        self.lines = None
+        self.hidden = False
+
+    def move(self, x, y):
+        canvas = self.canvas
+        w = canvas.winfo_width()
+        h = canvas.winfo_height()
+        if self.lines is None:
+            self.lines = (
+                canvas.create_line(0, y, w, y, fill=self.color, dash=self.dash, tags="crosshair"),
+                canvas.create_line(x, 0, x, h, fill=self.color, dash=self.dash, tags="crosshair"),
+            )
+            self.hidden = False
+            return
+        horizontal, vertical = self.lines
+        canvas.coords(horizontal, 0, y, w, y)
+        canvas.coords(vertical, x, 0, x, h)
+        if self.hidden:
+            canvas.itemconfigure("crosshair", state=tk.NORMAL)
+            self.hidden = False
+
+    def hide(self):
+        if self.lines is not None and not self.hidden:
+            self.canvas.itemconfigure("crosshair", state=tk.HIDDEN)
+            self.hidden = True
+
+    def lift(self):
+        if self.lines is not None:
+            self.canvas.tag_raise("crosshair")
+
+    def forget(self):
+        """Линии удалены с холста (delete("all")), при следующем move они создаются заново"""
+        self.lines = None
+
+
+class FrameScheduler:
+    """Объединяет частые события указателя в один кадр.
+
+    request() запоминает только последний вызов для каждого ключа, а сами
+    вызовы выполняются не чаще одного раза за frame_ms. Время выполнения
+    кадров хранится в frame_times, чтобы проверять бюджет кадра.
+    """
+
+    def __init__(self, widget, frame_ms=16, on_frame=None, history=240):
+        self.widget = widget
+        self.frame_ms = frame_ms
+        self.on_frame = on_frame
+        self.pending = {}
+        self.job = None
+        self.last_frame = 0.0
+        self.frame_times = deque(maxlen=history)
+
+    def request(self, key, callback, *args):
+        self.pending[key] = (callback, args)
+        if self.job is not None:
+            return
+        wait_ms = self.frame_ms - (time.perf_counter() - self.last_frame) * 1000
+        if wait_ms <= 0:
+            self.job = self.widget.after_idle(self.run)
+        else:
+            self.job = self.widget.after(int(wait_ms) + 1, self.run)
+
+    def discard(self, key):
+        self.pending.pop(key, None)
+
+    def run(self):
+        """Выполняет накопленные вызовы (также вызывается напрямую для немедленного применения)"""
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, {}
+        started = time.perf_counter_ns()
+        for callback, args in pending.values():
+            callback(*args)
+        finished = time.perf_counter_ns()
+        self.last_frame = finished / 1e9
+        self.frame_times.append((finished - started) / 1e6)
+        if self.on_frame is not None:
+            self.on_frame(started, finished)
+
+    flush = run
+
+    def cancel(self):
+        if self.job is not None:
+            self.widget.after_cancel(self.job)
+            self.job = None
+        self.pending = {}
+
+    def frame_stats(self):
+        """(среднее, p95, максимум) времени кадра в мс по последним кадрам"""
+        if not self.frame_times:
+            return 0.0, 0.0, 0.0
+        ordered = sorted(self.frame_times)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return sum(ordered) / len(ordered), p95, ordered[-1]
+
+
+def benchmark_drag(canvas, box_count=1000, frames=100):
+    """Сравнивает кадры в секунду полной пересборки и обновления coords"""
+    width = int(canvas.winfo_width()) or 1200
+    height = int(canvas.winfo_height()) or 800
+    cols = max(1, int(box_count ** 0.5))
+    cell_w = width / cols
+    cell_h = height / (box_count // cols + 1)
+    annotations = []
+    for i in range(box_count):
+        x = (i % cols) * cell_w
+        y = (i // cols) * cell_h
+        annotations.append({
+            'class': f"class_{i % 10}",
+            'x1': x + 2, 'y1': y + 2, 'x2': x + cell_w - 2, 'y2': y + cell_h - 2,
+        })
+    colors = {f"class_{i}": "#ff0000" for i in range(10)}
+
+    def to_canvas(x, y):
+        return x, y
+
+    scene = AnnotationScene(canvas)
+    dragged = annotations[0]
+    results = {}
+    for mode in ("rebuild", "retained"):
+        scene.rebuild(annotations, to_canvas, colors)
+        canvas.update()
+        started = time.perf_counter()
+        for frame in range(frames):
+            shift = frame % 20
+            dragged['x1'] = 2 + shift
+            dragged['x2'] = cell_w - 2 + shift
+            if mode == "rebuild":
+                scene.rebuild(annotations, to_canvas, colors)
+            else:
+                scene.update_box(0, dragged, to_canvas)
+            canvas.update_idletasks()
+        elapsed = time.perf_counter() - started
+        results[mode] = frames / elapsed if elapsed else float("inf")
+    scene.clear()
+    return results
+
+
+if __name__ == "__main__":
+    root = tk.Tk()
+    root.geometry("1200x800")
+    bench_canvas = tk.Canvas(root, bg="gray")
+    bench_canvas.pack(expand=True, fill=tk.BOTH)
+    root.update()
+    fps = benchmark_drag(bench_canvas)
+    print(
+        f"1000 рамок: пересборка {fps['rebuild']:.1f} FPS, "
+        f"обновление coords {fps['retained']:.1f} FPS"
+    )
+    root.destroy()
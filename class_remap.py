@@ -0,0 +1,323 @@
+"""Перенумерация классов во всей разметке задачи.
+
+Пример:
+    python class_remap.py job_1 --order "car,person,bike"
+    python class_remap.py job_1 --merge truck=car --drop trash
+    python class_remap.py job_1                  # довести прерванную перенумерацию
+
+После удаления или перестановки классов номера в файлах разметки должны
+сдвинуться вместе с classes.txt. Старый номер каждого класса переводится в
+новый; рамки удалённого класса либо переносятся в другой класс, либо
+удаляются. Номера вне старого списка классов и некорректные строки не
+трогаются — их показывает label_lint.py.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from label_writer import atomic_write_text
+from sqlite_store import SqliteAnnotationStore
+from task_layout import CLASSES_FILENAME, AutoLabelRegistry, read_classes
+
+
+JOURNAL_FILENAME = ".class_remap_journal"
+PENDING_SUFFIX = ".remap"
+
+
+def make_remap(old_classes, new_classes, merges=None):
+    """Новый номер для каждого старого класса; None — рамки класса удаляются.
+
+    Классы сопоставляются по имени. merges — {удалённый класс: класс, в
+    который переносятся его рамки}; цепочки переносов разворачиваются.
+    """
+    merges = merges or {}
+    index = {name: idx for idx, name in enumerate(new_classes)}
+    remap = []
+    for name in old_classes:
+        seen = set()
+        while name not in index and name in merges and name not in seen:
+            seen.add(name)
+            name = merges[name]
+        remap.append(index.get(name))
+    return remap
+
+
+def is_identity(remap):
+    return all(new == old for old, new in enumerate(remap))
+
+
+def remap_text(text, remap):
+    """Текст файла YOLO с новыми номерами классов; None, если менять нечего.
+
+    Пустая строка означает, что рамок не осталось.
+    """
+    lines = []
+    changed = False
+    for line in text.splitlines():
+        parts = line.split(None, 1)
+        if len(parts) == 2:
+            try:
+                class_id = int(float(parts[0]))
+            except (ValueError, OverflowError):
+                class_id = -1
+            if 0 <= class_id < len(remap) and remap[class_id] != class_id:
+                changed = True
+                if remap[class_id] is None:
+                    continue
+                line = f"{remap[class_id]} {parts[1]}"
+        lines.append(line)
+    if not changed:
+        return None
+    return "".join(f"{line}\n" for line in lines if line.strip())
+
+
+def prepare_files(image_dir, names, remap):
+    """Пишет новый текст изменяемых файлов рядом с ними в <имя>.txt.remap.
+
+    Выполняется в процессе пула; файлы, подготовленные до сбоя, пропускаются.
+    Возвращает (число просмотренных, число подготовленных).
+    """
+    prepared = 0
+    for name in names:
+        path = os.path.join(image_dir, name)
+        pending = path + PENDING_SUFFIX
+        if os.path.exists(pending):
+            prepared += 1
+            continue
+        try:
+            with open(path, 'r') as f:
+                text = f.read()
+        except OSError:
+            continue
+        new_text = remap_text(text, remap)
+        if new_text is None:
+            continue
+        atomic_write_text(pending, new_text)
+        prepared += 1
+    return len(names), prepared
+
+
+def commit_file(pending):
+    """Подменяет файл разметки подготовленным; пустой удаляет разметку.
+
+    Повторный вызов безопасен. Возвращает False, если рамок не осталось.
+    """
+    label_file = pending[:-len(PENDING_SUFFIX)]
+    try:
+        size = os.path.getsize(pending)
+    except FileNotFoundError:
+        return True
+    if size:
+        os.replace(pending, label_file)
+        return True
+    atomic_write_text(label_file, None)
+    os.unlink(pending)
+    return False
+
+
+class RemapReport:
+    def __init__(self, files=0, changed=0, emptied=0, resumed=False, seconds=0.0):
+        self.files = files
+        self.changed = changed
+        self.emptied = emptied
+        self.resumed = resumed
+        self.seconds = seconds
+
+
+class ClassRemapJob:
+    """Перенумерация классов задачи с журналом для продолжения после сбоя.
+
+    В журнал Tasks/<задача>/.class_remap_journal сначала записывается план
+    (новые классы и remap). Затем пул процессов готовит новый текст каждого
+    изменяемого файла в <имя>.txt.remap, не трогая исходные, а база SQLite
+    (если есть) обновляется одной транзакцией. После отметки о готовности в
+    журнале пишется classes.txt и подготовленные файлы подменяют исходные.
+    Прерванная подготовка продолжается с неподготовленных файлов,
+    прерванная подмена доводится до конца, поэтому ни один файл не
+    перенумеровывается дважды.
+    """
+
+    def __init__(self, task_path, classes=None, remap=None, workers=None, chunk_size=2000):
+        self.task_path = Path(task_path)
+        self.image_dir = self.task_path / "images"
+        self.journal_path = self.task_path / JOURNAL_FILENAME
+        self.classes = classes
+        self.remap = remap
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.stage = "prepare"
+
+    @classmethod
+    def pending(cls, task_path):
+        """Есть ли прерванная перенумерация"""
+        return (Path(task_path) / JOURNAL_FILENAME).exists()
+
+    def read_journal(self):
+        """(план, отметка о готовности) из журнала или (None, False)"""
+        plan = None
+        committed = False
+        try:
+            with open(self.journal_path, 'r', encoding="utf-8") as f:
+                for line in f:
+                    kind, _, payload = line.rstrip("\n").partition("\t")
+                    if kind == "P":
+                        try:
+                            plan = json.loads(payload)
+                        except ValueError:
+                            # План записан не полностью: подготовка не начиналась
+                            continue
+                    elif kind == "C":
+                        committed = True
+        except FileNotFoundError:
+            pass
+        return plan, committed
+
+    def _append_journal(self, line):
+        with open(self.journal_path, 'a', encoding="utf-8") as journal:
+            journal.write(line)
+            journal.flush()
+            os.fsync(journal.fileno())
+
+    def _scan(self, suffix):
+        try:
+            it = os.scandir(self.image_dir)
+        except OSError:
+            return []
+        with it:
+            return [entry.name for entry in it if entry.name.endswith(suffix)]
+
+    def _prepare(self, progress):
+        names = self._scan(".txt")
+        total = len(names)
+        if progress:
+            progress(0, total)
+        chunks = [names[offset:offset + self.chunk_size] for offset in range(0, total, self.chunk_size)]
+        done = 0
+        if len(chunks) == 1:
+            done, _ = prepare_files(str(self.image_dir), chunks[0], self.remap)
+        elif chunks:
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(chunks)), mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                futures = [
+                    pool.submit(prepare_files, str(self.image_dir), chunk, self.remap) for chunk in chunks
+                ]
+                for future in as_completed(futures):
+                    checked, _ = future.result()
+                    done += checked
+                    if progress:
+                        progress(done, total)
+        if progress:
+            progress(done, total)
+        return total
+
+    def _commit(self, progress):
+        pending = self._scan(".txt" + PENDING_SUFFIX)
+        total = len(pending)
+        emptied = []
+        for done, name in enumerate(pending, 1):
+            if not commit_file(str(self.image_dir / name)):
+                emptied.append(name[:-len(".txt" + PENDING_SUFFIX)])
+            if progress and (done % 256 == 0 or done == total):
+                progress(done, total)
+        if emptied:
+            registry = AutoLabelRegistry(self.task_path).load()
+            for stem in emptied:
+                registry.mark(stem, False)
+            registry.save()
+        return total, len(emptied)
+
+    def run(self, progress=None):
+        """Выполняет или продолжает перенумерацию; progress(done, total) — из рабочего потока"""
+        started = time.perf_counter()
+        plan, committed = self.read_journal()
+        resumed = plan is not None
+        if plan is None:
+            token = int.from_bytes(os.urandom(4), "big") >> 1 or 1
+            plan = {"classes": list(self.classes), "remap": list(self.remap), "token": token}
+            self._append_journal(f"P\t{json.dumps(plan, ensure_ascii=False)}\n")
+        self.classes, self.remap = plan["classes"], plan["remap"]
+
+        files = 0
+        if not committed:
+            self.stage = "prepare"
+            files = self._prepare(progress)
+            store = SqliteAnnotationStore.open_existing(self.task_path)
+            if store is not None:
+                try:
+                    store.remap_classes(self.remap, plan["token"])
+                finally:
+                    store.close()
+            self._append_journal("C\n")
+
+        atomic_write_text(self.task_path / CLASSES_FILENAME, "".join(f"{cls}\n" for cls in self.classes))
+        self.stage = "commit"
+        changed, emptied = self._commit(progress)
+        self.journal_path.unlink()
+        return RemapReport(files, changed, emptied, resumed, time.perf_counter() - started)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перенумерация классов в разметке задачи")
+    parser.add_argument("task", help="имя задачи")
+    parser.add_argument("--tasks-root", default="Tasks")
+    parser.add_argument("--order", help="новый список классов через запятую")
+    parser.add_argument("--drop", action="append", default=[], help="удалить класс вместе с рамками")
+    parser.add_argument(
+        "--merge", action="append", default=[], metavar="OLD=NEW", help="удалить класс, перенеся рамки в другой"
+    )
+    parser.add_argument("--workers", type=int, default=None, help="число процессов")
+    args = parser.parse_args(argv)
+
+    task_path = Path(args.tasks_root) / args.task
+    job = ClassRemapJob(task_path, workers=args.workers)
+    if not ClassRemapJob.pending(task_path):
+        old_classes = read_classes(task_path / CLASSES_FILENAME)
+        merges = {}
+        for item in args.merge:
+            old, _, new = item.partition("=")
+            for name in (old, new):
+                if name not in old_classes:
+                    parser.error(f"нет класса {name}")
+            if old == new:
+                parser.error(f"класс {old} нельзя перенести сам в себя")
+            merges[old] = new
+        for name in args.drop:
+            if name not in old_classes:
+                parser.error(f"нет класса {name}")
+        for old, new in merges.items():
+            if new in args.drop:
+                parser.error(f"класс {new} удаляется, в него нельзя перенести {old}")
+        removed = set(merges) | set(args.drop)
+        if args.order:
+            new_classes = [name.strip() for name in args.order.split(",") if name.strip()]
+            # Класс пропадает из списка только явно: через --drop или --merge
+            missing = [name for name in old_classes if name not in new_classes and name not in removed]
+            if missing:
+                parser.error(f"классы не указаны в --order: {', '.join(missing)}; удалите их через --drop или --merge")
+        else:
+            new_classes = list(old_classes)
+        new_classes = [name for name in new_classes if name not in removed]
+        job.classes = new_classes
+        job.remap = make_remap(old_classes, new_classes, merges)
+        if is_identity(job.remap) and new_classes == old_classes:
+            print("Классы не изменились")
+            return 0
+    report = job.run()
+    if report.resumed:
+        print("Прерванная перенумерация доведена до конца")
+    print(
+        f"Файлов: {report.files}, перезаписано: {report.changed}, "
+        f"без рамок: {report.emptied}, время: {report.seconds:.1f} с"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,308 @@
+"""Упаковка Result/<задача> в tar-шарды для обучения (в стиле WebDataset).
+
+Пример:
+    python dataset_shards.py job_1 --val 0.1 --shard-size 1024
+
+Каждый образец — пара членов архива <имя>.<расширение> и <имя>.txt. Рядом с
+шардами создаются index.tsv (смещения для произвольного доступа, раздел и
+классы образца), state.json (параметры разбиения) и data.yaml для ultralytics.
+Повторный запуск добавляет только новые изображения в новые шарды; записи
+индекса появляются только после закрытия шарда, поэтому прерванный запуск
+просто повторяется.
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import sys
+import tarfile
+from collections import Counter
+from pathlib import Path
+
+from task_layout import SUPPORTED_EXTENSIONS
+
+
+INDEX_FILENAME = "index.tsv"
+STATE_FILENAME = "state.json"
+SPLITS = ("train", "val")
+BACKGROUND = -1
+
+
+def stable_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def label_classes(label_path):
+    """Номера классов, встречающихся в файле меток"""
+    classes = set()
+    try:
+        with open(label_path, 'r') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 5:
+                    try:
+                        classes.add(int(float(parts[0])))
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return classes
+
+
+def scan_samples(source_dir):
+    """Пары (имя, изображение, метка) из плоского каталога Result/<задача>"""
+    images = {}
+    labels = set()
+    with os.scandir(source_dir) as it:
+        for entry in it:
+            stem, ext = os.path.splitext(entry.name)
+            if ext == ".txt":
+                labels.add(stem)
+            elif ext.lower() in SUPPORTED_EXTENSIONS:
+                images.setdefault(stem, entry.name)
+    return sorted(
+        ((stem, source_dir / images[stem], source_dir / f"{stem}.txt") for stem in labels if stem in images),
+        key=lambda item: stable_hash(item[0]),
+    )
+
+
+class ShardWriter:
+    """Пишет образцы в шарды фиксированного размера одного раздела.
+
+    Записи индекса накапливаются и передаются в on_close после того, как
+    шард атомарно переименован из .tmp.
+    """
+
+    def __init__(self, out_dir, split, first_number, max_bytes, on_close):
+        self.out_dir = out_dir
+        self.split = split
+        self.number = first_number
+        self.max_bytes = max_bytes
+        self.on_close = on_close
+        self.tar = None
+        self.name = None
+        self.pending = []
+
+    def _open(self):
+        self.name = f"{self.split}-{self.number:06d}.tar"
+        self.tar = tarfile.open(self.out_dir / f"{self.name}.tmp", "w", format=tarfile.GNU_FORMAT)
+
+    def _close(self):
+        if self.tar is not None:
+            self.tar.close()
+            os.replace(self.out_dir / f"{self.name}.tmp", self.out_dir / self.name)
+            self.tar = None
+            self.number += 1
+            self.on_close(self.pending)
+            self.pending = []
+
+    def _add(self, member_name, fileobj, size):
+        info = tarfile.TarInfo(member_name)
+        info.size = size
+        info.mtime = 0
+        header = info.tobuf(self.tar.format, self.tar.encoding, self.tar.errors)
+        data_offset = self.tar.offset + len(header)
+        self.tar.addfile(info, fileobj)
+        return data_offset
+
+    def write(self, key, image_path, label_path, stratum, classes):
+        """Добавляет образец в текущий шард"""
+        if self.tar is not None and self.tar.offset >= self.max_bytes:
+            self._close()
+        if self.tar is None:
+            self._open()
+        image_size = os.path.getsize(image_path)
+        with open(image_path, 'rb') as f:
+            image_offset = self._add(f"{key}{image_path.suffix.lower()}", f, image_size)
+        with open(label_path, 'rb') as f:
+            label_bytes = f.read()
+        label_offset = self._add(f"{key}.txt", io.BytesIO(label_bytes), len(label_bytes))
+        self.pending.append((
+            key, self.split, self.name, image_offset, image_size,
+            image_path.suffix.lower(), label_offset, len(label_bytes),
+            stratum, ",".join(str(c) for c in sorted(classes)),
+        ))
+
+    def close(self):
+        self._close()
+
+
+class ShardIndex:
+    """Произвольный доступ к образцам по index.tsv без распаковки шардов"""
+
+    FIELDS = 10
+
+    def __init__(self, out_dir):
+        self.out_dir = Path(out_dir)
+        self.entries = {}
+        index_file = self.out_dir / INDEX_FILENAME
+        if index_file.exists():
+            with open(index_file, 'r', encoding="utf-8") as f:
+                for line in f:
+                    fields = line.rstrip("\n").split("\t")
+                    if len(fields) == self.FIELDS:
+                        self.entries[fields[0]] = fields
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def read(self, key):
+        """Возвращает (байты изображения, текст меток) образца"""
+        _, _, shard, image_offset, image_size, _, label_offset, label_size = self.entries[key][:8]
+        with open(self.out_dir / shard, 'rb') as f:
+            f.seek(int(image_offset))
+            image = f.read(int(image_size))
+            f.seek(int(label_offset))
+            label = f.read(int(label_size)).decode("utf-8")
+        return image, label
+
+    def class_counts(self):
+        counts = Counter()
+        for fields in self.entries.values():
+            if fields[9]:
+                counts.update(int(c) for c in fields[9].split(","))
+        return counts
+
+    def stratum_counts(self):
+        counts = {}
+        for fields in self.entries.values():
+            bucket = counts.setdefault(fields[8], {"train": 0, "val": 0})
+            bucket[fields[1]] += 1
+        return counts
+
+
+def next_shard_numbers(out_dir):
+    """Следующие свободные номера шардов; брошенные .tmp удаляются"""
+    numbers = {split: 0 for split in SPLITS}
+    for path in out_dir.iterdir():
+        if path.name.endswith(".tar.tmp"):
+            path.unlink()
+            continue
+        for split in SPLITS:
+            prefix = f"{split}-"
+            if path.name.startswith(prefix) and path.name.endswith(".tar"):
+                try:
+                    number = int(path.name[len(prefix):-4])
+                except ValueError:
+                    continue
+                numbers[split] = max(numbers[split], number + 1)
+    return numbers
+
+
+def load_state(out_dir, val_ratio):
+    state_file = out_dir / STATE_FILENAME
+    if state_file.exists():
+        with open(state_file, 'r', encoding="utf-8") as f:
+            return json.load(f)
+    state = {"val_ratio": val_ratio}
+    tmp_file = out_dir / f"{STATE_FILENAME}.tmp"
+    with open(tmp_file, 'w', encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_file, state_file)
+    return state
+
+
+def assign_split(stratum, val_ratio, stratum_counts):
+    """Детерминированное стратифицированное разбиение.
+
+    Образцы каждой страты (самого редкого класса в образце) распределяются
+    так, чтобы доля val в страте держалась у val_ratio. Уже упакованные
+    образцы не переназначаются, поэтому дозапись не меняет прежнее разбиение.
+    """
+    counts = stratum_counts.setdefault(str(stratum), {"train": 0, "val": 0})
+    total = counts["train"] + counts["val"] + 1
+    split = "val" if counts["val"] < round(val_ratio * total) else "train"
+    counts[split] += 1
+    return split
+
+
+def write_data_yaml(out_dir, classes):
+    """data.yaml для ultralytics: шарды распаковываются в train/ и val/"""
+    lines = [
+        "# Распакуйте шарды: for s in train val; do mkdir -p $s; "
+        "for t in $s-*.tar; do tar -xf $t -C $s; done; done",
+        f"path: {json.dumps(str(out_dir.resolve()), ensure_ascii=False)}",
+        "train: train",
+        "val: val",
+        f"nc: {len(classes)}",
+        "names:",
+    ]
+    lines.extend(f"  {idx}: {json.dumps(name, ensure_ascii=False)}" for idx, name in enumerate(classes))
+    with open(out_dir / "data.yaml", 'w', encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def package(source_dir, out_dir, classes, val_ratio=0.1, shard_size_mb=1024, log=print):
+    """Упаковывает новые образцы из source_dir, возвращает их число"""
+    source_dir = Path(source_dir)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    state = load_state(out_dir, val_ratio)
+    index = ShardIndex(out_dir)
+    samples = [sample for sample in scan_samples(source_dir) if sample[0] not in index]
+
+    # Первый проход только по меткам: частоты классов для выбора страты
+    sample_classes = {}
+    class_counts = index.class_counts()
+    for key, _, label_path in samples:
+        present = label_classes(label_path)
+        sample_classes[key] = present
+        class_counts.update(present)
+    stratum_counts = index.stratum_counts()
+
+    written = 0
+    with open(out_dir / INDEX_FILENAME, 'a', encoding="utf-8") as index_file:
+        def flush(records):
+            index_file.writelines("\t".join(str(field) for field in record) + "\n" for record in records)
+            index_file.flush()
+            os.fsync(index_file.fileno())
+
+        max_bytes = shard_size_mb * 1024 * 1024
+        numbers = next_shard_numbers(out_dir)
+        writers = {
+            split: ShardWriter(out_dir, split, numbers[split], max_bytes, flush)
+            for split in SPLITS
+        }
+        for key, image_path, label_path in samples:
+            present = sample_classes[key]
+            stratum = min(present, key=lambda c: (class_counts[c], c)) if present else BACKGROUND
+            split = assign_split(stratum, state["val_ratio"], stratum_counts)
+            writers[split].write(key, image_path, label_path, stratum, present)
+            written += 1
+            if written % 1000 == 0:
+                log(f"Упаковано: {written}/{len(samples)}")
+        for writer in writers.values():
+            writer.close()
+
+    write_data_yaml(out_dir, classes)
+    log(f"Готово: добавлено {written} образцов, всего {len(index) + written}")
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Упаковка Result/<задача> в tar-шарды")
+    parser.add_argument("task", help="имя задачи")
+    parser.add_argument("--result-root", default="Result")
+    parser.add_argument("--tasks-root", default="Tasks", help="откуда брать classes.txt")
+    parser.add_argument("--out", default="Shards", help="каталог для шардов")
+    parser.add_argument("--val", type=float, default=0.1, help="доля валидации")
+    parser.add_argument("--shard-size", type=int, default=1024, help="размер шарда, МБ")
+    args = parser.parse_args(argv)
+
+    from labeler_core import Task
+
+    source_dir = Path(args.result_root) / args.task
+    if not source_dir.is_dir():
+        parser.error(f"не найден каталог {source_dir}")
+    classes = Task(args.tasks_root, args.task).load_classes()
+    package(source_dir, Path(args.out) / args.task, classes, args.val, args.shard_size)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
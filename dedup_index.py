@@ -0,0 +1,215 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+
+CACHE_FILENAME = ".dhash_cache.json"
+CACHE_VERSION = 1
+HASH_SIZE = 8
+
+
+def dhash(path, size=HASH_SIZE):
+    """Разностный хэш: знак разности соседних пикселей уменьшенной копии в оттенках серого"""
+    with Image.open(path) as image:
+        # Для JPEG декодируется уже уменьшенная копия
+        image.draft("L", (size * 8, size * 8))
+        small = image.convert("L").resize((size + 1, size), Image.Resampling.BOX)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] < pixels[offset + col + 1])
+    return value
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-дерево по расстоянию Хэмминга для поиска хэшей в заданном радиусе"""
+
+    def __init__(self):
+        self.root = None
+        self.size = 0
+
+    def add(self, value, item):
+        self.size += 1
+        if self.root is None:
+            self.root = [value, [item], {}]
+            return
+        node = self.root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = [value, [item], {}]
+                return
+            node = child
+
+    def query(self, value, radius):
+        """Список (расстояние, элемент) для хэшей не дальше radius"""
+        found = []
+        if self.root is None:
+            return found
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            distance = hamming(value, node[0])
+            if distance <= radius:
+                found.extend((distance, item) for item in node[1])
+            for edge, child in node[2].items():
+                if distance - radius <= edge <= distance + radius:
+                    stack.append(child)
+        return found
+
+
+def build_clusters(files, hashes, radius):
+    """Группы похожих кадров: {изображение: первый кадр его группы}.
+
+    Кадры просматриваются в порядке списка; кадр, не похожий ни на один
+    представитель, сам становится представителем новой группы. Поэтому
+    кадры группы отличаются от представителя не больше чем на radius бит.
+    """
+    representatives = BKTree()
+    leader = {}
+    for path in files:
+        value = hashes.get(path.name)
+        if value is None:
+            continue
+        matches = representatives.query(value, radius)
+        if matches:
+            leader[path] = min(matches, key=lambda match: match[0])[1]
+        else:
+            representatives.add(value, path)
+            leader[path] = path
+    return leader
+
+
+def group_members(leaders):
+    """{первый кадр группы: [кадры группы]}"""
+    groups = {}
+    for path, leader in leaders.items():
+        groups.setdefault(leader, []).append(path)
+    return groups
+
+
+class HashCache:
+    """Хэши изображений задачи по имени файла, mtime и размеру"""
+
+    def __init__(self, task_path):
+        self.path = Path(task_path) / CACHE_FILENAME
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if isinstance(data, dict) and data.get("version") == CACHE_VERSION:
+            self.entries = {
+                name: tuple(entry) for name, entry in data.get("entries", {}).items()
+                if isinstance(entry, list) and len(entry) == 3
+            }
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_file = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_file, 'w', encoding="utf-8") as f:
+                json.dump(
+                    {"version": CACHE_VERSION, "entries": self.entries}, f, separators=(",", ":")
+                )
+            os.replace(tmp_file, self.path)
+        except OSError:
+            return
+        self.dirty = False
+
+    def lookup(self, name, st):
+        entry = self.entries.get(name)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        return None
+
+    def store(self, name, st, value):
+        self.entries[name] = (st.st_mtime_ns, st.st_size, value)
+        self.dirty = True
+
+
+class DuplicateIndexer:
+    """Фоновый расчёт хэшей и групп похожих кадров задачи.
+
+    Хэши из кэша берутся сразу, остальные считаются пулом потоков
+    (декодирование JPEG в PIL отпускает GIL). По окончании в том же потоке
+    строятся группы, а кэш сохраняется на диск; главный поток только
+    проверяет progress() и забирает leaders.
+    """
+
+    def __init__(self, task_path, files, radius, workers=None):
+        self.cache = HashCache(task_path)
+        self.files = list(files)
+        self.radius = radius
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.hashes = {}
+        self.leaders = None
+        self.done = 0
+        self.cancelled = False
+        self.finished = False
+        self._thread = threading.Thread(target=self._run, name="dhash-index", daemon=True)
+        self._thread.start()
+
+    def _hash(self, path):
+        if self.cancelled:
+            return path, None, None
+        try:
+            st = os.stat(path)
+            cached = self.cache.lookup(path.name, st)
+            if cached is not None:
+                return path, st, cached
+            return path, st, dhash(path)
+        except Exception:  # noqa: BLE001
+            # DecompressionBombError и ошибки декодера одного файла не должны останавливать поток
+            return path, None, None
+
+    def _run(self):
+        self.cache.load()
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            # Задачи ставятся порциями, чтобы не держать в памяти future на каждый файл
+            for offset in range(0, len(self.files), 1024):
+                if self.cancelled:
+                    return
+                for path, st, value in pool.map(self._hash, self.files[offset:offset + 1024]):
+                    self.done += 1
+                    if value is None:
+                        continue
+                    if self.cache.lookup(path.name, st) is None:
+                        self.cache.store(path.name, st, value)
+                    self.hashes[path.name] = value
+        if self.cancelled:
+            return
+        stale = self.cache.entries.keys() - {path.name for path in self.files}
+        for name in stale:
+            del self.cache.entries[name]
+        self.cache.dirty = self.cache.dirty or bool(stale)
+        self.cache.save()
+        self.leaders = build_clusters(self.files, self.hashes, self.radius)
+        self.finished = True
+
+    def progress(self):
+        return self.done, len(self.files)
+
+    def cancel(self):
+        self.cancelled = True
@@ -0,0 +1,196 @@
+import json
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+JOURNAL_FILENAME = ".export_journal"
+
+
+def index_labeled_pairs(src_dir, extensions):
+    """Один проход по каталогу: пары (изображение, .txt) с общим именем.
+
+    Расширения сравниваются без учёта регистра, как exists() в Windows и
+    macOS. При нескольких изображениях с одним именем выбирается расширение,
+    стоящее раньше в extensions, как и при поочерёдной проверке exists().
+    """
+    images = {}
+    labels = []
+    rank = {ext: i for i, ext in enumerate(extensions)}
+    try:
+        it = os.scandir(src_dir)
+    except OSError:
+        return []
+    with it:
+        for entry in it:
+            name = entry.name
+            stem, ext = os.path.splitext(name)
+            if ext == ".txt":
+                labels.append(stem)
+            elif ext.lower() in rank:
+                # Расширение сравнивается без учёта регистра (photo.JPG), имя файла остаётся как есть
+                current = images.get(stem)
+                if current is None or rank[ext.lower()] < rank[os.path.splitext(current)[1].lower()]:
+                    images[stem] = name
+    return [(images[stem], f"{stem}.txt") for stem in labels if stem in images]
+
+
+def move_file(src, dst, same_device):
+    """Перемещает файл: rename в пределах устройства, иначе копия с атомарной подменой"""
+    if same_device:
+        os.replace(src, dst)
+        return
+    tmp_file = f"{dst}.tmp"
+    shutil.copy2(src, tmp_file)
+    with open(tmp_file, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_file, dst)
+    os.unlink(src)
+
+
+def roll_forward(pair, same_device=None):
+    """Доводит перенос пары до конца; повторный вызов безопасен"""
+    moved = 0
+    for src, dst in pair:
+        if os.path.exists(src):
+            if same_device is None:
+                same = os.stat(os.path.dirname(src)).st_dev == os.stat(os.path.dirname(dst)).st_dev
+            else:
+                same = same_device
+            size = os.path.getsize(src)
+            move_file(src, dst, same)
+            moved += size
+    return moved
+
+
+class ExportReport:
+    def __init__(self, pairs=0, resumed=0, size=0, seconds=0.0):
+        self.pairs = pairs
+        self.resumed = resumed
+        self.size = size
+        self.seconds = seconds
+
+    @property
+    def pairs_per_second(self):
+        return self.pairs / self.seconds if self.seconds else 0.0
+
+    @property
+    def megabytes_per_second(self):
+        return self.size / 1024 / 1024 / self.seconds if self.seconds else 0.0
+
+
+class ExportJob:
+    """Перенос размеченных изображений с журналом для продолжения после сбоя.
+
+    Перед переносом в журнал Result/.export_journal записывается план (пары
+    исходных и целевых путей), после переноса пары — отметка о завершении.
+    Незавершённые пары при следующем запуске доводятся до конца, так что
+    изображение и его .txt всегда оказываются в одном каталоге.
+    """
+
+    def __init__(self, tasks_root, task_names, result_root, extensions, workers=4):
+        self.tasks_root = Path(tasks_root)
+        self.task_names = list(task_names)
+        self.result_root = Path(result_root)
+        self.extensions = tuple(extensions)
+        self.workers = workers
+        self.journal_path = self.result_root / JOURNAL_FILENAME
+
+    def resume(self):
+        """Завершает прерванный перенос по журналу, возвращает число пар"""
+        if not self.journal_path.exists():
+            return 0
+        planned = {}
+        done = set()
+        with open(self.journal_path, 'r', encoding="utf-8") as f:
+            for line in f:
+                kind, _, payload = line.rstrip("\n").partition("\t")
+                try:
+                    if kind == "P":
+                        entry = json.loads(payload)
+                        planned[entry["i"]] = entry["pair"]
+                    elif kind == "D":
+                        done.add(int(payload))
+                except (ValueError, KeyError):
+                    # Последняя строка могла быть записана не полностью
+                    continue
+        resumed = 0
+        for idx, pair in planned.items():
+            if idx not in done:
+                roll_forward(pair)
+                resumed += 1
+        self.journal_path.unlink()
+        return resumed
+
+    def plan(self):
+        """Список пар для переноса: ((src, dst) изображения, (src, dst) метки)"""
+        pairs = []
+        for task_name in self.task_names:
+            src_dir = self.tasks_root / task_name / "images"
+            dst_dir = self.result_root / task_name
+            dst_dir.mkdir(parents=True, exist_ok=True)
+            for image_name, label_name in index_labeled_pairs(src_dir, self.extensions):
+                pairs.append((
+                    (str(src_dir / image_name), str(dst_dir / image_name)),
+                    (str(src_dir / label_name), str(dst_dir / label_name)),
+                ))
+        return pairs
+
+    def run(self, progress=None):
+        """Выполняет перенос; progress(done, total) вызывается из рабочего потока"""
+        started = time.perf_counter()
+        self.result_root.mkdir(parents=True, exist_ok=True)
+        resumed = self.resume()
+        pairs = self.plan()
+        total = len(pairs)
+        if progress:
+            progress(0, total)
+        if not pairs:
+            return ExportReport(0, resumed, 0, time.perf_counter() - started)
+
+        with open(self.journal_path, 'w', encoding="utf-8") as journal:
+            for idx, pair in enumerate(pairs):
+                journal.write(f"P\t{json.dumps({'i': idx, 'pair': pair})}\n")
+            journal.flush()
+            os.fsync(journal.fileno())
+
+            devices = {}
+
+            def same_device(pair):
+                src_dir = os.path.dirname(pair[0][0])
+                dst_dir = os.path.dirname(pair[0][1])
+                key = (src_dir, dst_dir)
+                if key not in devices:
+                    devices[key] = os.stat(src_dir).st_dev == os.stat(dst_dir).st_dev
+                return devices[key]
+
+            moved_bytes = 0
+            completed = 0
+            local = [(i, p) for i, p in enumerate(pairs) if same_device(p)]
+            remote = [(i, p) for i, p in enumerate(pairs) if not same_device(p)]
+
+            def finish(idx, size):
+                nonlocal moved_bytes, completed
+                journal.write(f"D\t{idx}\n")
+                moved_bytes += size
+                completed += 1
+                if completed % 256 == 0:
+                    journal.flush()
+                if progress:
+                    progress(completed, total)
+
+            for idx, pair in local:
+                finish(idx, roll_forward(pair, True))
+
+            if remote:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    futures = {
+                        idx: pool.submit(roll_forward, pair, False) for idx, pair in remote
+                    }
+                    for idx, future in futures.items():
+                        finish(idx, future.result())
+
+        self.journal_path.unlink()
+        return ExportReport(completed, resumed, moved_bytes, time.perf_counter() - started)
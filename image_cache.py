@@ -0,0 +1,159 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+class CachedImage:
+    """Декодированное и отмасштабированное под холст изображение"""
+
+    __slots__ = ("path", "width", "height", "scale", "image")
+
+    def __init__(self, path, width, height, scale=1.0, image=None):
+        self.path = path
+        self.width = width
+        self.height = height
+        self.scale = scale
+        self.image = image
+
+
+def read_image_size(path):
+    """Возвращает размеры изображения, читая только заголовок файла"""
+    with Image.open(path) as img:
+        return img.size
+
+
+def decode_scaled(path, canvas_size, resample=Image.Resampling.LANCZOS):
+    """Декодирует изображение и вписывает его в размер холста.
+
+    JPEG декодируется в режиме draft сразу в уменьшенном масштабе, затем
+    целочисленный reduce() приближает размер к целевому, и только остаток
+    (меньше чем в 2 раза) обрабатывается фильтром resample.
+    """
+    canvas_w, canvas_h = canvas_size
+    with Image.open(path) as img:
+        width, height = img.size
+        scale = min(canvas_w / width, canvas_h / height)
+        new_w = max(1, int(width * scale))
+        new_h = max(1, int(height * scale))
+        if scale < 1 and img.format == "JPEG":
+            img.draft(img.mode, (new_w, new_h))
+        img.load()
+        display = img
+        factor = min(display.width // new_w, display.height // new_h)
+        if factor >= 2:
+            display = display.reduce(factor)
+        if display.size != (new_w, new_h):
+            display = display.resize((new_w, new_h), resample)
+        elif display is img:
+            display = img.copy()
+    return CachedImage(path, width, height, scale, display)
+
+
+def scale_preview(entry, canvas_size, resample=Image.Resampling.BILINEAR):
+    """Быстро пересчитывает уже отмасштабированное изображение под новый холст"""
+    canvas_w, canvas_h = canvas_size
+    scale = min(canvas_w / entry.width, canvas_h / entry.height)
+    new_w = max(1, int(entry.width * scale))
+    new_h = max(1, int(entry.height * scale))
+    return scale, entry.image.resize((new_w, new_h), resample)
+
+
+class ImageCache:
+    """Потокобезопасный LRU-кэш отмасштабированных изображений.
+
+    Ключ — путь, mtime файла и размер холста. Счётчики попаданий и промахов
+    позволяют подобрать глубину предзагрузки.
+    """
+
+    def __init__(self, capacity=8, max_workers=2):
+        self.capacity = max(1, capacity)
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="prefetch"
+        )
+
+    @staticmethod
+    def make_key(path, canvas_size):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        return str(path), mtime, tuple(canvas_size)
+
+    def _store(self, key, entry):
+        with self._lock:
+            self._pending.pop(key, None)
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def _decode(self, key, path, canvas_size):
+        try:
+            entry = decode_scaled(path, canvas_size)
+        except Exception:  # noqa: BLE001
+            with self._lock:
+                self._pending.pop(key, None)
+            raise
+        self._store(key, entry)
+        return entry
+
+    def get(self, path, canvas_size=None):
+        """Возвращает изображение из кэша или декодирует его синхронно"""
+        if canvas_size is None:
+            width, height = read_image_size(path)
+            return CachedImage(path, width, height)
+        key = self.make_key(path, canvas_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            future = self._pending.get(key)
+            self.misses += 1
+        if future is not None:
+            try:
+                return future.result()
+            except Exception:  # noqa: BLE001
+                pass
+        return self._decode(key, path, canvas_size)
+
+    def prefetch(self, paths, canvas_size):
+        """Ставит в очередь фоновое декодирование соседних изображений"""
+        for path in paths:
+            key = self.make_key(path, canvas_size)
+            with self._lock:
+                if key in self._entries or key in self._pending:
+                    continue
+                try:
+                    future = self._executor.submit(self._decode, key, path, canvas_size)
+                except RuntimeError:
+                    return
+                self._pending[key] = future
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Счётчики для подбора глубины предзагрузки"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+                "capacity": self.capacity,
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,223 @@
+"""Индекс метаданных изображений задачи без декодирования пикселей.
+
+Пример:
+    python image_meta.py job_1             # сводка по размерам и форматам
+    python image_meta.py job_1 --rotated   # список изображений с поворотом EXIF
+
+Размеры, формат, режим и ориентация EXIF читаются из заголовка файла и
+кэшируются в Tasks/<задача>/.image_meta.json по имени, mtime и размеру.
+Изображения с ориентацией EXIF, отличной от 1, отмечаются: программа
+разметки показывает пиксели как они записаны в файле, а многие загрузчики
+при обучении сначала поворачивают кадр, и рамки перестают совпадать.
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from PIL import Image
+
+
+META_FILENAME = ".image_meta.json"
+META_VERSION = 1
+EXIF_ORIENTATION = 0x0112
+
+
+class ImageMeta:
+    """Размеры, формат, режим и ориентация EXIF одного изображения"""
+
+    __slots__ = ("width", "height", "format", "mode", "orientation")
+
+    def __init__(self, width, height, format, mode, orientation=1):
+        self.width = width
+        self.height = height
+        self.format = format
+        self.mode = mode
+        self.orientation = orientation
+
+    @property
+    def rotated(self):
+        """Кадр при просмотре с учётом EXIF отличается от записанного в файле"""
+        return self.orientation not in (None, 0, 1)
+
+    @property
+    def display_size(self):
+        """Размеры после поворота по EXIF (ориентации 5–8 меняют ширину и высоту)"""
+        if self.orientation in (5, 6, 7, 8):
+            return self.height, self.width
+        return self.width, self.height
+
+
+def read_image_meta(path):
+    """Читает метаданные из заголовка файла, пиксели не декодируются"""
+    with Image.open(path) as img:
+        try:
+            orientation = img.getexif().get(EXIF_ORIENTATION, 1)
+        except Exception:  # noqa: BLE001
+            orientation = 1
+        return ImageMeta(img.width, img.height, img.format, img.mode, orientation)
+
+
+class ImageMetaIndex:
+    """Метаданные изображений задачи по имени файла, mtime и размеру.
+
+    get() берёт запись из кэша, если файл не менялся, иначе читает заголовок
+    и обновляет кэш; вызывается из любого потока. rotated — имена
+    изображений с поворотом EXIF.
+    """
+
+    def __init__(self, task_path):
+        self.path = Path(task_path) / META_FILENAME
+        self.entries = {}
+        self.rotated = set()
+        self.dirty = False
+        self._save_lock = threading.Lock()
+
+    def load(self):
+        """Читает кэш с диска; вызывается до того, как индексом начнут пользоваться другие потоки"""
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            data = None
+        if isinstance(data, dict) and data.get("version") == META_VERSION:
+            self.entries = {
+                name: tuple(entry) for name, entry in data.get("entries", {}).items()
+                if isinstance(entry, list) and len(entry) == 7
+            }
+        self.rotated = {name for name, entry in self.entries.items() if entry[6] not in (None, 0, 1)}
+        self.dirty = False
+        return self
+
+    def save(self):
+        with self._save_lock:
+            if not self.dirty:
+                return
+            self.dirty = False
+            tmp_file = self.path.with_name(self.path.name + ".tmp")
+            try:
+                with open(tmp_file, 'w', encoding="utf-8") as f:
+                    json.dump(
+                        {"version": META_VERSION, "entries": dict(self.entries)}, f, separators=(",", ":")
+                    )
+                os.replace(tmp_file, self.path)
+            except OSError:
+                self.dirty = True
+
+    def lookup(self, name, st):
+        entry = self.entries.get(name)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return ImageMeta(*entry[2:])
+        return None
+
+    def store(self, name, st, meta):
+        self.entries[name] = (
+            st.st_mtime_ns, st.st_size, meta.width, meta.height, meta.format, meta.mode, meta.orientation
+        )
+        if meta.rotated:
+            self.rotated.add(name)
+        else:
+            self.rotated.discard(name)
+        self.dirty = True
+
+    def get(self, path):
+        """Метаданные изображения или None, если файл не читается"""
+        path = Path(path)
+        try:
+            st = os.stat(path)
+            meta = self.lookup(path.name, st)
+            if meta is None:
+                meta = read_image_meta(path)
+                self.store(path.name, st, meta)
+            return meta
+        except Exception:  # noqa: BLE001
+            # DecompressionBombError и ошибки разбора заголовка — тот же нечитаемый файл
+            return None
+
+    def prune(self, names):
+        """Удаляет записи изображений, которых нет среди names"""
+        stale = self.entries.keys() - set(names)
+        for name in stale:
+            del self.entries[name]
+            self.rotated.discard(name)
+        self.dirty = self.dirty or bool(stale)
+
+
+class MetadataIndexer:
+    """Фоновое заполнение загруженного индекса метаданных по списку изображений задачи.
+
+    Заголовки читаются пулом потоков порциями; по окончании устаревшие
+    записи удаляются, индекс сохраняется и выставляется finished.
+    """
+
+    def __init__(self, index, files, workers=None):
+        self.index = index
+        self.files = list(files)
+        self.workers = workers or min(8, os.cpu_count() or 1)
+        self.done = 0
+        self.cancelled = False
+        self.finished = False
+        self._thread = threading.Thread(target=self._run, name="image-meta", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for offset in range(0, len(self.files), 1024):
+                if self.cancelled:
+                    return
+                for _ in pool.map(self.index.get, self.files[offset:offset + 1024]):
+                    self.done += 1
+        if self.cancelled:
+            return
+        self.index.prune(path.name for path in self.files)
+        self.index.save()
+        self.finished = True
+
+    def progress(self):
+        return self.done, len(self.files)
+
+    def wait(self):
+        self._thread.join()
+
+    def cancel(self):
+        self.cancelled = True
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Метаданные изображений задачи")
+    parser.add_argument("task", help="имя задачи")
+    parser.add_argument("--tasks-root", default="Tasks")
+    parser.add_argument("--rotated", action="store_true", help="вывести изображения с поворотом EXIF")
+    args = parser.parse_args(argv)
+
+    from labeler_core import Task
+
+    task = Task(args.tasks_root, args.task)
+    if not task.image_path.is_dir():
+        parser.error(f"не найден каталог {task.image_path}")
+    files = task.list_images()
+    indexer = MetadataIndexer(ImageMetaIndex(task.task_path).load(), files)
+    indexer.wait()
+    index = indexer.index
+
+    if args.rotated:
+        for name in sorted(index.rotated):
+            print(f"{name}\tориентация {index.entries[name][6]}")
+        return 0
+    sizes = Counter((entry[2], entry[3]) for entry in index.entries.values())
+    formats = Counter(f"{entry[4]} {entry[5]}" for entry in index.entries.values())
+    print(f"Изображений: {len(index.entries)}")
+    print("Размеры: " + ", ".join(f"{w}x{h} ({count})" for (w, h), count in sizes.most_common(5)))
+    print("Форматы: " + ", ".join(f"{name} ({count})" for name, count in formats.most_common()))
+    print(f"С поворотом EXIF: {len(index.rotated)}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
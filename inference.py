@@ -0,0 +1,381 @@
+import itertools
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+
+PRIORITY_CURRENT = 0
+PRIORITY_WARMUP = 1
+PRIORITY_SPECULATIVE = 2
+
+BACKEND_ULTRALYTICS = "ultralytics"
+BACKEND_ONNX = "onnx"
+BACKEND_ONNX_INT8 = "onnx-int8"
+
+
+def load_yolo(model_path):
+    from ultralytics import YOLO
+    return YOLO(str(model_path))
+
+
+def estimate_model_bytes(model, model_path):
+    """Оценка памяти модели: по параметрам torch, иначе по размеру файла"""
+    try:
+        module = getattr(model, "model", model)
+        total = sum(p.numel() * p.element_size() for p in module.parameters())
+        if total:
+            return total
+    except Exception:  # noqa: BLE001
+        pass
+    try:
+        return os.path.getsize(model_path)
+    except OSError:
+        return 0
+
+
+class ModelCache:
+    """Ограниченный кэш загруженных моделей с вытеснением LRU.
+
+    Ограничение задаётся числом моделей и, при необходимости, бюджетом памяти
+    в мегабайтах. Для каждой модели запоминается время загрузки и прогрева.
+    """
+
+    def __init__(self, loader=None, max_models=2, memory_budget_mb=None, warmup_size=640,
+                 onnx_threads=None):
+        self.loader = loader or self.load_backend
+        self.max_models = max(1, max_models)
+        self.memory_budget = memory_budget_mb * 1024 * 1024 if memory_budget_mb else None
+        self.warmup_size = warmup_size
+        self.onnx_threads = onnx_threads
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.load_times = {}
+        self.warmup_times = {}
+        self.fallbacks = {}
+        self._models = OrderedDict()
+        self._sizes = {}
+        self._warmed = set()
+        self._lock = threading.RLock()
+
+    def load_backend(self, model_path, backend=BACKEND_ULTRALYTICS):
+        """Загружает модель выбранным бэкендом; при сбое ONNX — через ultralytics"""
+        if backend in (BACKEND_ONNX, BACKEND_ONNX_INT8):
+            try:
+                from onnx_backend import load_onnx_detector
+                return load_onnx_detector(
+                    model_path,
+                    quantize=backend == BACKEND_ONNX_INT8,
+                    intra_op_threads=self.onnx_threads,
+                )
+            except Exception as exc:  # noqa: BLE001
+                with self._lock:
+                    self.fallbacks[str(model_path)] = exc
+        return load_yolo(model_path)
+
+    @staticmethod
+    def _key(model_path, backend):
+        try:
+            mtime = os.stat(model_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        return str(model_path), mtime, backend
+
+    def get(self, model_path, backend=BACKEND_ULTRALYTICS):
+        """Возвращает модель, загружая её при первом обращении"""
+        key = self._key(model_path, backend)
+        with self._lock:
+            model = self._models.get(key)
+            if model is not None:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return model
+            self.misses += 1
+        # Загрузка идёт без блокировки, чтобы stats() и retain() не ждали её
+        started = time.perf_counter()
+        model = self.loader(model_path, backend)
+        size = estimate_model_bytes(model, model_path)
+        with self._lock:
+            self.load_times[str(model_path)] = time.perf_counter() - started
+            self._models[key] = model
+            self._sizes[key] = size
+            self._evict(keep=key)
+        return model
+
+    def warm_up(self, model_path, device=None, backend=BACKEND_ULTRALYTICS):
+        """Загружает модель и прогоняет пустое изображение для прогрева"""
+        model = self.get(model_path, backend)
+        key = self._key(model_path, backend)
+        with self._lock:
+            if key in self._warmed:
+                return model
+        started = time.perf_counter()
+        if hasattr(model, "warm_up"):
+            model.warm_up()
+        else:
+            import numpy as np
+            dummy = np.zeros((self.warmup_size, self.warmup_size, 3), dtype=np.uint8)
+            predict_kwargs = {"source": dummy, "verbose": False}
+            if device:
+                predict_kwargs["device"] = device
+            model.predict(**predict_kwargs)
+        with self._lock:
+            self.warmup_times[str(model_path)] = time.perf_counter() - started
+            self._warmed.add(key)
+        return model
+
+    def _evict(self, keep=None):
+        def over_budget():
+            if len(self._models) > self.max_models:
+                return True
+            if self.memory_budget is None:
+                return False
+            return sum(self._sizes.values()) > self.memory_budget
+
+        while over_budget():
+            victim = next((key for key in self._models if key != keep), None)
+            if victim is None:
+                break
+            self._drop(victim)
+            self.evictions += 1
+
+    def _drop(self, key):
+        self._models.pop(key, None)
+        self._sizes.pop(key, None)
+        self._warmed.discard(key)
+
+    def retain(self, model_paths):
+        """Освобождает модели, не входящие в model_paths (например, при смене задачи)"""
+        keep = {str(path) for path in model_paths}
+        with self._lock:
+            released = [key for key in self._models if key[0] not in keep]
+            for key in released:
+                self._drop(key)
+        if released:
+            release_device_memory()
+        return len(released)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": [key[0] for key in self._models],
+                "memory_bytes": sum(self._sizes.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "load_times": dict(self.load_times),
+                "warmup_times": dict(self.warmup_times),
+                "fallbacks": {path: str(exc) for path, exc in self.fallbacks.items()},
+            }
+
+
+def release_device_memory():
+    try:
+        import torch
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+    except Exception:  # noqa: BLE001
+        pass
+
+
+class DetectionRequest:
+    """Запрос на поиск объектов на одном изображении.
+
+    Запрос с warmup=True только загружает и прогревает модель.
+    """
+
+    def __init__(self, image_path, model_path, conf, iou, device=None,
+                 auto_triggered=False, speculative=False, warmup=False,
+                 backend=BACKEND_ULTRALYTICS, tiling=None):
+        self.image_path = image_path
+        # Параметры поиска по фрагментам (словарь для predict_tiled) или None
+        self.tiling = tiling
+        self.model_path = model_path
+        self.backend = backend
+        self.conf = conf
+        self.iou = iou
+        self.device = device
+        self.auto_triggered = auto_triggered
+        self.speculative = speculative
+        self.warmup = warmup
+        self.cancelled = False
+
+    @property
+    def key(self):
+        try:
+            mtime = os.stat(self.image_path).st_mtime_ns
+        except OSError:
+            mtime = None
+        return (
+            str(self.image_path), mtime, str(self.model_path),
+            round(self.conf, 4), round(self.iou, 4), self.device, self.backend,
+            tuple(sorted(self.tiling.items())) if self.tiling else None,
+        )
+
+
+class DetectionResult:
+    """Результат модели: координаты xyxy и номера классов либо ошибка.
+
+    stage указывает, на каком шаге возникла ошибка: "load" или "predict".
+    """
+
+    def __init__(self, request, coordinates=None, class_ids=None, error=None, stage=None):
+        self.request = request
+        self.coordinates = coordinates or []
+        self.class_ids = class_ids or []
+        self.error = error
+        self.stage = stage
+
+
+def run_prediction(model, request):
+    """Вызывает model.predict и возвращает списки координат и классов"""
+    if request.tiling:
+        from tiling import predict_tiled
+        return predict_tiled(
+            model, request.image_path, request.conf, request.iou, request.device,
+            **request.tiling,
+        )
+    if hasattr(model, "detect"):
+        return model.detect(request.image_path, request.conf, request.iou)
+    predict_kwargs = {
+        "source": str(request.image_path),
+        "conf": float(request.conf),
+        "iou": float(request.iou),
+        "verbose": False,
+    }
+    if request.device:
+        predict_kwargs["device"] = request.device
+    results = model.predict(**predict_kwargs)
+    if not results:
+        return [], []
+    boxes = getattr(results[0], "boxes", None)
+    if boxes is None or len(boxes) == 0:
+        return [], []
+    coordinates = boxes.xyxy.tolist()
+    class_ids = boxes.cls.tolist() if boxes.cls is not None else []
+    return coordinates, class_ids
+
+
+class InferenceWorker:
+    """Фоновый поток для загрузки моделей и поиска объектов.
+
+    Запросы обрабатываются по приоритету: текущее изображение раньше
+    спекулятивных запросов для следующих кадров. Устаревшие запросы
+    отменяются при навигации, а готовые результаты забираются главным
+    потоком через poll() из цикла root.after.
+    """
+
+    def __init__(self, models, predict=run_prediction, max_cached_results=64):
+        self.models = models
+        self.predict = predict
+        self.max_cached_results = max_cached_results
+        self._requests = queue.PriorityQueue()
+        self._results = queue.Queue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._queued = {}
+        self._cache = OrderedDict()
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="inference", daemon=True)
+        self._thread.start()
+
+    def preload(self, model_path, device=None, backend=BACKEND_ULTRALYTICS):
+        """Ставит фоновую загрузку и прогрев модели"""
+        request = DetectionRequest(
+            None, model_path, 0.0, 0.0, device=device, warmup=True, backend=backend
+        )
+        self._requests.put((PRIORITY_WARMUP, next(self._counter), request))
+        return request
+
+    def submit(self, request):
+        """Ставит запрос в очередь; повторный запрос того же кадра не дублируется"""
+        key = request.key
+        with self._lock:
+            existing = self._queued.get(key)
+            if existing is not None and not existing.cancelled:
+                if existing.speculative and not request.speculative:
+                    # Текущий кадр важнее спекулятивного запроса с тем же ключом
+                    existing.cancelled = True
+                else:
+                    if not request.speculative:
+                        existing.auto_triggered = request.auto_triggered
+                    return existing
+            self._queued[key] = request
+        priority = PRIORITY_SPECULATIVE if request.speculative else PRIORITY_CURRENT
+        self._requests.put((priority, next(self._counter), request))
+        return request
+
+    def cached(self, request):
+        """Готовый результат для запроса, если он уже был посчитан"""
+        with self._lock:
+            result = self._cache.get(request.key)
+            if result is not None:
+                self._cache.move_to_end(request.key)
+            return result
+
+    def cancel_stale(self, keep_paths):
+        """Отменяет запросы для изображений, с которых ушёл пользователь"""
+        keep = {str(path) for path in keep_paths}
+        with self._lock:
+            for request in self._queued.values():
+                if str(request.image_path) not in keep:
+                    request.cancelled = True
+
+    def poll(self):
+        """Забирает готовые результаты без блокировки"""
+        results = []
+        while True:
+            try:
+                results.append(self._results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def _loop(self):
+        while self._running:
+            _, _, request = self._requests.get()
+            if request is None:
+                break
+            if request.warmup:
+                if not request.cancelled:
+                    try:
+                        self.models.warm_up(request.model_path, request.device, request.backend)
+                    except Exception:  # noqa: BLE001
+                        pass
+                continue
+            key = request.key
+            with self._lock:
+                if self._queued.get(key) is request:
+                    del self._queued[key]
+            if request.cancelled:
+                continue
+            cached = self.cached(request)
+            if cached is not None:
+                if not request.speculative:
+                    self._results.put(
+                        DetectionResult(request, cached.coordinates, cached.class_ids)
+                    )
+                continue
+            try:
+                model = self.models.get(request.model_path, request.backend)
+            except Exception as exc:  # noqa: BLE001
+                model = None
+                result = DetectionResult(request, error=exc, stage="load")
+            if model is not None:
+                try:
+                    coordinates, class_ids = self.predict(model, request)
+                    result = DetectionResult(request, coordinates, class_ids)
+                except Exception as exc:  # noqa: BLE001
+                    result = DetectionResult(request, error=exc, stage="predict")
+            if result.error is None:
+                with self._lock:
+                    self._cache[key] = result
+                    while len(self._cache) > self.max_cached_results:
+                        self._cache.popitem(last=False)
+            if not request.speculative:
+                self._results.put(result)
+
+    def shutdown(self):
+        self._running = False
+        self._requests.put((-1, -1, None))
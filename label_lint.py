@@ -0,0 +1,422 @@
+"""Проверка файлов разметки задачи.
+
+Пример:
+    python label_lint.py job_1            # отчёт по мере проверки
+    python label_lint.py job_1 --fix      # с безопасными исправлениями
+
+Проверяются все images/*.txt: строки не из 5 чисел, номера классов вне
+classes.txt, координаты за пределами [0, 1], рамки нулевой площади,
+повторяющиеся рамки и файлы без изображения. Файлы делятся на порции и
+проверяются пулом процессов; результат для неизменённых файлов (по mtime и
+размеру) берётся из Tasks/<задача>/.lint_cache.json.
+
+Безопасное исправление удаляет некорректные строки, рамки нулевой площади и
+повторы, а выходящие за кадр рамки обрезает по его границе. Номера классов
+и файлы без изображения не исправляются: для них нужно решение человека.
+"""
+
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import sys
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+from label_writer import atomic_write_text
+from task_layout import SUPPORTED_EXTENSIONS
+
+
+CACHE_FILENAME = ".lint_cache.json"
+CACHE_VERSION = 1
+EPSILON = 1e-6
+
+MALFORMED = "malformed"
+CLASS_ID = "class_id"
+OUT_OF_RANGE = "out_of_range"
+DEGENERATE = "degenerate"
+DUPLICATE = "duplicate"
+ORPHAN = "orphan"
+FIXABLE = {MALFORMED, OUT_OF_RANGE, DEGENERATE, DUPLICATE}
+
+KIND_TITLES = {
+    MALFORMED: "некорректная строка",
+    CLASS_ID: "неизвестный класс",
+    OUT_OF_RANGE: "рамка за пределами кадра",
+    DEGENERATE: "рамка нулевой площади",
+    DUPLICATE: "повтор рамки",
+    ORPHAN: "нет изображения",
+}
+
+
+def lint_text(text, class_count):
+    """Проверяет содержимое файла YOLO.
+
+    Возвращает список (номер строки, вид, сообщение) и исправленный текст
+    либо None, если исправлять нечего. class_count=0 отключает проверку классов.
+    """
+    issues = []
+    output = []
+    changed = False
+    seen = set()
+    for line_no, line in enumerate(text.splitlines(), 1):
+        parts = line.split()
+        if not parts:
+            continue
+        try:
+            if len(parts) != 5:
+                raise ValueError
+            values = [float(value) for value in parts]
+            if not all(math.isfinite(value) for value in values):
+                raise ValueError
+        except ValueError:
+            issues.append((line_no, MALFORMED, f"ожидалось 5 чисел: {line.strip()[:60]}"))
+            changed = True
+            continue
+        class_value, cx, cy, w, h = values
+        class_id = int(class_value)
+        if class_value != class_id or class_id < 0 or (class_count and class_id >= class_count):
+            issues.append((line_no, CLASS_ID, f"класс {parts[0]} при {class_count} классах"))
+        if w <= EPSILON or h <= EPSILON:
+            issues.append((line_no, DEGENERATE, f"ширина {w:g}, высота {h:g}"))
+            changed = True
+            continue
+        x1, y1, x2, y2 = cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2
+        if min(x1, y1) < -EPSILON or max(x2, y2) > 1 + EPSILON:
+            issues.append((line_no, OUT_OF_RANGE, f"рамка ({x1:.4f}, {y1:.4f}, {x2:.4f}, {y2:.4f})"))
+            x1, y1 = max(0.0, x1), max(0.0, y1)
+            x2, y2 = min(1.0, x2), min(1.0, y2)
+            changed = True
+            if x2 - x1 <= EPSILON or y2 - y1 <= EPSILON:
+                continue
+            line = (
+                f"{parts[0]} {(x1 + x2) / 2:.6f} {(y1 + y2) / 2:.6f} {x2 - x1:.6f} {y2 - y1:.6f}"
+            )
+        key = (class_value, round(x1, 5), round(y1, 5), round(x2, 5), round(y2, 5))
+        if key in seen:
+            issues.append((line_no, DUPLICATE, "такая же рамка уже есть выше"))
+            changed = True
+            continue
+        seen.add(key)
+        output.append(line.strip())
+    if not changed:
+        return issues, None
+    return issues, "".join(f"{line}\n" for line in output)
+
+
+def replace_if_unchanged(path, text, st):
+    """Атомарно заменяет файл текстом (пустой удаляет), если он не менялся после stat st.
+
+    Возвращает False, если файл успели изменить: правка, сохранённая после
+    чтения, не затирается.
+    """
+    tmp_file = path + ".tmp"
+    if text:
+        with open(tmp_file, 'w') as f:
+            f.write(text)
+    try:
+        current = os.stat(path)
+        if (current.st_mtime_ns, current.st_size) != (st.st_mtime_ns, st.st_size):
+            return False
+        if text:
+            os.replace(tmp_file, path)
+        else:
+            os.unlink(path)
+        return True
+    finally:
+        if text and os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+
+
+def lint_files(image_dir, names, class_count, fix=False):
+    """Проверяет порцию файлов (выполняется в процессе пула).
+
+    Возвращает список (имя, mtime_ns, размер, замечания, исправлено); после
+    исправления замечания относятся к новому тексту, mtime_ns None — файл удалён.
+    Файл, изменённый во время проверки, не исправляется.
+    """
+    results = []
+    for name in names:
+        path = os.path.join(image_dir, name)
+        try:
+            # stat до чтения: если файл изменят после него, кэш просто устареет
+            st = os.stat(path)
+            with open(path, 'r', encoding="utf-8", errors="replace") as f:
+                text = f.read()
+        except OSError:
+            continue
+        issues, fixed_text = lint_text(text, class_count)
+        fixed = 0
+        if fix and fixed_text is not None:
+            try:
+                replaced = replace_if_unchanged(path, fixed_text, st)
+            except OSError:
+                replaced = False
+            if replaced:
+                # Номера строк после исправления сдвигаются, поэтому текст проверяется заново
+                remaining, _ = lint_text(fixed_text, class_count)
+                fixed = len(issues) - len(remaining)
+                issues = remaining
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    results.append((name, None, None, issues, fixed))
+                    continue
+        results.append((name, st.st_mtime_ns, st.st_size, issues, fixed))
+    return results
+
+
+class LintCache:
+    """Замечания по файлам разметки с их mtime и размером; сбрасывается при смене числа классов"""
+
+    def __init__(self, task_path, class_count):
+        self.path = Path(task_path) / CACHE_FILENAME
+        self.class_count = class_count
+        self.entries = {}
+        self.dirty = False
+
+    def load(self):
+        self.entries = {}
+        try:
+            with open(self.path, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return self
+        if (
+            isinstance(data, dict)
+            and data.get("version") == CACHE_VERSION
+            and data.get("class_count") == self.class_count
+        ):
+            self.entries = {
+                name: (entry[0], entry[1], [tuple(issue) for issue in entry[2]])
+                for name, entry in data.get("entries", {}).items()
+                if isinstance(entry, list) and len(entry) == 3
+            }
+        return self
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_file = self.path.with_name(self.path.name + ".tmp")
+        try:
+            with open(tmp_file, 'w', encoding="utf-8") as f:
+                json.dump(
+                    {"version": CACHE_VERSION, "class_count": self.class_count, "entries": self.entries},
+                    f, ensure_ascii=False, separators=(",", ":"),
+                )
+            os.replace(tmp_file, self.path)
+        except OSError:
+            return
+        self.dirty = False
+
+    def lookup(self, name, st):
+        entry = self.entries.get(name)
+        if entry and entry[0] == st.st_mtime_ns and entry[1] == st.st_size:
+            return entry[2]
+        return None
+
+    def store(self, name, mtime_ns, size, issues):
+        if mtime_ns is None:
+            self.entries.pop(name, None)
+        else:
+            self.entries[name] = (mtime_ns, size, issues)
+        self.dirty = True
+
+
+class LintReport:
+    """Итог проверки: замечания по файлам и счётчики"""
+
+    def __init__(self):
+        self.issues = {}
+        self.kinds = Counter()
+        self.files = 0
+        self.cached = 0
+        self.fixed = 0
+
+    def add(self, name, issues, fixed=0, cached=False):
+        self.files += 1
+        self.cached += cached
+        self.fixed += fixed
+        if issues:
+            self.issues[name] = issues
+            self.kinds.update(kind for _, kind, _ in issues)
+
+    def to_dict(self):
+        return {
+            "files": self.files,
+            "cached": self.cached,
+            "fixed": self.fixed,
+            "kinds": dict(self.kinds),
+            "issues": {
+                name: [{"line": line, "kind": kind, "message": message} for line, kind, message in issues]
+                for name, issues in sorted(self.issues.items())
+            },
+        }
+
+
+class LabelLinter:
+    """Проверка всех файлов разметки задачи с потоковой выдачей результатов.
+
+    run() — генератор (имя, замечания, исправлено) в порядке готовности:
+    сначала файлы без изображения и неизменённые файлы из кэша, затем
+    порции, проверенные пулом процессов. По окончании заполнен report.
+    """
+
+    def __init__(self, task_path, class_count, fix=False, workers=None, chunk_size=2000):
+        self.task_path = Path(task_path)
+        self.image_dir = self.task_path / "images"
+        self.class_count = class_count
+        self.fix = fix
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.report = LintReport()
+        self.total = None
+        self.done = 0
+        self.cancelled = False
+
+    def _scan(self):
+        labels = []
+        image_stems = set()
+        with os.scandir(self.image_dir) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext == ".txt":
+                    labels.append(entry.name)
+                elif ext.lower() in SUPPORTED_EXTENSIONS:
+                    image_stems.add(stem)
+        return labels, image_stems
+
+    def _emit(self, name, issues, fixed=0, cached=False):
+        self.done += 1
+        self.report.add(name, issues, fixed, cached)
+        return name, issues, fixed
+
+    def run(self):
+        cache = LintCache(self.task_path, self.class_count).load()
+        labels, image_stems = self._scan()
+        self.total = len(labels)
+        pending = []
+        for name in labels:
+            if name[:-4] not in image_stems:
+                yield self._emit(name, [(0, ORPHAN, "нет изображения с таким именем")])
+                continue
+            try:
+                st = os.stat(self.image_dir / name)
+            except OSError:
+                self.total -= 1
+                continue
+            issues = cache.lookup(name, st)
+            if issues is not None and not (self.fix and any(issue[1] in FIXABLE for issue in issues)):
+                yield self._emit(name, issues, cached=True)
+            else:
+                pending.append(name)
+
+        if pending:
+            chunks = [
+                pending[offset:offset + self.chunk_size]
+                for offset in range(0, len(pending), self.chunk_size)
+            ]
+            # spawn, как в Windows: программа разметки запускает проверку из потока рядом с Tk
+            with ProcessPoolExecutor(
+                max_workers=min(self.workers, len(chunks)), mp_context=multiprocessing.get_context("spawn")
+            ) as pool:
+                futures = [
+                    pool.submit(lint_files, str(self.image_dir), chunk, self.class_count, self.fix)
+                    for chunk in chunks
+                ]
+                try:
+                    for future in as_completed(futures):
+                        if self.cancelled:
+                            break
+                        for name, mtime_ns, size, issues, fixed in future.result():
+                            cache.store(name, mtime_ns, size, issues)
+                            yield self._emit(name, issues, fixed)
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+        if not self.cancelled:
+            stale = cache.entries.keys() - set(labels)
+            for name in stale:
+                del cache.entries[name]
+            cache.dirty = cache.dirty or bool(stale)
+        cache.save()
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class LintRunner:
+    """Проверка в фоновом потоке для окна разметки: результаты забираются через drain()"""
+
+    def __init__(self, task_path, class_count, fix=False):
+        self.linter = LabelLinter(task_path, class_count, fix)
+        self.results = []
+        self.error = None
+        self.finished = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name="label-lint", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            for result in self.linter.run():
+                with self._lock:
+                    self.results.append(result)
+        except Exception as exc:  # noqa: BLE001
+            self.error = exc
+        self.finished = True
+
+    def drain(self):
+        with self._lock:
+            results, self.results = self.results, []
+        return results
+
+    def progress(self):
+        return self.linter.done, self.linter.total
+
+    def cancel(self):
+        self.linter.cancel()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Проверка файлов разметки задачи")
+    parser.add_argument("task", help="имя задачи")
+    parser.add_argument("--tasks-root", default="Tasks")
+    parser.add_argument("--fix", action="store_true", help="безопасно исправить то, что можно")
+    parser.add_argument("--workers", type=int, default=None, help="число процессов")
+    parser.add_argument("--json", dest="json_path", help="сохранить отчёт в JSON")
+    args = parser.parse_args(argv)
+
+    from labeler_core import Task
+
+    task = Task(args.tasks_root, args.task)
+    if not task.image_path.is_dir():
+        parser.error(f"не найден каталог {task.image_path}")
+    linter = LabelLinter(task.task_path, len(task.load_classes()), args.fix, args.workers)
+    for name, issues, fixed in linter.run():
+        for line, kind, message in issues:
+            print(f"{name}:{line}: {KIND_TITLES[kind]}: {message}")
+        if fixed:
+            print(f"{name}: исправлено замечаний: {fixed}")
+
+    report = linter.report
+    print(
+        f"Проверено файлов: {report.files} (из кэша {report.cached}), "
+        f"с замечаниями: {len(report.issues)}, исправлено замечаний: {report.fixed}",
+        file=sys.stderr,
+    )
+    for kind, count in report.kinds.most_common():
+        print(f"  {KIND_TITLES[kind]}: {count}", file=sys.stderr)
+    if args.json_path:
+        atomic_write_text(
+            args.json_path, json.dumps(report.to_dict(), ensure_ascii=False, indent=2) + "\n", fsync=False
+        )
+    return 1 if report.issues else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
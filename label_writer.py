@@ -0,0 +1,94 @@
+import os
+import threading
+from pathlib import Path
+
+
+def atomic_write_text(path, text, fsync=True):
+    """Записывает файл через временный файл и rename; text=None удаляет файл"""
+    path = Path(path)
+    if text is None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        return
+    tmp_file = path.with_name(path.name + ".tmp")
+    with open(tmp_file, 'w') as f:
+        f.write(text)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_file, path)
+
+
+class LabelWriter:
+    """Отложенная запись файлов разметки в фоновом потоке.
+
+    Повторные сохранения одного файла, ещё не записанного на диск,
+    объединяются: записывается только последнее содержимое. Пока запись не
+    выполнена, актуальный текст можно получить через pending().
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._inflight = {}
+        self._completed = []
+        self._condition = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="label-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, path, text):
+        """Ставит файл в очередь на запись (None — удалить)"""
+        with self._condition:
+            self._pending[Path(path)] = text
+            self._condition.notify_all()
+
+    def pending(self, path):
+        """(True, текст) для файла, ещё не записанного на диск, иначе (False, None)"""
+        path = Path(path)
+        with self._condition:
+            if path in self._pending:
+                return True, self._pending[path]
+            if path in self._inflight:
+                return True, self._inflight[path]
+        return False, None
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._closed:
+                    self._condition.wait()
+                if not self._pending:
+                    return
+                path = next(iter(self._pending))
+                text = self._pending.pop(path)
+                self._inflight[path] = text
+            error = None
+            try:
+                atomic_write_text(path, text)
+            except OSError as exc:
+                error = exc
+            with self._condition:
+                del self._inflight[path]
+                self._completed.append((path, error))
+                self._condition.notify_all()
+
+    def poll(self):
+        """Записанные файлы: список (путь, ошибка или None)"""
+        with self._condition:
+            completed, self._completed = self._completed, []
+        return completed
+
+    def flush(self):
+        """Дожидается записи всех файлов из очереди"""
+        with self._condition:
+            while self._pending or self._inflight:
+                self._condition.wait()
+
+    def shutdown(self):
+        self.flush()
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._thread.join()
@@ -0,0 +1,327 @@
+"""Ядро разметки без графического интерфейса.
+
+Задача (Task), чтение и запись разметки (LabelStore), пересчёт координат
+(Viewport), ограничение рамок и применение результатов модели. ImageLabeler —
+лишь представление поверх этих объектов, а скрипты и пулы процессов могут
+работать с ними напрямую: Task состоит из путей и передаётся в другой процесс
+как есть, LabelStore открывается в каждом процессе заново.
+
+Пример пакетной обработки:
+    task = Task("Tasks", "job_1")
+    store = LabelStore(task)
+    labels = store.load_many(task.list_images())
+    store.save_many((path.stem, boxes, w, h) for path, (boxes, w, h) in labels.items())
+    store.close()
+"""
+
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from annotation_store import AnnotationArray
+from export_engine import ExportJob
+from image_meta import ImageMetaIndex
+from label_writer import atomic_write_text
+from sqlite_store import SqliteAnnotationStore
+from task_layout import CLASSES_FILENAME, SUPPORTED_EXTENSIONS, AutoLabelRegistry, read_classes
+
+
+def class_color(name):
+    """Детерминированный цвет класса по его имени"""
+    h = hashlib.md5(name.encode()).hexdigest()
+    r = int(h[0:2], 16)
+    g = int(h[2:4], 16)
+    b = int(h[4:6], 16)
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def clamp_box(ann, image_width, image_height):
+    """Ограничивает рамку-словарь границами изображения (минимальный размер — 1 пиксель)"""
+    ann['x1'], ann['x2'] = sorted((ann['x1'], ann['x2']))
+    ann['y1'], ann['y2'] = sorted((ann['y1'], ann['y2']))
+    ann['x1'] = max(0, min(ann['x1'], image_width))
+    ann['x2'] = max(0, min(ann['x2'], image_width))
+    ann['y1'] = max(0, min(ann['y1'], image_height))
+    ann['y2'] = max(0, min(ann['y2'], image_height))
+    if ann['x1'] == ann['x2']:
+        if ann['x1'] >= image_width:
+            ann['x1'] = max(0, image_width - 1)
+            ann['x2'] = image_width
+        else:
+            ann['x2'] = min(image_width, ann['x1'] + 1)
+    if ann['y1'] == ann['y2']:
+        if ann['y1'] >= image_height:
+            ann['y1'] = max(0, image_height - 1)
+            ann['y2'] = image_height
+        else:
+            ann['y2'] = min(image_height, ann['y1'] + 1)
+
+
+class Viewport:
+    """Перевод координат изображения в координаты холста и обратно"""
+
+    def __init__(self, scale=1, offset_x=0, offset_y=0, image_width=0, image_height=0):
+        self.scale = scale
+        self.offset_x = offset_x
+        self.offset_y = offset_y
+        self.image_width = image_width
+        self.image_height = image_height
+
+    @classmethod
+    def centered(cls, image_size, scale, displayed_size, canvas_size):
+        """Изображение, отмасштабированное в scale раз и выровненное по центру холста"""
+        return cls(
+            scale,
+            (canvas_size[0] - displayed_size[0]) / 2,
+            (canvas_size[1] - displayed_size[1]) / 2,
+            image_size[0],
+            image_size[1],
+        )
+
+    def image_to_canvas(self, x, y):
+        return x * self.scale + self.offset_x, y * self.scale + self.offset_y
+
+    def canvas_to_image(self, x, y):
+        return (x - self.offset_x) / self.scale, (y - self.offset_y) / self.scale
+
+    def contains(self, x, y):
+        """Попадает ли точка холста на изображение"""
+        return (
+            self.offset_x <= x <= self.offset_x + self.image_width * self.scale
+            and self.offset_y <= y <= self.offset_y + self.image_height * self.scale
+        )
+
+    def clamp_canvas_point(self, x, y):
+        """Ограничивает точку холста пределами отображаемого изображения"""
+        x = max(self.offset_x, min(x, self.offset_x + self.image_width * self.scale))
+        y = max(self.offset_y, min(y, self.offset_y + self.image_height * self.scale))
+        return x, y
+
+    def zoomed(self, scale, anchor_x, anchor_y):
+        """Новый масштаб; точка изображения под (anchor_x, anchor_y) остаётся на месте"""
+        ix, iy = self.canvas_to_image(anchor_x, anchor_y)
+        return Viewport(
+            scale, anchor_x - ix * scale, anchor_y - iy * scale, self.image_width, self.image_height
+        )
+
+    def panned(self, dx, dy):
+        return Viewport(
+            self.scale, self.offset_x + dx, self.offset_y + dy, self.image_width, self.image_height
+        )
+
+    def clamped(self, canvas_w, canvas_h):
+        """Не даёт увести изображение с холста: меньшая холста сторона центрируется"""
+        offsets = []
+        for offset, image_size, canvas_size in (
+            (self.offset_x, self.image_width * self.scale, canvas_w),
+            (self.offset_y, self.image_height * self.scale, canvas_h),
+        ):
+            if image_size <= canvas_size:
+                offsets.append((canvas_size - image_size) / 2)
+            else:
+                offsets.append(min(0, max(offset, canvas_size - image_size)))
+        return Viewport(self.scale, *offsets, self.image_width, self.image_height)
+
+    def visible_rect(self, canvas_w, canvas_h):
+        """Видимая на холсте часть изображения (x0, y0, x1, y1) в его координатах или None"""
+        x0, y0 = self.canvas_to_image(0, 0)
+        x1, y1 = self.canvas_to_image(canvas_w, canvas_h)
+        x0, y0 = max(0, x0), max(0, y0)
+        x1, y1 = min(self.image_width, x1), min(self.image_height, y1)
+        if x0 >= x1 or y0 >= y1:
+            return None
+        return x0, y0, x1, y1
+
+
+def detections_to_boxes(coordinates, class_ids, class_count, image_width, image_height):
+    """Результат модели (xyxy, номера классов) в рамки auto с известными классами"""
+    count = min(len(coordinates), len(class_ids))
+    detections = AnnotationArray(
+        [coords[:4] for coords in coordinates[:count]], class_ids[:count], True
+    )
+    detections = detections.select((detections.class_id >= 0) & (detections.class_id < class_count))
+    detections.clamp(image_width, image_height)
+    return detections
+
+
+def replace_auto(boxes, detections):
+    """Заменяет автоматические рамки новыми, ручные остаются"""
+    return AnnotationArray.concat([boxes.select(~boxes.auto), detections])
+
+
+class Task:
+    """Папка задачи: Tasks/<имя> с classes.txt, images/ и моделями .pt"""
+
+    def __init__(self, tasks_root, name):
+        self.name = name
+        self.task_path = Path(tasks_root) / name
+        self.image_path = self.task_path / "images"
+        self.classes_file = self.task_path / CLASSES_FILENAME
+
+    def load_classes(self):
+        """Классы из classes.txt"""
+        return read_classes(self.classes_file)
+
+    def save_classes(self, classes):
+        atomic_write_text(self.classes_file, "".join(f"{cls}\n" for cls in classes))
+
+    def list_images(self, extensions=SUPPORTED_EXTENSIONS):
+        """Изображения задачи, отсортированные по имени без учёта регистра"""
+        if not self.image_path.is_dir():
+            return []
+        with os.scandir(self.image_path) as it:
+            files = [
+                self.image_path / entry.name
+                for entry in it
+                if os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file()
+            ]
+        return sorted(files, key=lambda p: p.name.lower())
+
+    def image_meta(self):
+        """Индекс размеров, форматов и ориентации EXIF изображений задачи"""
+        return ImageMetaIndex(self.task_path).load()
+
+    def model_files(self):
+        return sorted(
+            (p for p in self.task_path.glob("*.pt") if p.is_file()),
+            key=lambda p: p.name.lower(),
+        )
+
+
+class LabelStore:
+    """Разметка задачи: annotations.db, если база создана, иначе images/*.txt.
+
+    Файлы .txt пишутся атомарно; если передан writer (LabelWriter), запись
+    выполняется в его фоновом потоке, а чтение учитывает ещё не записанное.
+    Флаги авторазметки для .txt берутся из auto_labels.txt.
+    """
+
+    def __init__(self, task, writer=None):
+        self.task = task
+        self.writer = writer
+        self.auto_labels = AutoLabelRegistry(task.task_path).load()
+        self.db = SqliteAnnotationStore.open_existing(task.task_path)
+
+    def label_file(self, stem):
+        return self.task.image_path / f"{stem}.txt"
+
+    def read(self, stem, image_width, image_height):
+        """Рамки изображения в пикселях, ограниченные его границами"""
+        if self.db is not None:
+            boxes = self.db.read(stem, image_width, image_height)
+        else:
+            label_file = self.label_file(stem)
+            queued, text = self.writer.pending(label_file) if self.writer else (False, None)
+            if queued:
+                boxes = AnnotationArray.parse_yolo(text or "", image_width, image_height)
+            else:
+                boxes = AnnotationArray.read_yolo(label_file, image_width, image_height)
+            if stem in self.auto_labels:
+                boxes.auto[:] = True
+        boxes.clamp(image_width, image_height)
+        return boxes
+
+    def write(self, stem, boxes, image_width, image_height):
+        """Сохраняет рамки изображения; пустой набор удаляет разметку"""
+        self.save_many([(stem, boxes, image_width, image_height)])
+
+    def save_many(self, items):
+        """Сохраняет (stem, рамки, ширина, высота); в SQLite — одной транзакцией"""
+        if self.db is not None:
+            self.db.write_many(items)
+            return
+        for stem, boxes, image_width, image_height in items:
+            text = boxes.to_yolo(image_width, image_height) if len(boxes) else None
+            if self.writer is not None:
+                self.writer.submit(self.label_file(stem), text)
+            else:
+                atomic_write_text(self.label_file(stem), text)
+            self.auto_labels.mark(stem, bool(len(boxes)) and bool(boxes.auto.all()))
+
+    def apply_detections(self, results, class_count):
+        """Заменяет auto-рамки результатами модели: (stem, xyxy, номера классов, ширина, высота).
+
+        Ручная разметка сохраняется; возвращает число изображений с найденными объектами.
+        """
+        items = []
+        for stem, coordinates, class_ids, image_width, image_height in results:
+            detections = detections_to_boxes(coordinates, class_ids, class_count, image_width, image_height)
+            if not len(detections):
+                continue
+            boxes = replace_auto(self.read(stem, image_width, image_height), detections)
+            items.append((stem, boxes, image_width, image_height))
+        self.save_many(items)
+        return len(items)
+
+    def load_many(self, image_paths, workers=8, meta=None):
+        """{путь: (рамки, ширина, высота)}.
+
+        Размеры берутся из индекса метаданных задачи (.image_meta.json), а
+        заголовки изменённых изображений читаются параллельно.
+        """
+        image_paths = list(image_paths)
+        if meta is None:
+            meta = self.task.image_meta()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(meta.get, image_paths))
+        meta.save()
+        result = {}
+        for path, info in zip(image_paths, sizes):
+            if info is not None:
+                result[path] = (self.read(path.stem, info.width, info.height), info.width, info.height)
+        return result
+
+    def is_labeled(self, stem):
+        if self.db is not None:
+            return self.db.is_labeled(stem)
+        label_file = self.label_file(stem)
+        if self.writer is not None:
+            queued, text = self.writer.pending(label_file)
+            if queued:
+                return bool(text)
+        try:
+            return label_file.stat().st_size > 0
+        except OSError:
+            return False
+
+    def flush(self):
+        """Дописывает очередь файлов и сохраняет auto_labels.txt"""
+        if self.writer is not None:
+            self.writer.flush()
+        self.auto_labels.save()
+
+    def close(self):
+        self.flush()
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+def export_tasks(tasks_root, task_names, result_root, extensions=SUPPORTED_EXTENSIONS, progress=None):
+    """Переносит размеченные изображения задач в result_root.
+
+    Разметка задач в SQLite сначала выгружается в .txt (файлы изображений без
+    рамок в базе удаляются), а после переноса записи перенесённых
+    изображений удаляются из базы. Файлы .txt, созданные или изменённые вне
+    базы, перед этим импортируются в неё.
+    """
+    stores = []
+    try:
+        for task_name in task_names:
+            task = Task(tasks_root, task_name)
+            store = SqliteAnnotationStore.open_existing(task.task_path)
+            if store is not None:
+                stores.append((store, task.image_path))
+                # Источник разметки — база: .txt изображений, очищенных в ней, удаляются,
+                # иначе перенос забрал бы старые импортированные метки. Новые .txt
+                # (например, от старых скриптов) сначала попадают в базу, чтобы не пропасть
+                store.import_txt(task.image_path, AutoLabelRegistry(task.task_path).load().stems)
+                store.materialize_txt(task.image_path, prune=True)
+        report = ExportJob(tasks_root, task_names, result_root, extensions).run(progress)
+        for store, image_dir in stores:
+            store.drop_missing(image_dir)
+        return report
+    finally:
+        for store, _ in stores:
+            store.close()
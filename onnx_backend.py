@@ -0,0 +1,161 @@
+import hashlib
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+from boxes import batched_nms
+
+
+CACHE_DIRNAME = ".onnx_cache"
+DEFAULT_IMGSZ = 640
+
+_hash_cache = {}
+
+
+def file_sha256(path):
+    """Хэш содержимого файла модели (запоминается по mtime и размеру)"""
+    st = os.stat(path)
+    key = (str(path), st.st_mtime_ns, st.st_size)
+    digest = _hash_cache.get(key)
+    if digest is None:
+        h = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        _hash_cache[key] = digest
+    return digest
+
+
+def cached_onnx_path(model_path, imgsz=DEFAULT_IMGSZ, quantize=False):
+    """Путь к кэшированному ONNX: хэш содержимого .pt плюс параметры экспорта"""
+    model_path = Path(model_path)
+    digest = file_sha256(model_path)[:16]
+    suffix = "-int8" if quantize else ""
+    return model_path.parent / CACHE_DIRNAME / f"{model_path.stem}-{digest}-{imgsz}{suffix}.onnx"
+
+
+def export_onnx(model_path, imgsz=DEFAULT_IMGSZ, quantize=False):
+    """Экспортирует .pt в ONNX один раз и возвращает путь к файлу в кэше"""
+    target = cached_onnx_path(model_path, imgsz, quantize)
+    if target.exists():
+        return target
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    plain = cached_onnx_path(model_path, imgsz, quantize=False)
+    if not plain.exists():
+        from ultralytics import YOLO
+        exported = YOLO(str(model_path)).export(format="onnx", imgsz=imgsz, dynamic=False)
+        tmp_file = plain.with_name(plain.name + ".tmp")
+        shutil.move(str(exported), tmp_file)
+        os.replace(tmp_file, plain)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        tmp_file = target.with_name(target.name + ".tmp")
+        quantize_dynamic(str(plain), str(tmp_file), weight_type=QuantType.QUInt8)
+        os.replace(tmp_file, target)
+    return target
+
+
+def letterbox(image, size):
+    """Вписывает изображение в квадрат size×size с серыми полями, как ultralytics"""
+    width, height = image.size
+    ratio = min(size / width, size / height)
+    new_w = max(1, round(width * ratio))
+    new_h = max(1, round(height * ratio))
+    resized = image.resize((new_w, new_h), Image.Resampling.BILINEAR)
+    canvas = Image.new("RGB", (size, size), (114, 114, 114))
+    pad_x = (size - new_w) // 2
+    pad_y = (size - new_h) // 2
+    canvas.paste(resized, (pad_x, pad_y))
+    return canvas, ratio, pad_x, pad_y
+
+
+def decode_output(output, conf, iou):
+    """Разбирает выход YOLO: (1, 4+nc, N) без NMS или (1, N, 6) с NMS.
+
+    Возвращает массивы xyxy, score и class_id в координатах входа модели.
+    """
+    output = np.asarray(output)[0]
+    if output.ndim == 2 and output.shape[-1] == 6 and output.shape[0] != 6:
+        boxes = output[:, :4]
+        scores = output[:, 4]
+        class_ids = output[:, 5].astype(np.int64)
+        mask = scores >= conf
+        return boxes[mask], scores[mask], class_ids[mask]
+
+    predictions = output.T
+    boxes_cxcywh = predictions[:, :4]
+    class_scores = predictions[:, 4:]
+    class_ids = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(class_scores)), class_ids]
+    mask = scores >= conf
+    boxes_cxcywh = boxes_cxcywh[mask]
+    scores = scores[mask]
+    class_ids = class_ids[mask]
+    half_w = boxes_cxcywh[:, 2] / 2
+    half_h = boxes_cxcywh[:, 3] / 2
+    boxes = np.stack(
+        (
+            boxes_cxcywh[:, 0] - half_w,
+            boxes_cxcywh[:, 1] - half_h,
+            boxes_cxcywh[:, 0] + half_w,
+            boxes_cxcywh[:, 1] + half_h,
+        ),
+        axis=1,
+    )
+    keep = batched_nms(boxes, scores, class_ids, iou)
+    return boxes[keep], scores[keep], class_ids[keep]
+
+
+class OnnxDetector:
+    """Детектор на onnxruntime для CPU с настраиваемым числом потоков"""
+
+    def __init__(self, onnx_path, intra_op_threads=None):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        self.onnx_path = Path(onnx_path)
+        self.session = ort.InferenceSession(
+            str(onnx_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        self.imgsz = shape[2] if isinstance(shape[2], int) else DEFAULT_IMGSZ
+
+    def run_scored(self, image, conf, iou):
+        """Поиск на изображении PIL; возвращает массивы xyxy, score и class_id"""
+        image = image.convert("RGB")
+        width, height = image.size
+        boxed, ratio, pad_x, pad_y = letterbox(image, self.imgsz)
+        tensor = np.asarray(boxed, dtype=np.float32).transpose(2, 0, 1)[None] / 255.0
+        output = self.session.run(None, {self.input_name: tensor})[0]
+        boxes, scores, class_ids = decode_output(output, conf, iou)
+        boxes = boxes.astype(np.float64).reshape(-1, 4)
+        boxes[:, [0, 2]] = np.clip((boxes[:, [0, 2]] - pad_x) / ratio, 0, width)
+        boxes[:, [1, 3]] = np.clip((boxes[:, [1, 3]] - pad_y) / ratio, 0, height)
+        return boxes, scores, class_ids
+
+    def run(self, image, conf, iou):
+        """Поиск на изображении PIL; возвращает (координаты xyxy, номера классов)"""
+        boxes, _, class_ids = self.run_scored(image, conf, iou)
+        return boxes.tolist(), class_ids.tolist()
+
+    def detect(self, image_path, conf, iou):
+        with Image.open(image_path) as image:
+            return self.run(image, conf, iou)
+
+    def warm_up(self):
+        self.run(Image.new("RGB", (self.imgsz, self.imgsz)), 0.5, 0.5)
+
+
+def load_onnx_detector(model_path, quantize=False, intra_op_threads=None, imgsz=DEFAULT_IMGSZ):
+    """Экспортирует модель (если ещё не в кэше) и открывает сессию onnxruntime"""
+    return OnnxDetector(export_onnx(model_path, imgsz, quantize), intra_op_threads)
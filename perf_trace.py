@@ -0,0 +1,164 @@
+import functools
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+
+# Корзины гистограммы растут в 2^(1/8) раза: погрешность перцентиля не больше 9%
+BUCKETS_PER_OCTAVE = 8
+BUCKET_COUNT = 30 * BUCKETS_PER_OCTAVE  # от 1 мкс до ~18 минут
+
+
+def bucket_of(duration_ns):
+    micros = duration_ns / 1000
+    if micros <= 1:
+        return 0
+    return min(int(math.log2(micros) * BUCKETS_PER_OCTAVE), BUCKET_COUNT - 1)
+
+
+def bucket_upper_ms(index):
+    """Верхняя граница корзины в миллисекундах"""
+    return 2 ** ((index + 1) / BUCKETS_PER_OCTAVE) / 1000
+
+
+class LatencyHistogram:
+    """Гистограмма длительностей по последним window замерам.
+
+    Запись — O(1): замер попадает в логарифмическую корзину, а самый старый
+    замер окна вычитается из своей. Перцентили считаются по корзинам.
+    """
+
+    def __init__(self, window=1024):
+        self.counts = [0] * BUCKET_COUNT
+        self.recent = deque()
+        self.window = window
+        self.total = 0
+        self.max_ns = 0
+
+    def add(self, duration_ns):
+        index = bucket_of(duration_ns)
+        self.counts[index] += 1
+        self.recent.append(index)
+        if len(self.recent) > self.window:
+            self.counts[self.recent.popleft()] -= 1
+        self.total += 1
+        self.max_ns = max(self.max_ns, duration_ns)
+
+    def percentile(self, q):
+        """Оценка перцентиля q (0..1) в миллисекундах"""
+        size = len(self.recent)
+        if not size:
+            return 0.0
+        rank = max(1, int(q * size + 0.5))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return bucket_upper_ms(index)
+        return bucket_upper_ms(BUCKET_COUNT - 1)
+
+
+class Profiler:
+    """Замеры горячих путей: гистограммы по операциям и буфер событий трассы.
+
+    Пока enabled ложно, обёртки profiled() только проверяют флаг. Запись
+    безопасна из фоновых потоков: deque.append и словари защищены GIL.
+    """
+
+    def __init__(self, enabled=False, window=1024, trace_capacity=200000):
+        self.enabled = enabled
+        self.window = window
+        self.histograms = {}
+        self.events = deque(maxlen=trace_capacity)
+        self.thread_names = {}
+        self.origin_ns = time.perf_counter_ns()
+
+    def record(self, name, started_ns, finished_ns):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms.setdefault(name, LatencyHistogram(self.window))
+        histogram.add(finished_ns - started_ns)
+        tid = threading.get_ident()
+        if tid not in self.thread_names:
+            self.thread_names[tid] = threading.current_thread().name
+        self.events.append((name, started_ns, finished_ns, tid))
+
+    def wrap(self, name, func):
+        """Обёртка функции (например, для фонового потока) с замером при включённом профилировании"""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            started = time.perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.record(name, started, time.perf_counter_ns())
+        return wrapper
+
+    def reset(self):
+        self.histograms = {}
+        self.events.clear()
+
+    def summary(self):
+        """Список (операция, замеров в окне, p50, p95, p99, максимум) в мс"""
+        rows = []
+        for name, histogram in sorted(self.histograms.items()):
+            rows.append((
+                name,
+                len(histogram.recent),
+                histogram.percentile(0.50),
+                histogram.percentile(0.95),
+                histogram.percentile(0.99),
+                histogram.max_ns / 1e6,
+            ))
+        return rows
+
+    def chrome_trace(self):
+        """События в формате Chrome Trace Event (chrome://tracing, Perfetto)"""
+        pid = os.getpid()
+        trace = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}}
+            for tid, name in list(self.thread_names.items())
+        ]
+        for name, started_ns, finished_ns, tid in list(self.events):
+            trace.append({
+                "name": name,
+                "cat": "labeler",
+                "ph": "X",
+                "ts": (started_ns - self.origin_ns) / 1000,
+                "dur": (finished_ns - started_ns) / 1000,
+                "pid": pid,
+                "tid": tid,
+            })
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def dump_chrome_trace(self, path):
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = path.with_name(path.name + ".tmp")
+        with open(tmp_file, 'w', encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, separators=(",", ":"))
+        os.replace(tmp_file, path)
+        return path
+
+
+def profiled(name):
+    """Декоратор метода объекта с атрибутом profiler"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            profiler = self.profiler
+            if not profiler.enabled:
+                return func(self, *args, **kwargs)
+            started = time.perf_counter_ns()
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                profiler.record(name, started, time.perf_counter_ns())
+        return wrapper
+    return decorate
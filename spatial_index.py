@@ -0,0 +1,121 @@
+from collections import defaultdict
+
+
+class AnnotationGrid:
+    """Равномерная сетка над координатами изображения для поиска рамок.
+
+    Рамка регистрируется во всех ячейках, которые она пересекает. Очень
+    крупные рамки хранятся отдельным списком, чтобы не заполнять ими всю
+    сетку. Порядок по оси Z совпадает с порядком отрисовки: рамка с большим
+    индексом лежит выше.
+    """
+
+    def __init__(self, cells_per_side=64, max_cells_per_box=256):
+        self.cells_per_side = cells_per_side
+        self.max_cells_per_box = max_cells_per_box
+        self.cell_size = 1.0
+        self.cells = defaultdict(set)
+        self.oversized = set()
+        self.boxes = []
+        self.box_cells = []
+
+    def rebuild(self, annotations, image_width, image_height):
+        """Пересобирает индекс для нового списка аннотаций"""
+        self.cell_size = max(16.0, max(image_width, image_height, 1) / self.cells_per_side)
+        self.cells = defaultdict(set)
+        self.oversized = set()
+        self.boxes = []
+        self.box_cells = []
+        for ann in annotations:
+            self.add(ann)
+
+    def _cell_range(self, x1, y1, x2, y2):
+        size = self.cell_size
+        return int(x1 // size), int(y1 // size), int(x2 // size), int(y2 // size)
+
+    def _register(self, index, box):
+        cx1, cy1, cx2, cy2 = self._cell_range(*box)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.max_cells_per_box:
+            self.oversized.add(index)
+            return None
+        keys = [(cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1)]
+        for key in keys:
+            self.cells[key].add(index)
+        return keys
+
+    def _unregister(self, index):
+        keys = self.box_cells[index]
+        if keys is None:
+            self.oversized.discard(index)
+            return
+        for key in keys:
+            bucket = self.cells.get(key)
+            if bucket is not None:
+                bucket.discard(index)
+                if not bucket:
+                    del self.cells[key]
+
+    def add(self, ann):
+        """Добавляет рамку в конец (поверх остальных)"""
+        box = (ann['x1'], ann['y1'], ann['x2'], ann['y2'])
+        index = len(self.boxes)
+        self.boxes.append(box)
+        self.box_cells.append(self._register(index, box))
+
+    def update(self, index, ann):
+        """Обновляет положение рамки после перемещения или изменения размера"""
+        box = (ann['x1'], ann['y1'], ann['x2'], ann['y2'])
+        if box == self.boxes[index]:
+            return
+        self._unregister(index)
+        self.boxes[index] = box
+        self.box_cells[index] = self._register(index, box)
+
+    def _candidates(self, x1, y1, x2, y2):
+        cx1, cy1, cx2, cy2 = self._cell_range(x1, y1, x2, y2)
+        found = set(self.oversized)
+        cells = self.cells
+        for cx in range(cx1, cx2 + 1):
+            for cy in range(cy1, cy2 + 1):
+                bucket = cells.get((cx, cy))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+    def query_point(self, x, y):
+        """Индексы рамок, содержащих точку, сверху вниз"""
+        hits = [
+            index
+            for index in self._candidates(x, y, x, y)
+            if self.boxes[index][0] <= x <= self.boxes[index][2]
+            and self.boxes[index][1] <= y <= self.boxes[index][3]
+        ]
+        hits.sort(reverse=True)
+        return hits
+
+    def topmost(self, x, y):
+        """Верхняя рамка под точкой или None"""
+        hits = self.query_point(x, y)
+        return hits[0] if hits else None
+
+    def nearest_handle(self, x, y, radius):
+        """Ближайший угол рамки в пределах radius: (индекс, угол) или None.
+
+        Расстояние считается по Чебышёву, как у квадратных маркеров на холсте;
+        при равенстве выбирается верхняя рамка.
+        """
+        best = None
+        best_key = None
+        for index in self._candidates(x - radius, y - radius, x + radius, y + radius):
+            x1, y1, x2, y2 = self.boxes[index]
+            for corner, hx, hy in (
+                ("br", x2, y2), ("tl", x1, y1), ("tr", x2, y1), ("bl", x1, y2)
+            ):
+                distance = max(abs(hx - x), abs(hy - y))
+                if distance > radius:
+                    continue
+                key = (distance, -index)
+                if best_key is None or key < best_key:
+                    best_key = key
+                    best = (index, corner)
+        return best
@@ -0,0 +1,350 @@
+"""Хранение разметки задачи в одной базе SQLite вместо файлов .txt.
+
+Пример:
+    python sqlite_store.py job_1 import        # images/*.txt -> annotations.db
+    python sqlite_store.py job_1 materialize   # annotations.db -> images/*.txt
+
+Если в папке задачи есть annotations.db, приложение читает и сохраняет
+разметку в базе (режим WAL, каждое сохранение — одна транзакция), а
+статистика считается запросами по индексам. Координаты хранятся в
+нормированном виде YOLO, поэтому выгрузка в .txt не требует открывать
+изображения.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+from annotation_store import AnnotationArray
+from label_writer import atomic_write_text
+from task_layout import SUPPORTED_EXTENSIONS, AutoLabelRegistry
+
+
+DB_FILENAME = "annotations.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    stem TEXT NOT NULL UNIQUE,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS boxes (
+    image_id INTEGER NOT NULL REFERENCES images(id) ON DELETE CASCADE,
+    class_id INTEGER NOT NULL,
+    cx REAL NOT NULL,
+    cy REAL NOT NULL,
+    w REAL NOT NULL,
+    h REAL NOT NULL,
+    auto INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS boxes_image ON boxes(image_id);
+CREATE INDEX IF NOT EXISTS boxes_class ON boxes(class_id);
+"""
+
+
+def parse_label_rows(text):
+    """Строки YOLO (class_id, cx, cy, w, h); некорректные строки пропускаются"""
+    rows = []
+    for line in text.splitlines():
+        parts = line.split()
+        if len(parts) != 5:
+            continue
+        try:
+            rows.append((int(float(parts[0])), *(float(value) for value in parts[1:])))
+        except ValueError:
+            continue
+    return rows
+
+
+class SqliteAnnotationStore:
+    """Разметка задачи в Tasks/<задача>/annotations.db.
+
+    Изображение присутствует в таблице images, только пока у него есть
+    рамки, поэтому число строк images — это число размеченных изображений.
+    Итоги по классам кэшируются до следующей записи.
+    """
+
+    def __init__(self, task_path):
+        self.path = Path(task_path) / DB_FILENAME
+        self.image_dir = Path(task_path) / "images"
+        self.connection = sqlite3.connect(self.path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.executescript(SCHEMA)
+        self._totals = None
+        self._labeled = None
+
+    @classmethod
+    def open_existing(cls, task_path):
+        """Открывает базу задачи, если она создана, иначе возвращает None"""
+        if not (Path(task_path) / DB_FILENAME).exists():
+            return None
+        return cls(task_path)
+
+    def close(self):
+        self.connection.close()
+
+    def _invalidate(self):
+        self._totals = None
+        self._labeled = None
+
+    # --- Одно изображение ---
+
+    def read(self, stem, image_width, image_height):
+        """Рамки изображения в пиксельных координатах с флагами auto"""
+        rows = self.connection.execute(
+            "SELECT b.class_id, b.cx, b.cy, b.w, b.h, b.auto FROM boxes b "
+            "JOIN images i ON i.id = b.image_id WHERE i.stem = ? ORDER BY b.rowid",
+            (stem,),
+        ).fetchall()
+        if not rows:
+            return AnnotationArray()
+        values = np.asarray(rows, dtype=np.float64)
+        return AnnotationArray.from_cxcywh(
+            values[:, 1:5], image_width, image_height, values[:, 0], values[:, 5] != 0
+        )
+
+    def write(self, stem, boxes, image_width, image_height):
+        """Заменяет рамки изображения одной транзакцией; пустой набор удаляет запись"""
+        self.write_many([(stem, boxes, image_width, image_height)])
+
+    def write_many(self, items):
+        """Заменяет рамки нескольких изображений: (stem, рамки, ширина, высота) в одной транзакции.
+
+        Старый .txt очищенного изображения удаляется, чтобы import_txt не
+        вернул его разметку.
+        """
+        now = time.time()
+        cleared = []
+        with self.connection:
+            for stem, boxes, image_width, image_height in items:
+                self.connection.execute("DELETE FROM images WHERE stem = ?", (stem,))
+                if not len(boxes):
+                    cleared.append(stem)
+                    continue
+                cursor = self.connection.execute(
+                    "INSERT INTO images (stem, updated) VALUES (?, ?)", (stem, now)
+                )
+                rows = boxes.to_cxcywh(image_width, image_height).tolist()
+                self.connection.executemany(
+                    "INSERT INTO boxes (image_id, class_id, cx, cy, w, h, auto) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        (cursor.lastrowid, class_id, *row, int(auto))
+                        for class_id, row, auto in zip(boxes.class_id.tolist(), rows, boxes.auto.tolist())
+                    ),
+                )
+        for stem in cleared:
+            atomic_write_text(self.image_dir / f"{stem}.txt", None, fsync=False)
+        self._invalidate()
+
+    def is_labeled(self, stem):
+        return self.connection.execute(
+            "SELECT 1 FROM images WHERE stem = ?", (stem,)
+        ).fetchone() is not None
+
+    def labeled_stems(self):
+        return {row[0] for row in self.connection.execute("SELECT stem FROM images")}
+
+    def auto_stems(self):
+        """Изображения, все рамки которых созданы моделью"""
+        return {
+            row[0]
+            for row in self.connection.execute(
+                "SELECT i.stem FROM images i JOIN boxes b ON b.image_id = i.id "
+                "GROUP BY i.id HAVING MIN(b.auto) = 1"
+            )
+        }
+
+    # --- Статистика ---
+
+    @property
+    def labeled_count(self):
+        if self._labeled is None:
+            self._labeled = self.connection.execute("SELECT COUNT(*) FROM images").fetchone()[0]
+        return self._labeled
+
+    def class_totals(self, classes):
+        """Итоги по именам классов, как StatsIndex.class_totals"""
+        if self._totals is None:
+            self._totals = self.connection.execute(
+                "SELECT class_id, COUNT(*) FROM boxes GROUP BY class_id"
+            ).fetchall()
+        result = Counter()
+        for class_id, count in self._totals:
+            if 0 <= class_id < len(classes) and count > 0:
+                result[classes[class_id]] += count
+        return result
+
+    # --- Перенумерация классов ---
+
+    def remap_classes(self, remap, token):
+        """Меняет номера классов по remap (None — рамки удаляются) одной транзакцией.
+
+        token записывается в user_version той же транзакцией: повторный вызов
+        с тем же token после сбоя ничего не меняет.
+        """
+        if self.connection.execute("PRAGMA user_version").fetchone()[0] == token:
+            return
+        changes = [(old, new) for old, new in enumerate(remap) if new != old]
+        with self.connection:
+            self.connection.execute(
+                "CREATE TEMP TABLE IF NOT EXISTS class_remap (old INTEGER PRIMARY KEY, new INTEGER)"
+            )
+            self.connection.execute("DELETE FROM class_remap")
+            self.connection.executemany("INSERT INTO class_remap (old, new) VALUES (?, ?)", changes)
+            self.connection.execute(
+                "DELETE FROM boxes WHERE class_id IN (SELECT old FROM class_remap WHERE new IS NULL)"
+            )
+            self.connection.execute(
+                "UPDATE boxes SET class_id = (SELECT new FROM class_remap WHERE old = boxes.class_id) "
+                "WHERE class_id IN (SELECT old FROM class_remap)"
+            )
+            # Изображение без рамок не хранится в images
+            self.connection.execute("DELETE FROM images WHERE id NOT IN (SELECT image_id FROM boxes)")
+            self.connection.execute(f"PRAGMA user_version = {int(token)}")
+        self._invalidate()
+
+    # --- Обмен с файлами .txt ---
+
+    def import_txt(self, image_dir, auto_stems=()):
+        """Загружает images/*.txt в базу.
+
+        Берутся только файлы изображений, которых нет в базе, и файлы новее
+        последнего сохранения изображения в базе: разметка, изменённая в окне
+        после выгрузки в .txt, не откатывается.
+        """
+        image_dir = Path(image_dir)
+        image_stems = set()
+        label_files = []
+        with os.scandir(image_dir) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext == ".txt":
+                    try:
+                        label_files.append((entry.name, entry.stat().st_mtime))
+                    except OSError:
+                        continue
+                elif ext.lower() in SUPPORTED_EXTENSIONS:
+                    image_stems.add(stem)
+        updated = dict(self.connection.execute("SELECT stem, updated FROM images"))
+        auto_stems = set(auto_stems)
+        imported = 0
+        now = time.time()
+        with self.connection:
+            for name, mtime in label_files:
+                stem = name[:-4]
+                if stem not in image_stems or mtime <= updated.get(stem, float("-inf")):
+                    continue
+                try:
+                    with open(image_dir / name, 'r') as f:
+                        rows = parse_label_rows(f.read())
+                except OSError:
+                    continue
+                self.connection.execute("DELETE FROM images WHERE stem = ?", (stem,))
+                if not rows:
+                    continue
+                image_id = self.connection.execute(
+                    "INSERT INTO images (stem, updated) VALUES (?, ?)", (stem, now)
+                ).lastrowid
+                auto = int(stem in auto_stems)
+                self.connection.executemany(
+                    "INSERT INTO boxes (image_id, class_id, cx, cy, w, h, auto) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    ((image_id, *row, auto) for row in rows),
+                )
+                imported += 1
+        self._invalidate()
+        return imported
+
+    def materialize_txt(self, image_dir, prune=False):
+        """Выгружает базу в images/*.txt; prune удаляет .txt изображений без рамок.
+
+        Перед prune изменения .txt, сделанные вне базы, нужно забрать import_txt.
+        """
+        image_dir = Path(image_dir)
+        written = set()
+        stem = None
+        lines = []
+
+        def flush():
+            atomic_write_text(image_dir / f"{stem}.txt", "\n".join(lines) + "\n", fsync=False)
+            written.add(stem)
+
+        cursor = self.connection.execute(
+            "SELECT i.stem, b.class_id, b.cx, b.cy, b.w, b.h FROM boxes b "
+            "JOIN images i ON i.id = b.image_id ORDER BY b.image_id, b.rowid"
+        )
+        for row_stem, class_id, cx, cy, w, h in cursor:
+            if row_stem != stem:
+                if lines:
+                    flush()
+                stem, lines = row_stem, []
+            lines.append(f"{class_id} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}")
+        if lines:
+            flush()
+        # Выгруженные файлы не новее базы: следующий import_txt их пропустит
+        # и не потеряет флаги auto отдельных рамок
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE images SET updated = ? WHERE stem = ?", ((now, stem) for stem in written)
+            )
+
+        if prune:
+            with os.scandir(image_dir) as it:
+                for entry in it:
+                    if entry.name.endswith(".txt") and entry.name[:-4] not in written:
+                        os.unlink(entry.path)
+        return len(written)
+
+    def drop_missing(self, image_dir):
+        """Удаляет разметку изображений, которых больше нет в каталоге"""
+        present = set()
+        with os.scandir(image_dir) as it:
+            for entry in it:
+                stem, ext = os.path.splitext(entry.name)
+                if ext.lower() in SUPPORTED_EXTENSIONS:
+                    present.add(stem)
+        stems = [row[0] for row in self.connection.execute("SELECT stem FROM images")]
+        missing = [(stem,) for stem in stems if stem not in present]
+        with self.connection:
+            self.connection.executemany("DELETE FROM images WHERE stem = ?", missing)
+        self._invalidate()
+        return len(missing)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Разметка задачи в базе SQLite")
+    parser.add_argument("task", help="имя задачи")
+    parser.add_argument("action", choices=("import", "materialize"))
+    parser.add_argument("--tasks-root", default="Tasks")
+    parser.add_argument("--prune", action="store_true", help="при выгрузке удалить .txt изображений без рамок")
+    args = parser.parse_args(argv)
+
+    task_path = Path(args.tasks_root) / args.task
+    image_dir = task_path / "images"
+    if not image_dir.is_dir():
+        parser.error(f"не найден каталог {image_dir}")
+    started = time.perf_counter()
+    store = SqliteAnnotationStore(task_path)
+    try:
+        if args.action == "import":
+            count = store.import_txt(image_dir, AutoLabelRegistry(task_path).load().stems)
+            print(f"Импортировано изображений: {count}")
+        else:
+            count = store.materialize_txt(image_dir, args.prune)
+            print(f"Записано файлов: {count}")
+    finally:
+        store.close()
+    print(f"Время: {time.perf_counter() - started:.1f} с")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+import json
+import os
+from collections import Counter
+from pathlib import Path
+
+
+INDEX_FILENAME = ".stats_index.json"
+INDEX_VERSION = 1
+
+
+def parse_label_counts(label_file):
+    """Считает количество рамок каждого класса (по id) в файле YOLO"""
+    counts = Counter()
+    try:
+        with open(label_file, 'r') as f:
+            for line in f:
+                parts = line.strip().split()
+                if len(parts) == 5:
+                    try:
+                        counts[int(parts[0])] += 1
+                    except ValueError:
+                        continue
+    except OSError:
+        return Counter()
+    return counts
+
+
+class StatsIndex:
+    """Инкрементальный индекс статистики задачи.
+
+    Хранит для каждого изображения количество рамок по классам вместе с
+    mtime/размером файла аннотаций. Индекс сохраняется рядом с classes.txt,
+    при загрузке задачи перечитываются только изменившиеся файлы, а при
+    сохранении одной аннотации применяется дельта.
+    """
+
+    def __init__(self, task_path, image_path):
+        self.index_file = Path(task_path) / INDEX_FILENAME
+        self.image_path = Path(image_path)
+        self.entries = {}
+        self.totals = Counter()
+        self.labeled_count = 0
+        self.dirty = False
+
+    def load(self):
+        """Читает сохранённый индекс с диска"""
+        self.entries = {}
+        try:
+            with open(self.index_file, 'r', encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get("version") != INDEX_VERSION:
+            return
+        for stem, entry in data.get("entries", {}).items():
+            try:
+                self.entries[stem] = {
+                    "mtime": entry["mtime"],
+                    "size": entry["size"],
+                    "counts": Counter({int(k): v for k, v in entry["counts"].items()}),
+                }
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+
+    def save(self):
+        """Атомарно записывает индекс, если он изменился"""
+        if not self.dirty:
+            return
+        data = {
+            "version": INDEX_VERSION,
+            "entries": {
+                stem: {
+                    "mtime": entry["mtime"],
+                    "size": entry["size"],
+                    "counts": {str(k): v for k, v in entry["counts"].items()},
+                }
+                for stem, entry in self.entries.items()
+            },
+        }
+        tmp_file = self.index_file.with_name(self.index_file.name + ".tmp")
+        try:
+            with open(tmp_file, 'w', encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_file, self.index_file)
+        except OSError:
+            return
+        self.dirty = False
+
+    def reconcile(self, image_files):
+        """Сверяет индекс с каталогом и перечитывает только изменённые файлы"""
+        stems = {img.stem for img in image_files}
+        label_stats = {}
+        if self.image_path.is_dir():
+            with os.scandir(self.image_path) as it:
+                for entry in it:
+                    name = entry.name
+                    if not name.endswith(".txt"):
+                        continue
+                    stem = name[:-4]
+                    if stem not in stems:
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    if st.st_size > 0:
+                        label_stats[stem] = st
+
+        for stem in list(self.entries):
+            if stem not in label_stats:
+                del self.entries[stem]
+                self.dirty = True
+
+        for stem, st in label_stats.items():
+            entry = self.entries.get(stem)
+            if entry and entry["mtime"] == st.st_mtime_ns and entry["size"] == st.st_size:
+                continue
+            self.entries[stem] = {
+                "mtime": st.st_mtime_ns,
+                "size": st.st_size,
+                "counts": parse_label_counts(self.image_path / f"{stem}.txt"),
+            }
+            self.dirty = True
+
+        self.totals = Counter()
+        for entry in self.entries.values():
+            self.totals.update(entry["counts"])
+        self.labeled_count = len(self.entries)
+
+    def refresh(self, stem):
+        """Обновляет запись одного изображения и применяет дельту к итогам"""
+        label_file = self.image_path / f"{stem}.txt"
+        old = self.entries.pop(stem, None)
+        if old is not None:
+            self.totals.subtract(old["counts"])
+            self.labeled_count -= 1
+        try:
+            st = label_file.stat()
+        except OSError:
+            st = None
+        if st is not None and st.st_size > 0:
+            counts = parse_label_counts(label_file)
+            self.entries[stem] = {
+                "mtime": st.st_mtime_ns,
+                "size": st.st_size,
+                "counts": counts,
+            }
+            self.totals.update(counts)
+            self.labeled_count += 1
+        self.totals = +self.totals
+        self.dirty = True
+
+    def forget(self, stem):
+        """Убирает изображение из индекса (файл удалён из каталога)"""
+        old = self.entries.pop(stem, None)
+        if old is not None:
+            self.totals.subtract(old["counts"])
+            self.totals = +self.totals
+            self.labeled_count -= 1
+            self.dirty = True
+
+    def class_totals(self, classes):
+        """Возвращает итоги по именам классов (неизвестные id пропускаются)"""
+        result = Counter()
+        for class_id, count in self.totals.items():
+            if 0 <= class_id < len(classes) and count > 0:
+                result[classes[class_id]] += count
+        return result
@@ -0,0 +1,105 @@
+"""Генератор синтетических задач для замеров производительности.
+
+Пример:
+    python synth_task.py bench_2000 --images 2000 --resolution 1920x1080 --boxes 8 --classes 10
+
+Создаёт Tasks/<имя>/classes.txt и images/ с изображениями JPEG и разметкой
+YOLO для доли --labeled изображений. Уникальных изображений создаётся не
+больше --unique, остальные — жёсткие ссылки на них (или копии, если ссылки
+не поддерживаются), поэтому большие задачи генерируются за секунды.
+"""
+
+import argparse
+import os
+import random
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+
+def parse_resolution(text):
+    width, _, height = text.lower().partition("x")
+    return int(width), int(height)
+
+
+def random_boxes(rng, count, class_count):
+    """Строки YOLO со случайными рамками внутри кадра"""
+    lines = []
+    for _ in range(count):
+        w = rng.uniform(0.02, 0.3)
+        h = rng.uniform(0.02, 0.3)
+        cx = rng.uniform(w / 2, 1 - w / 2)
+        cy = rng.uniform(h / 2, 1 - h / 2)
+        lines.append(f"{rng.randrange(class_count)} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def render_image(path, width, height, seed):
+    """Сохраняет шумное изображение с крупными пятнами (сжимается как фото, а не как шум)"""
+    rng = np.random.default_rng(seed)
+    small = rng.integers(0, 256, (max(1, height // 32), max(1, width // 32), 3), dtype=np.uint8)
+    image = Image.fromarray(small).resize((width, height), Image.Resampling.BILINEAR)
+    image.save(path, quality=90)
+
+
+def generate_task(tasks_root, name, images=1000, resolution=(1920, 1080), boxes=8, classes=10,
+                  labeled=0.5, unique=16, seed=0):
+    """Создаёт синтетическую задачу и возвращает путь к ней"""
+    rng = random.Random(seed)
+    task_path = Path(tasks_root) / name
+    image_dir = task_path / "images"
+    if task_path.exists():
+        shutil.rmtree(task_path)
+    image_dir.mkdir(parents=True)
+    with open(task_path / "classes.txt", 'w') as f:
+        f.writelines(f"class_{idx}\n" for idx in range(classes))
+
+    width, height = resolution
+    sources = []
+    for idx in range(min(unique, images)):
+        path = task_path / f".source_{idx}.jpg"
+        render_image(path, width, height, seed + idx)
+        sources.append(path)
+
+    for idx in range(images):
+        target = image_dir / f"img_{idx:07d}.jpg"
+        source = sources[idx % len(sources)]
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+        if rng.random() < labeled:
+            with open(image_dir / f"img_{idx:07d}.txt", 'w') as f:
+                f.write(random_boxes(rng, boxes, classes))
+
+    for path in sources:
+        path.unlink()
+    return task_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетическая задача для замеров")
+    parser.add_argument("name", help="имя задачи")
+    parser.add_argument("--tasks-root", default="Tasks")
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--resolution", type=parse_resolution, default=(1920, 1080), help="ШИРИНАxВЫСОТА")
+    parser.add_argument("--boxes", type=int, default=8, help="рамок на размеченное изображение")
+    parser.add_argument("--classes", type=int, default=10)
+    parser.add_argument("--labeled", type=float, default=0.5, help="доля размеченных изображений")
+    parser.add_argument("--unique", type=int, default=16, help="число уникальных изображений")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    task_path = generate_task(
+        args.tasks_root, args.name, args.images, args.resolution, args.boxes,
+        args.classes, args.labeled, args.unique, args.seed,
+    )
+    print(f"Создана задача {task_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+"""Файлы задачи, общие для окна разметки, ядра и консольных утилит.
+
+Tasks/<задача>/classes.txt — классы по одному на строку, images/ —
+изображения с .txt разметкой, auto_labels.txt — изображения, размеченные
+моделью. Модуль ничего не импортирует из проекта, поэтому на него могут
+опираться и labeler_core, и хранилища, и скрипты.
+"""
+
+import os
+from pathlib import Path
+
+
+SUPPORTED_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+CLASSES_FILENAME = "classes.txt"
+AUTO_LABELS_FILENAME = "auto_labels.txt"
+
+
+def read_classes(classes_file):
+    """Классы из classes.txt; отсутствующий файл даёт пустой список"""
+    try:
+        with open(classes_file, 'r') as f:
+            return [line.strip() for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+
+class AutoLabelRegistry:
+    """Список изображений задачи, разметка которых создана моделью"""
+
+    def __init__(self, task_path):
+        self.path = Path(task_path) / AUTO_LABELS_FILENAME
+        self.stems = set()
+        self.dirty = False
+
+    def load(self):
+        self.stems = set()
+        if self.path.exists():
+            with open(self.path, 'r', encoding="utf-8") as f:
+                self.stems = {line.rstrip("\n") for line in f if line.strip()}
+        self.dirty = False
+        return self
+
+    def __contains__(self, stem):
+        return stem in self.stems
+
+    def mark(self, stem, auto):
+        if auto and stem not in self.stems:
+            self.stems.add(stem)
+            self.dirty = True
+        elif not auto and stem in self.stems:
+            self.stems.discard(stem)
+            self.dirty = True
+
+    def append(self, stems):
+        """Дописывает новые записи в конец файла без перезаписи"""
+        new = [stem for stem in stems if stem not in self.stems]
+        if not new:
+            return
+        with open(self.path, 'a', encoding="utf-8") as f:
+            f.writelines(f"{stem}\n" for stem in new)
+        self.stems.update(new)
+
+    def save(self):
+        if not self.dirty:
+            return
+        tmp_file = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp_file, 'w', encoding="utf-8") as f:
+            f.writelines(f"{stem}\n" for stem in sorted(self.stems))
+        os.replace(tmp_file, self.path)
+        self.dirty = False
@@ -0,0 +1,223 @@
+import abc
+import bisect
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+from pathlib import Path
+
+
+def image_sort_key(path):
+    return path.name.lower()
+
+
+class TaskScanner:
+    """Фоновое чтение каталога изображений через os.scandir.
+
+    Тип записи берётся из кэша dirent (entry.is_file() без лишнего stat).
+    Первые файлы отдаются сразу, остальные — крупными порциями; по окончании
+    в рабочем потоке выполняется finalize(files) (сортировка, индексы), а его
+    результат передаётся вместе с сообщением "done".
+    """
+
+    def __init__(self, image_dir, extensions, finalize=None, first_chunk=32, chunk_size=4096):
+        self.image_dir = Path(image_dir)
+        self.extensions = tuple(extensions)
+        self.finalize = finalize
+        self.first_chunk = first_chunk
+        self.chunk_size = chunk_size
+        self.messages = queue.Queue()
+        self.cancelled = False
+        self._thread = threading.Thread(target=self._run, name="task-scan", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        files = []
+        batch = []
+        limit = self.first_chunk
+        extensions = self.extensions
+        image_dir = self.image_dir
+        try:
+            with os.scandir(image_dir) as it:
+                for entry in it:
+                    if self.cancelled:
+                        return
+                    name = entry.name
+                    if os.path.splitext(name)[1].lower() not in extensions:
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                    except OSError:
+                        continue
+                    batch.append(image_dir / name)
+                    if len(batch) >= limit:
+                        files.extend(batch)
+                        self.messages.put(("chunk", batch))
+                        batch = []
+                        limit = self.chunk_size
+        except OSError:
+            pass
+        if batch:
+            files.extend(batch)
+            self.messages.put(("chunk", batch))
+        result = None
+        if self.finalize is not None and not self.cancelled:
+            result = self.finalize(files)
+        self.messages.put(("done", result))
+
+    def drain(self):
+        messages = []
+        while True:
+            try:
+                messages.append(self.messages.get_nowait())
+            except queue.Empty:
+                return messages
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class DirectoryWatcher(abc.ABC):
+    """Базовый наблюдатель: события ("add"|"remove", имя) и ("rescan", None)"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.events = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="task-watch", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def drain(self):
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    @abc.abstractmethod
+    def _run(self):
+        """Цикл наблюдения в фоновом потоке до вызова stop()"""
+
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+
+class InotifyWatcher(DirectoryWatcher):
+    """Наблюдение через inotify (Linux), без опроса каталога"""
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._fd = libc.inotify_init1(IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1")
+        mask = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE | IN_DELETE_SELF
+        if libc.inotify_add_watch(self._fd, os.fsencode(str(self.directory)), mask) < 0:
+            os.close(self._fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch")
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                ready, _, _ = select.select([self._fd], [], [], 0.5)
+                if not ready:
+                    continue
+                data = os.read(self._fd, 64 * 1024)
+                offset = 0
+                while offset + _EVENT_HEADER.size <= len(data):
+                    _, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                    offset += _EVENT_HEADER.size
+                    name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                    offset += length
+                    if mask & IN_Q_OVERFLOW:
+                        self.events.put(("rescan", None))
+                    elif mask & (IN_DELETE | IN_MOVED_FROM):
+                        self.events.put(("remove", name))
+                    elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                        self.events.put(("add", name))
+                    elif mask & IN_DELETE_SELF:
+                        self.events.put(("rescan", None))
+        finally:
+            os.close(self._fd)
+
+
+class PollingWatcher(DirectoryWatcher):
+    """Запасной вариант: периодическое сравнение снимков каталога"""
+
+    def __init__(self, directory, interval=2.0):
+        super().__init__(directory)
+        self.interval = interval
+
+    def _snapshot(self):
+        snapshot = {}
+        try:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        if entry.is_file():
+                            st = entry.stat()
+                            snapshot[entry.name] = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        continue
+        except OSError:
+            pass
+        return snapshot
+
+    def _run(self):
+        previous = self._snapshot()
+        while not self._stop.wait(self.interval):
+            current = self._snapshot()
+            for name in previous.keys() - current.keys():
+                self.events.put(("remove", name))
+            for name, stamp in current.items():
+                if previous.get(name) != stamp:
+                    self.events.put(("add", name))
+            previous = current
+
+
+def create_watcher(directory):
+    """inotify на Linux, иначе опрос каталога"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(directory).start()
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(directory).start()
+
+
+def find_sorted(files, path):
+    """Позиция path в списке, отсортированном по image_sort_key, или None"""
+    key = image_sort_key(path)
+    idx = bisect.bisect_left(files, key, key=image_sort_key)
+    while idx < len(files) and image_sort_key(files[idx]) == key:
+        if files[idx] == path:
+            return idx
+        idx += 1
+    return None
+
+
+def insert_sorted(files, path):
+    """Вставляет path с сохранением порядка и возвращает его позицию"""
+    idx = bisect.bisect_right(files, image_sort_key(path), key=image_sort_key)
+    files.insert(idx, path)
+    return idx
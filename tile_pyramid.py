@@ -0,0 +1,119 @@
+import math
+from collections import OrderedDict
+
+from PIL import Image
+
+
+TILE_SIZE = 256
+# JPEG умеет декодировать сразу в масштабе 1/2, 1/4 и 1/8
+JPEG_DRAFT_LEVELS = 3
+
+
+def pick_level(scale, max_level):
+    """Уровень пирамиды, разрешение которого ещё не меньше экранного"""
+    level = 0
+    while level < max_level and scale * 2 ** (level + 1) <= 1:
+        level += 1
+    return level
+
+
+class TilePyramid:
+    """Многоуровневая пирамида тайлов одного изображения.
+
+    Уровень k — изображение, уменьшенное в 2^k раз; уровни декодируются
+    только при первом обращении (для JPEG уровни 1–3 сразу декодируются в
+    уменьшенном масштабе). Тайлы вырезаются из уровня и масштабируются под
+    экран лишь для видимой области, последние capacity тайлов кэшируются.
+    """
+
+    def __init__(self, path, tile_size=TILE_SIZE, capacity=512):
+        self.path = path
+        self.tile_size = tile_size
+        self.capacity = capacity
+        with Image.open(path) as img:
+            self.width, self.height = img.size
+            self.format = img.format
+        self.max_level = max(0, int(math.log2(max(self.width, self.height) / tile_size)))
+        self.levels = {}
+        self.tiles = OrderedDict()
+
+    def level_size(self, level):
+        factor = 2 ** level
+        return -(-self.width // factor), -(-self.height // factor)
+
+    def level_image(self, level):
+        image = self.levels.get(level)
+        if image is None:
+            image = self._decode_level(level)
+            self.levels[level] = image
+        return image
+
+    def _decode_level(self, level):
+        size = self.level_size(level)
+        if level and not (self.format == "JPEG" and level <= JPEG_DRAFT_LEVELS):
+            image = self.level_image(level - 1).reduce(2)
+        else:
+            with Image.open(self.path) as img:
+                if level:
+                    img.draft(img.mode, size)
+                img.load()
+                image = img if img.mode in ("RGB", "RGBA", "L") else img.convert("RGB")
+                if image is img:
+                    image = img.copy()
+        if image.size != size:
+            image = image.resize(size, Image.Resampling.BILINEAR)
+        return image
+
+    def tile(self, level, tx, ty, out_w, out_h):
+        """Тайл уровня level, отмасштабированный до out_w x out_h"""
+        key = (level, tx, ty, out_w, out_h)
+        image = self.tiles.get(key)
+        if image is not None:
+            self.tiles.move_to_end(key)
+            return image
+        source = self.level_image(level)
+        size = self.tile_size
+        image = source.crop((
+            tx * size, ty * size,
+            min((tx + 1) * size, source.width), min((ty + 1) * size, source.height),
+        ))
+        if image.size != (out_w, out_h):
+            # При сильном увеличении пиксели показываются как есть, без размытия
+            resample = (
+                Image.Resampling.NEAREST if out_w >= 2 * image.width else Image.Resampling.BILINEAR
+            )
+            image = image.resize((out_w, out_h), resample)
+        self.tiles[key] = image
+        while len(self.tiles) > self.capacity:
+            self.tiles.popitem(last=False)
+        return image
+
+    def visible_tiles(self, viewport, canvas_w, canvas_h):
+        """Тайлы, покрывающие видимую часть холста: список (ключ tile(), x, y) на холсте"""
+        rect = viewport.visible_rect(canvas_w, canvas_h)
+        if rect is None:
+            return []
+        level = pick_level(viewport.scale, self.max_level)
+        factor = 2 ** level
+        # Размер пикселя уровня на экране
+        ratio = viewport.scale * factor
+        level_w, level_h = self.level_size(level)
+        size = self.tile_size
+        x0, y0, x1, y1 = rect
+        tx0 = int(x0 / factor // size)
+        ty0 = int(y0 / factor // size)
+        tx1 = min(int(math.ceil(x1 / factor / size)), -(-level_w // size))
+        ty1 = min(int(math.ceil(y1 / factor / size)), -(-level_h // size))
+        tiles = []
+        for ty in range(ty0, ty1):
+            top = round(ty * size * ratio)
+            bottom = round(min((ty + 1) * size, level_h) * ratio)
+            for tx in range(tx0, tx1):
+                left = round(tx * size * ratio)
+                right = round(min((tx + 1) * size, level_w) * ratio)
+                tiles.append((
+                    (level, tx, ty, max(1, right - left), max(1, bottom - top)),
+                    viewport.offset_x + left,
+                    viewport.offset_y + top,
+                ))
+        return tiles
@@ -0,0 +1,228 @@
+import math
+
+import numpy as np
+from PIL import Image
+
+from boxes import batched_nms
+
+
+# Наибольший кадр, который декодируется целиком (RGB — 3 байта на пиксель, около 300 МБ).
+# Меньше предела PIL (2 * Image.MAX_IMAGE_PIXELS), выше которого Image.open отказывает сам
+MAX_TILED_PIXELS = 100_000_000
+# JPEG декодируется сразу в масштабе 1/2, 1/4 или 1/8
+JPEG_DRAFT_FACTORS = (1, 2, 4, 8)
+# Рамка, подходящая к внутренней границе фрагмента ближе этого (в пикселях), считается разрезанной
+SEAM_TOLERANCE = 2.0
+
+
+def tile_grid(width, height, tile_size=640, overlap=0.2):
+    """Координаты фрагментов (x1, y1, x2, y2), покрывающих изображение с перекрытием"""
+    tile_size = max(1, int(tile_size))
+    step = max(1, int(tile_size * (1 - overlap)))
+
+    def starts(length):
+        if length <= tile_size:
+            return [0]
+        positions = list(range(0, length - tile_size, step))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in starts(height)
+        for x in starts(width)
+    ]
+
+
+def iter_tile_batches(image, tiles, batch_size):
+    """Вырезает фрагменты по мере необходимости, не более batch_size за раз"""
+    for offset in range(0, len(tiles), batch_size):
+        boxes = tiles[offset:offset + batch_size]
+        yield boxes, [image.crop(box) for box in boxes]
+
+
+def seam_cut(boxes, tile, width, height, tolerance=SEAM_TOLERANCE):
+    """Какие рамки фрагмента (в его координатах) упираются в его внутреннюю границу"""
+    x1, y1, x2, y2 = tile
+    cut = np.zeros(len(boxes), dtype=bool)
+    if x1 > 0:
+        cut |= boxes[:, 0] <= tolerance
+    if y1 > 0:
+        cut |= boxes[:, 1] <= tolerance
+    if x2 < width:
+        cut |= boxes[:, 2] >= x2 - x1 - tolerance
+    if y2 < height:
+        cut |= boxes[:, 3] >= y2 - y1 - tolerance
+    return cut
+
+
+def merge_boxes(boxes, scores, class_ids, tile_ids, cut, threshold=0.5):
+    """Объединяет рамки одного класса, разрезанные границей фрагментов.
+
+    Сливаются только рамки из разных фрагментов, хотя бы одна из которых
+    упирается во внутреннюю границу своего фрагмента (cut); tile_ids < 0 —
+    рамки прохода по всему кадру, они не сливаются. Сравнение идёт по IoS
+    (пересечение к площади меньшей рамки) с исходной рамкой, без цепочек:
+    соседние объекты вдоль шва не склеиваются в один.
+    """
+    order = scores.argsort()[::-1]
+    boxes = boxes[order]
+    scores = scores[order]
+    class_ids = class_ids[order]
+    tile_ids = tile_ids[order]
+    cut = cut[order]
+    used = np.zeros(len(boxes), dtype=bool)
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    merged_boxes, merged_scores, merged_ids = [], [], []
+    for i in range(len(boxes)):
+        if used[i]:
+            continue
+        used[i] = True
+        current = boxes[i]
+        if tile_ids[i] >= 0:
+            candidates = np.where(
+                ~used & (class_ids == class_ids[i]) & (tile_ids >= 0) & (tile_ids != tile_ids[i])
+                & (cut | cut[i])
+            )[0]
+            other = boxes[candidates]
+            xx1 = np.maximum(current[0], other[:, 0])
+            yy1 = np.maximum(current[1], other[:, 1])
+            xx2 = np.minimum(current[2], other[:, 2])
+            yy2 = np.minimum(current[3], other[:, 3])
+            inter = np.clip(xx2 - xx1, 0, None) * np.clip(yy2 - yy1, 0, None)
+            ios = inter / (np.minimum(areas[i], areas[candidates]) + 1e-9)
+            hits = candidates[ios >= threshold]
+            if len(hits):
+                used[hits] = True
+                group = np.vstack((current[None], boxes[hits]))
+                current = np.array(
+                    (group[:, 0].min(), group[:, 1].min(), group[:, 2].max(), group[:, 3].max())
+                )
+        merged_boxes.append(current)
+        merged_scores.append(scores[i])
+        merged_ids.append(class_ids[i])
+    if not merged_boxes:
+        return np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)
+    return np.array(merged_boxes), np.array(merged_scores), np.array(merged_ids)
+
+
+def _predict_batch(model, crops, conf, iou, device):
+    """Прогоняет пачку фрагментов; возвращает список (xyxy, score, class_id) по фрагментам"""
+    outputs = []
+    if hasattr(model, "run_scored"):
+        for crop in crops:
+            outputs.append(model.run_scored(crop, conf, iou))
+        return outputs
+    # ultralytics ожидает массивы numpy в порядке каналов BGR
+    sources = [np.asarray(crop.convert("RGB"))[:, :, ::-1] for crop in crops]
+    predict_kwargs = {"source": sources, "conf": conf, "iou": iou, "verbose": False}
+    if device:
+        predict_kwargs["device"] = device
+    for result in model.predict(**predict_kwargs):
+        boxes = getattr(result, "boxes", None)
+        if boxes is None or len(boxes) == 0:
+            outputs.append((np.zeros((0, 4)), np.zeros(0), np.zeros(0, dtype=np.int64)))
+            continue
+        outputs.append((
+            np.asarray(boxes.xyxy.tolist(), dtype=np.float64).reshape(-1, 4),
+            np.asarray(boxes.conf.tolist(), dtype=np.float64),
+            np.asarray(boxes.cls.tolist(), dtype=np.int64),
+        ))
+    return outputs
+
+
+def open_within_budget(image_path, max_pixels=MAX_TILED_PIXELS):
+    """Декодирует изображение в RGB так, чтобы в памяти было не больше max_pixels пикселей.
+
+    Большой JPEG декодируется сразу уменьшенным (draft), остальные форматы
+    сверх бюджета не открываются. Кадр больше предела PIL не открывается
+    вовсе. Возвращает (изображение, во сколько раз оно меньше исходного по
+    каждой оси); ошибки — ValueError.
+    """
+    try:
+        source = Image.open(image_path)
+    except Image.DecompressionBombError as exc:
+        raise ValueError(f"изображение слишком велико для поиска по фрагментам: {exc}") from exc
+    with source:
+        width, height = source.size
+        factor = next(
+            (f for f in JPEG_DRAFT_FACTORS if width * height <= max_pixels * f * f), None
+        )
+        if factor is None or (factor > 1 and source.format != "JPEG"):
+            raise ValueError(
+                f"{width}x{height} больше допустимых {max_pixels} пикселей для поиска по фрагментам"
+            )
+        if factor > 1:
+            source.draft("RGB", (math.ceil(width / factor), math.ceil(height / factor)))
+        source.load()
+        # Выход из with закрывает только файл, пиксели остаются; копия не нужна
+        image = source.convert("RGB") if source.mode != "RGB" else source
+    return image, (width / image.width, height / image.height)
+
+
+def predict_tiled(model, image_path, conf, iou, device=None, tile_size=640, overlap=0.2,
+                  batch_size=8, include_full=True, merge="merge", merge_threshold=0.5,
+                  max_pixels=MAX_TILED_PIXELS):
+    """Поиск объектов по фрагментам с объединением результатов.
+
+    PIL не умеет декодировать JPEG/PNG по областям, поэтому кадр декодируется
+    целиком один раз, а фрагменты вырезаются из него и отправляются в модель
+    пачками. Пиковая память: декодированный кадр — не больше max_pixels
+    пикселей по 3 байта (JPEG сверх бюджета декодируется в масштабе 1/2–1/8,
+    другие форматы и кадры больше предела PIL отклоняются с ValueError); при
+    include_full — его уменьшенная копия для прохода по всему кадру (длинная
+    сторона не больше 4 * tile_size), чтобы не потерять крупные объекты;
+    плюс batch_size фрагментов и их копии в модели. merge="nms" подавляет
+    пересекающиеся рамки, merge="merge" дополнительно сливает части объектов,
+    разрезанных границей фрагментов.
+    Возвращает (координаты xyxy, номера классов) в системе исходного изображения.
+    """
+    image, (scale_x, scale_y) = open_within_budget(image_path, max_pixels)
+    width, height = image.size
+    tiles = tile_grid(width, height, tile_size, overlap)
+
+    all_boxes, all_scores, all_ids, all_tiles, all_cut = [], [], [], [], []
+
+    def collect(boxes, scores, class_ids, tile_index, cut, dx, dy, scale=1):
+        if len(boxes):
+            shifted = boxes.astype(np.float64) * scale
+            shifted[:, [0, 2]] += dx
+            shifted[:, [1, 3]] += dy
+            all_boxes.append(shifted)
+            all_scores.append(scores)
+            all_ids.append(class_ids)
+            all_tiles.append(np.full(len(boxes), tile_index))
+            all_cut.append(cut)
+
+    if include_full and len(tiles) > 1:
+        # Модель всё равно уменьшает кадр до своего размера входа: полноразмерная копия не нужна
+        factor = max(1, max(width, height) // (tile_size * 2))
+        full = image.reduce(factor) if factor > 1 else image
+        (boxes, scores, class_ids), = _predict_batch(model, [full], conf, iou, device)
+        collect(boxes, scores, class_ids, -1, np.zeros(len(boxes), dtype=bool), 0, 0, width / full.width)
+        del full
+
+    for offset, (boxes_batch, crops) in zip(
+        range(0, len(tiles), batch_size), iter_tile_batches(image, tiles, batch_size)
+    ):
+        outputs = _predict_batch(model, crops, conf, iou, device)
+        for tile_index, (tile, (boxes, scores, class_ids)) in enumerate(zip(boxes_batch, outputs), offset):
+            cut = seam_cut(np.asarray(boxes, dtype=np.float64).reshape(-1, 4), tile, width, height)
+            collect(boxes, scores, class_ids, tile_index, cut, tile[0], tile[1])
+        del crops
+
+    if not all_boxes:
+        return [], []
+    boxes = np.concatenate(all_boxes)
+    scores = np.concatenate(all_scores)
+    class_ids = np.concatenate(all_ids)
+    keep = batched_nms(boxes, scores, class_ids, iou)
+    boxes, class_ids = boxes[keep], class_ids[keep]
+    if merge != "nms":
+        boxes, _, class_ids = merge_boxes(
+            boxes, scores[keep], class_ids, np.concatenate(all_tiles)[keep], np.concatenate(all_cut)[keep],
+            merge_threshold,
+        )
+    boxes[:, [0, 2]] = np.clip(boxes[:, [0, 2]], 0, width) * scale_x
+    boxes[:, [1, 3]] = np.clip(boxes[:, [1, 3]], 0, height) * scale_y
+    return boxes.tolist(), class_ids.astype(int).tolist()